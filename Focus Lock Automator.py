@@ -1,439 +1,3589 @@
-import time
-import pyautogui
-import pygetwindow as gw
-import random
-import win32gui
-import threading
-import tkinter as tk
-from tkinter import ttk, messagebox
-import configparser
-import os
-
-# --- GLOBAL SETTINGS ---
-PROFILES_FILE = 'automator_profiles.ini'
-MIN_MOVE = 5; MAX_MOVE = 15; pyautogui.FAILSAFE = False 
-FAST_PAUSE = 0.05
-LONG_PRESS_DURATION = 0.5 
-
-class AfkGuiApp:
-    def __init__(self, master):
-        self.master = master
-        master.title("Focus-Lock Automator v6.0")
-        master.resizable(False, False)
-
-        # State & Config Variables
-        self.is_running = False
-        self.is_paused = False
-        self.afk_thread = None
-        self.config = configparser.ConfigParser() # For profiles only
-        
-        # Configuration Variables (Defaults are non-persistent)
-        self.target_window_title = tk.StringVar(value="")
-        self.min_delay_var = tk.DoubleVar(value=10.0)
-        self.max_delay_var = tk.DoubleVar(value=120.0)
-        self.long_press_weight_var = tk.IntVar(value=60)
-        self.mouse_action_enabled = tk.BooleanVar(value=True) # Jiggle & Left Click
-        self.right_click_enabled = tk.BooleanVar(value=False)
-        self.scroll_enabled = tk.BooleanVar(value=False)
-        self.long_press_keys = tk.StringVar(value="q, e, shift") 
-        self.tap_keys = tk.StringVar(value="i, o, enter, F1") 
-        self.profile_name_var = tk.StringVar(value="New Profile")
-        
-        self._create_widgets()
-        master.protocol("WM_DELETE_WINDOW", self.on_closing)
-
-    # --- PROFILE MANAGEMENT ---
-
-    def save_profile(self):
-        """Saves current GUI settings to a named profile in the INI file."""
-        profile_name = self.profile_name_var.get().strip()
-        if not profile_name:
-            messagebox.showerror("Error", "Please enter a valid profile name.")
-            return
-
-        self.config.read(PROFILES_FILE)
-        
-        # Save all current settings to the profile section
-        self.config[profile_name] = {
-            'target_window': self.target_window_title.get(),
-            'min_delay': str(self.min_delay_var.get()),
-            'max_delay': str(self.max_delay_var.get()),
-            'long_press_weight': str(self.long_press_weight_var.get()),
-            'mouse_action_enabled': str(self.mouse_action_enabled.get()),
-            'right_click_enabled': str(self.right_click_enabled.get()),
-            'scroll_enabled': str(self.scroll_enabled.get()),
-            'long_press_keys': self.long_press_keys.get(),
-            'tap_keys': self.tap_keys.get()
-        }
-        
-        try:
-            with open(PROFILES_FILE, 'w') as configfile:
-                self.config.write(configfile)
-            self.log_message(f"Profile '{profile_name}' saved successfully.")
-        except Exception as e:
-            self.log_message(f"ERROR: Could not save profile: {e}")
-
-    def load_profile(self):
-        """Loads settings from a named profile into the GUI."""
-        self.config.read(PROFILES_FILE)
-        profile_name = self.profile_name_var.get().strip()
-        
-        if profile_name in self.config:
-            s = self.config[profile_name]
-            
-            self.target_window_title.set(s.get('target_window', self.target_window_title.get()))
-            self.min_delay_var.set(s.getfloat('min_delay', self.min_delay_var.get()))
-            self.max_delay_var.set(s.getfloat('max_delay', self.max_delay_var.get()))
-            self.long_press_weight_var.set(s.getint('long_press_weight', self.long_press_weight_var.get()))
-            self.mouse_action_enabled.set(s.getboolean('mouse_action_enabled', self.mouse_action_enabled.get()))
-            self.right_click_enabled.set(s.getboolean('right_click_enabled', self.right_click_enabled.get()))
-            self.scroll_enabled.set(s.getboolean('scroll_enabled', self.scroll_enabled.get()))
-            self.long_press_keys.set(s.get('long_press_keys', self.long_press_keys.get()))
-            self.tap_keys.set(s.get('tap_keys', self.tap_keys.get()))
-            
-            self.log_message(f"Profile '{profile_name}' loaded.")
-            self.refresh_windows() # Ensure window list is current
-        else:
-            messagebox.showerror("Error", f"Profile '{profile_name}' not found.")
-
-    # --- GUI CONSTRUCTION ---
-
-    def _create_widgets(self):
-        
-        main_frame = ttk.Frame(self.master, padding="10")
-        main_frame.grid(row=0, column=0, sticky=(tk.W, tk.E, tk.N, tk.S))
-
-        # --- Frame 1: Window Selection ---
-        window_frame = ttk.LabelFrame(main_frame, text="1. Target Application")
-        window_frame.grid(row=0, column=0, columnspan=2, pady=5, sticky="ew")
-
-        ttk.Label(window_frame, text="Select Window:").grid(row=0, column=0, padx=5, pady=5, sticky="w")
-        self.window_selector = ttk.Combobox(window_frame, textvariable=self.target_window_title, width=35, state='readonly')
-        self.window_selector.grid(row=0, column=1, padx=5, pady=5, sticky="ew")
-        
-        self.refresh_button = ttk.Button(window_frame, text="Refresh", command=self.refresh_windows)
-        self.refresh_button.grid(row=0, column=2, padx=5, pady=5)
-        self.refresh_windows()
-
-        # --- Notebook (Tabs) ---
-        self.notebook = ttk.Notebook(main_frame)
-        self.notebook.grid(row=1, column=0, columnspan=2, pady=5, sticky="ew")
-
-        # Create Tab Frames
-        self.fast_tab = ttk.Frame(self.notebook, padding="5")
-        self.custom_tab = ttk.Frame(self.notebook, padding="5")
-
-        self.notebook.add(self.fast_tab, text='🚀 Fast Mode')
-        self.notebook.add(self.custom_tab, text='⚙️ Custom Mode')
-
-        self._build_fast_tab()
-        self._build_custom_tab()
-        self._build_control_widgets(main_frame)
-
-    def _build_fast_tab(self):
-        # A simple, quick click mode (Fastest Execution)
-        ttk.Label(self.fast_tab, text="Mode: Optimized for minimal interruption. Performs a single, fast Jiggle+Click every interval.", wraplength=400).grid(row=0, column=0, columnspan=3, pady=5, sticky="w")
-        
-        ttk.Label(self.fast_tab, text="Min Delay (s):").grid(row=1, column=0, padx=5, pady=5, sticky="w")
-        ttk.Entry(self.fast_tab, textvariable=self.min_delay_var, width=10).grid(row=1, column=1, padx=5, pady=5)
-
-        ttk.Label(self.fast_tab, text="Max Delay (s):").grid(row=2, column=0, padx=5, pady=5, sticky="w")
-        ttk.Entry(self.fast_tab, textvariable=self.max_delay_var, width=10).grid(row=2, column=1, padx=5, pady=5)
-
-    def _build_custom_tab(self):
-        # --- Custom Actions ---
-        action_frame = ttk.LabelFrame(self.custom_tab, text="Custom Actions (Comma separated list)")
-        action_frame.grid(row=0, column=0, columnspan=2, pady=5, sticky="ew")
-        
-        # Mouse Actions
-        ttk.Label(action_frame, text="Mouse Actions:").grid(row=0, column=0, padx=5, pady=5, sticky="w")
-        ttk.Checkbutton(action_frame, text="Jiggle & LClick", variable=self.mouse_action_enabled).grid(row=0, column=1, padx=5, pady=5, sticky="w")
-        ttk.Checkbutton(action_frame, text="Right Click", variable=self.right_click_enabled).grid(row=0, column=2, padx=5, pady=5, sticky="w")
-        ttk.Checkbutton(action_frame, text="Scroll", variable=self.scroll_enabled).grid(row=0, column=3, padx=5, pady=5, sticky="w")
-        
-        # Key Actions
-        ttk.Label(action_frame, text="Long Press:").grid(row=1, column=0, padx=5, pady=5, sticky="w")
-        ttk.Entry(action_frame, textvariable=self.long_press_keys, width=50).grid(row=1, column=1, columnspan=3, padx=5, pady=5, sticky="ew")
-
-        ttk.Label(action_frame, text="Tap Press:").grid(row=2, column=0, padx=5, pady=5, sticky="w")
-        ttk.Entry(action_frame, textvariable=self.tap_keys, width=50).grid(row=2, column=1, columnspan=3, padx=5, pady=5, sticky="ew")
-        
-        # --- Timing & Priority ---
-        settings_frame = ttk.LabelFrame(self.custom_tab, text="Timing & Priority")
-        settings_frame.grid(row=1, column=0, pady=5, sticky="nw")
-
-        ttk.Label(settings_frame, text="Min Delay (s):").grid(row=0, column=0, padx=5, pady=5, sticky="w")
-        ttk.Entry(settings_frame, textvariable=self.min_delay_var, width=10).grid(row=0, column=1, padx=5, pady=5)
-
-        ttk.Label(settings_frame, text="Max Delay (s):").grid(row=1, column=0, padx=5, pady=5, sticky="w")
-        ttk.Entry(settings_frame, textvariable=self.max_delay_var, width=10).grid(row=1, column=1, padx=5, pady=5)
-        
-        ttk.Label(settings_frame, text="Long Press Priority (%):").grid(row=2, column=0, padx=5, pady=5, sticky="w")
-        ttk.Scale(settings_frame, from_=0, to=100, variable=self.long_press_weight_var, orient=tk.HORIZONTAL, length=100).grid(row=2, column=1, padx=5, pady=5)
-        ttk.Label(settings_frame, textvariable=self.long_press_weight_var).grid(row=2, column=2, padx=5, pady=5)
-
-    def _build_control_widgets(self, main_frame):
-        # --- Profile Management (Row 2, Column 0) ---
-        profile_frame = ttk.LabelFrame(main_frame, text="2. Profiles")
-        profile_frame.grid(row=2, column=0, pady=5, padx=5, sticky="ew")
-        
-        ttk.Label(profile_frame, text="Name:").grid(row=0, column=0, padx=5, pady=5, sticky="w")
-        ttk.Entry(profile_frame, textvariable=self.profile_name_var, width=15).grid(row=0, column=1, padx=5, pady=5)
-        ttk.Button(profile_frame, text="Save", command=self.save_profile).grid(row=0, column=2, padx=5, pady=5)
-        ttk.Button(profile_frame, text="Load", command=self.load_profile).grid(row=0, column=3, padx=5, pady=5)
-
-        # --- Control & Status (Row 2, Column 1) ---
-        control_frame = ttk.LabelFrame(main_frame, text="3. Control & Status")
-        control_frame.grid(row=2, column=1, pady=5, sticky="ne")
-        
-        self.status_label = ttk.Label(control_frame, text="Status: Stopped", font=('Arial', 10, 'bold'))
-        self.status_label.grid(row=0, column=0, columnspan=3, pady=5)
-
-        self.start_button = ttk.Button(control_frame, text="Start", command=self.start_afk, style='Accent.TButton')
-        self.start_button.grid(row=1, column=0, padx=5, pady=5)
-        
-        self.pause_button = ttk.Button(control_frame, text="Pause", command=self.pause_afk, state=tk.DISABLED)
-        self.pause_button.grid(row=1, column=1, padx=5, pady=5)
-        
-        self.stop_button = ttk.Button(control_frame, text="Stop", command=self.stop_afk, state=tk.DISABLED)
-        self.stop_button.grid(row=1, column=2, padx=5, pady=5)
-
-        # --- Logger (Row 3) ---
-        log_frame = ttk.LabelFrame(main_frame, text="Activity Log")
-        log_frame.grid(row=3, column=0, columnspan=2, pady=5, sticky="ew")
-
-        self.log_text = tk.Text(log_frame, height=5, state=tk.DISABLED, wrap='word', bg='#f0f0f0', borderwidth=1, relief="sunken")
-        self.log_text.grid(row=0, column=0, sticky="nsew")
-
-        # Style
-        style = ttk.Style()
-        style.theme_use('clam')
-        style.configure('Accent.TButton', foreground='white', background='#32CD32', borderwidth=0, relief='flat')
-        style.map('Accent.TButton', background=[('active', '#228B22')])
-
-    # --- ACTION LOGIC ---
-
-    def log_message(self, message, is_warning=False):
-        """Appends a timestamped message to the GUI log."""
-        current_time = time.strftime("[%H:%M:%S]")
-        log_message = f"{current_time} {message}\n"
-        
-        self.log_text.config(state=tk.NORMAL)
-        self.log_text.insert(tk.END, log_message)
-        self.log_text.see(tk.END)
-        self.log_text.config(state=tk.DISABLED)
-
-    def find_target_window(self):
-        """Finds the window object."""
-        title = self.target_window_title.get()
-        if not title: return None
-        try:
-            windows = gw.getWindowsWithTitle(title)
-            return windows[0] if windows else None
-        except Exception:
-            return None
-        
-    def focus_target_window(self, target_window, previous_hwnd):
-        """CRITICAL FOCUS FUNCTION: Ensures the target window is active."""
-        if target_window.isMinimized:
-            target_window.restore()
-            time.sleep(0.1) # Time to draw window
-
-        win32gui.SetForegroundWindow(target_window._hWnd)
-        time.sleep(0.1) # Guaranteed focus wait
-        
-        # Setup mouse position for input
-        center_x = target_window.left + target_window.width // 2
-        center_y = target_window.top + target_window.height // 2
-        
-        return center_x, center_y
-
-    def execute_fast_action(self):
-        """Optimized for extreme speed and minimal interruption."""
-        previous_hwnd = win32gui.GetForegroundWindow()
-        original_mouse_x, original_mouse_y = pyautogui.position() 
-        target_window = self.find_target_window()
-        
-        if target_window is None:
-            self.update_status("Waiting for Target...")
-            return
-
-        try:
-            center_x, center_y = self.focus_target_window(target_window, previous_hwnd)
-
-            # --- FAST ACTION: Minimal Jiggle & Click ---
-            pyautogui.moveTo(center_x, center_y, duration=0.0) 
-            pyautogui.move(random.randint(MIN_MOVE, MAX_MOVE) * random.choice([1, -1]),
-                           random.randint(MIN_MOVE, MAX_MOVE) * random.choice([1, -1]), duration=0.0)
-            pyautogui.click() 
-            
-            # Revert focus
-            pyautogui.moveTo(original_mouse_x, original_mouse_y, duration=0.0) 
-            win32gui.SetForegroundWindow(previous_hwnd)
-            self.log_message(f"EXECUTED: 🚀 Fast Jiggle+Click.")
-
-        except Exception:
-            win32gui.SetForegroundWindow(previous_hwnd)
-            self.log_message(f"WARNING: Fast action failed.", is_warning=True)
-
-    def execute_custom_action(self):
-        """The full, weighted, multi-input action sequence."""
-        previous_hwnd = win32gui.GetForegroundWindow()
-        original_mouse_x, original_mouse_y = pyautogui.position() 
-        target_window = self.find_target_window()
-        
-        if target_window is None:
-            self.update_status("Waiting for Target...")
-            return
-
-        action_log = []
-        
-        try:
-            center_x, center_y = self.focus_target_window(target_window, previous_hwnd)
-            
-            # Parse settings for this cycle
-            long_keys = self.parse_keys(self.long_press_keys.get())
-            tap_keys = self.parse_keys(self.tap_keys.get())
-            
-            # Calculate dynamic weights
-            weights = self._calculate_weights(long_keys, tap_keys)
-            
-            # --- MOUSE JIGGLE (If enabled) ---
-            if self.mouse_action_enabled.get():
-                pyautogui.moveTo(center_x, center_y, duration=0.0) 
-                pyautogui.move(random.randint(MIN_MOVE, MAX_MOVE) * random.choice([1, -1]),
-                               random.randint(MIN_MOVE, MAX_MOVE) * random.choice([1, -1]), duration=0.0)
-                pyautogui.click() 
-                action_log.append("Jiggle+LClick")
-            
-            # --- WEIGHTED ACTION ---
-            if weights:
-                chosen_action_type = random.choices(list(weights.keys()), weights=list(weights.values()), k=1)[0]
-                
-                if chosen_action_type == 'long_press':
-                    action_key = random.choice(long_keys)
-                    pyautogui.keyDown(action_key); time.sleep(LONG_PRESS_DURATION); pyautogui.keyUp(action_key)
-                    action_log.append(f"Long Press: {action_key.upper()}")
-                    
-                elif chosen_action_type == 'tap_press':
-                    action_key = random.choice(tap_keys)
-                    pyautogui.press(action_key)
-                    action_log.append(f"Tap: {action_key.upper()}")
-                
-                elif chosen_action_type == 'right_click' and self.right_click_enabled.get():
-                    pyautogui.rightClick(center_x, center_y, duration=0.0)
-                    action_log.append("Right Click")
-                    
-                elif chosen_action_type == 'scroll' and self.scroll_enabled.get():
-                    scroll_amount = random.choice([-5, 5]) 
-                    pyautogui.scroll(scroll_amount)
-                    action_log.append(f"Scroll: {'Up' if scroll_amount > 0 else 'Down'}")
-
-            # Revert focus
-            pyautogui.moveTo(original_mouse_x, original_mouse_y, duration=0.0) 
-            win32gui.SetForegroundWindow(previous_hwnd)
-            
-            self.log_message(f"EXECUTED: {', '.join(action_log) if action_log else 'Mouse Jiggle Only'}")
-            
-        except Exception:
-            win32gui.SetForegroundWindow(previous_hwnd)
-            self.log_message(f"CRITICAL ERROR: Action failed. Reverting focus.", is_warning=True)
-
-    def _calculate_weights(self, long_keys, tap_keys):
-        """Calculates the proportional weights for the Custom Mode."""
-        weights = {}
-        long_weight = self.long_press_weight_var.get()
-        
-        if long_keys: weights['long_press'] = long_weight
-        
-        remaining_weight = 100 - weights.get('long_press', 0)
-        
-        other_actions = []
-        if tap_keys: other_actions.append('tap_press')
-        if self.right_click_enabled.get(): other_actions.append('right_click')
-        if self.scroll_enabled.get(): other_actions.append('scroll')
-
-        num_other = len(other_actions)
-        if num_other > 0:
-            weight_per_other = remaining_weight / num_other
-            for action in other_actions:
-                weights[action] = weight_per_other
-        
-        return weights
-
-    # --- CONTROL FLOW ---
-
-    def afk_loop(self):
-        """The main threaded loop that controls the timing."""
-        
-        current_tab_index = self.notebook.index(self.notebook.select())
-        is_fast_mode = (current_tab_index == 0)
-
-        while self.is_running:
-            if not self.is_paused:
-                self.update_status("Running")
-                
-                if is_fast_mode:
-                    self.execute_fast_action()
-                else:
-                    self.execute_custom_action()
-                
-                wait_time = random.uniform(self.min_delay_var.get(), self.max_delay_var.get())
-                self.log_message(f"Next action in: {wait_time:.2f} seconds.")
-                time.sleep(wait_time)
-            else:
-                time.sleep(1) 
-        
-        self.update_status("Stopped")
-
-    def start_afk(self):
-        """Starts the AFK process."""
-        if not self.target_window_title.get():
-            messagebox.showerror("Error", "Please select a target application window.")
-            return
-
-        if not self.is_running:
-            self.is_running = True
-            self.is_paused = False
-            self.afk_thread = threading.Thread(target=self.afk_loop, daemon=True)
-            self.afk_thread.start()
-            self.log_message("Tool STARTED. Active Mode: " + self.notebook.tab(self.notebook.select(), "text"))
-        elif self.is_paused:
-            self.is_paused = False
-            self.log_message("Tool RESUMED.")
-            
-        self.update_status("Running")
-
-    def pause_afk(self):
-        self.is_paused = True
-        self.log_message("Tool PAUSED.")
-        self.update_status("Paused")
-
-    def stop_afk(self):
-        if self.is_running:
-            self.is_running = False
-            self.is_paused = False
-            self.log_message("Tool STOPPED.")
-            
-    def on_closing(self):
-        """Handles the window being closed."""
-        if self.is_running:
-            self.stop_afk()
-            time.sleep(0.1) 
-        self.master.destroy()
-
-    def refresh_windows(self):
-        """Fetches and populates the list of all unique, non-empty window titles."""
-        all_titles = gw.getAllTitles()
-        valid_titles = sorted(list(set(title for title in all_titles if title)))
-        self.window_selector['values'] = valid_titles
-        
-        current_title = self.target_window_title.get()
-        if current_title not in valid_titles and valid_titles:
-             self.target_window_title.set(valid_titles[0])
-
-
-if __name__ == '__main__':
-    root = tk.Tk()
-    app = AfkGuiApp(root)
-    root.mainloop()
\ No newline at end of file
+import time
+_MODULE_STARTED = time.perf_counter() # Reference point for the startup benchmark
+import random
+import threading
+import ctypes
+from ctypes import wintypes
+import configparser
+import argparse
+import os
+import bisect
+import contextlib
+import heapq
+import json
+import mmap
+import queue
+import sqlite3
+import struct
+import re
+import signal
+import sys
+import logging
+from array import array
+from itertools import accumulate
+from collections import namedtuple, deque, Counter
+
+# Loaded on first use by _load_win32() and run_gui(), so headless and simulated runs start fast
+pyautogui = gw = win32gui = win32api = win32process = None
+tk = ttk = messagebox = None
+
+# --- GLOBAL SETTINGS ---
+PROFILES_FILE = 'automator_profiles.ini' # Legacy format; imported into PROFILES_DB on first run
+PROFILES_DB = 'automator_profiles.db'
+LOG_FILE = 'automator_log.jsonl'
+LOG_FILE_MAX_BYTES = 5 * 1024 * 1024; LOG_FILE_BACKUPS = 3
+LOG_MAX_LINES = 500 # Ring buffer size of the on-screen log
+LOG_DRAIN_INTERVAL_MS = 100
+LOG_DRAIN_BATCH = 500
+SCHEDULER_HISTORY = 1000 # Fire-jitter samples kept for stats
+SHUTDOWN_JOIN_TIMEOUT = 2.0 # Longest a stop waits for an in-flight cycle
+WORKER_STAT_FIELDS = ('pid', 'state', 'heartbeat', 'cycle_started', 'cycle_limit', 'episodes', 'focus_stolen_s_per_h',
+                      'lock_wait_p50_ms', 'lock_wait_max_ms', 'deferrals', 'warnings') # One row of doubles per worker
+WORKER_STATES = ('starting', 'running', 'paused', 'stopped', 'failed')
+WORKER_STALE_AFTER = 5.0 # Seconds without a heartbeat before a live worker shows as unresponsive
+WORKER_STUCK_AFTER = 30.0 # Seconds one cycle may run (plus any macro's length) before the worker shows as stuck
+WORKER_HEALTH_INTERVAL = 60.0 # Headless: seconds between worker health lines
+CYCLE_MODES = ('fast', 'custom')
+MULTI_BATCH_WINDOW = 2.0 # Targets due this close to the first one share its focus steal
+METRICS_FORMATS = ('off', 'jsonl', 'prometheus')
+METRICS_FILE = 'automator_metrics.jsonl'; METRICS_PROM_FILE = 'automator_metrics.prom'
+METRICS_EXPORT_INTERVAL = 60.0
+HISTOGRAM_BOUNDS = tuple(1e-5 * 2 ** (i / 2) for i in range(48)) # 10 us .. ~120 s, sqrt(2) apart
+PROFILE_CYCLES = 50
+PROFILE_DUMP_FILE = 'automator_cycles.prof'
+MIN_MOVE = 5; MAX_MOVE = 15
+FAST_PAUSE = 0.05
+LONG_PRESS_DURATION = 0.5 
+BENCH_CYCLES = 5000
+BENCH_BACKGROUND_WINDOWS = 300
+SIM_HOURS = 12.0
+SIM_OPERATOR_SPELL = 90.0 # Mean seconds of one simulated burst of operator input
+SIM_FOCUS_LATENCY = 0.004 # Simulated time for a foreground change to land
+STARTUP_BENCH_RUNS = 10
+STARTUP_BENCH_FILE = 'startup_bench.jsonl' # One line per --bench-startup run, to track regressions
+TARGET_LOCK_MODES = ('title', 'handle', 'process', 'class')
+WINDOW_SEARCH_MODES = ('substring', 'regex', 'fuzzy')
+WINDOW_SCAN_POLL_MS = 50
+PROCESS_QUERY_INFORMATION = 0x0400; PROCESS_VM_READ = 0x0010
+SETTLE_MODES = ('adaptive', 'fixed')
+FOCUS_SETTLE_WAIT = 0.1 # Legacy fixed wait after restore() and SetForegroundWindow
+SETTLE_POLL_INTERVAL = 0.002
+SETTLE_MIN_DEADLINE = 0.02
+SETTLE_HISTORY = 200
+MINIMIZED_COORD = -32000 # Windows parks minimized windows here
+MACRO_MAGIC = b'FLM1'
+MACRO_HEADER = struct.Struct('<4sHHIIII') # magic, version, key count, event count, window width, height, reserved
+MACRO_KINDS = ('move_to', 'left_down', 'left_up', 'right_down', 'right_up', 'scroll', 'key_down', 'key_up')
+MACRO_DEFAULT_FILE = 'macro.flm'
+CONDITION_MODES = ('skip_unchanged', 'wait_match', 'act_if_match')
+CONDITION_SCOPES = ('cycle', 'jiggle_click', 'long_press', 'tap_press', 'right_click', 'scroll', 'macro')
+CONDITION_MAX_DISTANCE = 6 # Differing dHash bits (of 64) still counted as the same picture
+CONDITION_POLL_INTERVAL = 0.02 # Between grabs while waiting for a match
+IDLE_INJECTION_SLACK = 0.05 # Input landing this soon after a cycle is taken to be the tool's own
+IDLE_MIN_HOLD = 0.01 # Shortest wait while holding a cycle back; smaller steps can vanish in a large clock value
+JIGGLE_STEPS = tuple(step * sign for step in range(MIN_MOVE, MAX_MOVE + 1) for sign in (1, -1))
+SCROLL_STEPS = (-5, 5)
+# Key names the fake backend accepts besides single characters (a subset of pyautogui.KEYBOARD_KEYS)
+COMMON_KEY_NAMES = frozenset(
+    ['enter', 'return', 'tab', 'space', 'esc', 'escape', 'backspace', 'delete', 'insert', 'home', 'end',
+     'pageup', 'pagedown', 'up', 'down', 'left', 'right', 'shift', 'shiftleft', 'shiftright', 'ctrl',
+     'ctrlleft', 'ctrlright', 'alt', 'altleft', 'altright', 'win', 'winleft', 'winright', 'capslock',
+     'numlock', 'scrolllock', 'printscreen', 'pause']
+    + [f'f{n}' for n in range(1, 25)] + [f'num{n}' for n in range(10)])
+
+# Defaults shared by the GUI and headless callers, keyed like the profile INI.
+DEFAULT_PROFILE = {
+    'target_window': "",
+    'lock_mode': 'title',
+    'settle_mode': 'adaptive',
+    'settle_deadline': 0.25,
+    'min_delay': 10.0,
+    'max_delay': 120.0,
+    'long_press_weight': 60,
+    'mouse_action_enabled': True,
+    'right_click_enabled': False,
+    'scroll_enabled': False,
+    'long_press_keys': "q, e, shift",
+    'tap_keys': "i, o, enter, F1",
+    'macro_file': "",
+    'macro_weight': 0,
+    'macro_speed': 1.0,
+    'macro_jitter': 0.0,
+    'screen_conditions': "",
+    'condition_budget': 0.1,
+    'idle_threshold': 0.0,
+    'idle_max_defer': 60.0,
+}
+
+# --- INPUT BATCHING ---
+
+InputEvent = namedtuple('InputEvent', 'kind a b delay') # delay: seconds to hold before the next event
+
+
+class InputBatch:
+    """One cycle's input, built up front and sent with a single backend call.
+
+    Waits between events are explicit (e.g. the long-press hold), so no library adds
+    its own pause after every call. Backends iterate the batch, so a stream()ed run
+    of events (macro playback) is produced lazily while the batch is being sent.
+    """
+
+    __slots__ = ('events',)
+
+    def __init__(self):
+        self.events = []
+
+    def _add(self, kind, a=None, b=None, delay=0.0):
+        self.events.append(InputEvent(kind, a, b, delay))
+        return self
+
+    def move_to(self, x, y): return self._add('move_to', x, y)
+    def move_rel(self, dx, dy): return self._add('move_rel', dx, dy)
+    def scroll(self, amount): return self._add('scroll', amount)
+    def key_down(self, key, hold=0.0): return self._add('key_down', key, delay=hold)
+    def key_up(self, key): return self._add('key_up', key)
+
+    def click(self):
+        return self._add('left_down')._add('left_up')
+
+    def right_click(self, x, y):
+        return self.move_to(x, y)._add('right_down')._add('right_up')
+
+    def press(self, key):
+        return self.key_down(key).key_up(key)
+
+    def hold(self, key, duration):
+        return self.key_down(key, hold=duration).key_up(key)
+
+    def stream(self, events):
+        """Splices in an iterable of InputEvents that is only consumed when the batch is sent."""
+        self.events.append(events)
+        return self
+
+    def __iter__(self):
+        for item in self.events:
+            if isinstance(item, InputEvent): yield item
+            else: yield from item
+
+    def __len__(self):
+        return len(self.events)
+
+
+# Win32 SendInput structures
+_ULONG_PTR = ctypes.c_size_t
+
+class _MOUSEINPUT(ctypes.Structure):
+    _fields_ = [('dx', wintypes.LONG), ('dy', wintypes.LONG), ('mouseData', wintypes.DWORD),
+                ('dwFlags', wintypes.DWORD), ('time', wintypes.DWORD), ('dwExtraInfo', _ULONG_PTR)]
+
+class _KEYBDINPUT(ctypes.Structure):
+    _fields_ = [('wVk', wintypes.WORD), ('wScan', wintypes.WORD), ('dwFlags', wintypes.DWORD),
+                ('time', wintypes.DWORD), ('dwExtraInfo', _ULONG_PTR)]
+
+class _HARDWAREINPUT(ctypes.Structure):
+    _fields_ = [('uMsg', wintypes.DWORD), ('wParamL', wintypes.WORD), ('wParamH', wintypes.WORD)]
+
+class _INPUTUNION(ctypes.Union):
+    _fields_ = [('mi', _MOUSEINPUT), ('ki', _KEYBDINPUT), ('hi', _HARDWAREINPUT)]
+
+class _INPUT(ctypes.Structure):
+    _fields_ = [('type', wintypes.DWORD), ('u', _INPUTUNION)]
+
+INPUT_MOUSE = 0; INPUT_KEYBOARD = 1
+MOUSEEVENTF_MOVE = 0x0001; MOUSEEVENTF_ABSOLUTE = 0x8000; MOUSEEVENTF_VIRTUALDESK = 0x4000
+MOUSEEVENTF_LEFTDOWN = 0x0002; MOUSEEVENTF_LEFTUP = 0x0004
+MOUSEEVENTF_RIGHTDOWN = 0x0008; MOUSEEVENTF_RIGHTUP = 0x0010; MOUSEEVENTF_WHEEL = 0x0800
+KEYEVENTF_KEYUP = 0x0002
+VK_SHIFT = 0x10; VK_CONTROL = 0x11; VK_MENU = 0x12
+MAPVK_VK_TO_CHAR = 2
+# pyautogui's key names -> virtual-key codes; single characters go through VkKeyScan instead.
+# Where names share a code, a recording writes the first one.
+NAMED_KEY_CODES = dict(
+    [('backspace', 0x08), ('tab', 0x09), ('clear', 0x0C), ('enter', 0x0D), ('return', 0x0D), ('shift', 0x10),
+     ('ctrl', 0x11), ('alt', 0x12), ('pause', 0x13), ('capslock', 0x14), ('esc', 0x1B), ('escape', 0x1B),
+     ('space', 0x20), ('pageup', 0x21), ('pgup', 0x21), ('pagedown', 0x22), ('pgdn', 0x22), ('end', 0x23),
+     ('home', 0x24), ('left', 0x25), ('up', 0x26), ('right', 0x27), ('down', 0x28), ('select', 0x29),
+     ('print', 0x2A), ('execute', 0x2B), ('printscreen', 0x2C), ('prtsc', 0x2C), ('prtscr', 0x2C),
+     ('prntscrn', 0x2C), ('insert', 0x2D), ('delete', 0x2E), ('del', 0x2E), ('help', 0x2F), ('win', 0x5B),
+     ('winleft', 0x5B), ('winright', 0x5C), ('apps', 0x5D), ('sleep', 0x5F), ('multiply', 0x6A), ('add', 0x6B),
+     ('separator', 0x6C), ('subtract', 0x6D), ('decimal', 0x6E), ('divide', 0x6F), ('numlock', 0x90),
+     ('scrolllock', 0x91), ('shiftleft', 0xA0), ('shiftright', 0xA1), ('ctrlleft', 0xA2), ('ctrlright', 0xA3),
+     ('altleft', 0xA4), ('altright', 0xA5), ('browserback', 0xA6), ('browserforward', 0xA7),
+     ('browserrefresh', 0xA8), ('browserstop', 0xA9), ('browsersearch', 0xAA), ('browserfavorites', 0xAB),
+     ('browserhome', 0xAC), ('volumemute', 0xAD), ('volumedown', 0xAE), ('volumeup', 0xAF), ('nexttrack', 0xB0),
+     ('prevtrack', 0xB1), ('stop', 0xB2), ('playpause', 0xB3), ('launchmail', 0xB4), ('launchmediaselect', 0xB5),
+     ('launchapp1', 0xB6), ('launchapp2', 0xB7)]
+    + [(f'num{n}', 0x60 + n) for n in range(10)] + [(f'f{n}', 0x6F + n) for n in range(1, 25)])
+# Keys a recording names by the character the keyboard layout types: digits, letters, OEM punctuation
+CHARACTER_VKS = tuple(range(0x30, 0x3A)) + tuple(range(0x41, 0x5B)) + tuple(range(0xBA, 0xC1)) \
+    + tuple(range(0xDB, 0xE0)) + (0xE2,)
+SM_XVIRTUALSCREEN, SM_YVIRTUALSCREEN, SM_CXVIRTUALSCREEN, SM_CYVIRTUALSCREEN = 76, 77, 78, 79
+SRCCOPY = 0x00CC0020
+MOUSE_BUTTON_FLAGS = {'left_down': MOUSEEVENTF_LEFTDOWN, 'left_up': MOUSEEVENTF_LEFTUP,
+                      'right_down': MOUSEEVENTF_RIGHTDOWN, 'right_up': MOUSEEVENTF_RIGHTUP}
+
+# Low-level input hooks, for macro recording
+class _KBDLLHOOKSTRUCT(ctypes.Structure):
+    _fields_ = [('vkCode', wintypes.DWORD), ('scanCode', wintypes.DWORD), ('flags', wintypes.DWORD),
+                ('time', wintypes.DWORD), ('dwExtraInfo', _ULONG_PTR)]
+
+class _MSLLHOOKSTRUCT(ctypes.Structure):
+    _fields_ = [('pt', wintypes.POINT), ('mouseData', wintypes.DWORD), ('flags', wintypes.DWORD),
+                ('time', wintypes.DWORD), ('dwExtraInfo', _ULONG_PTR)]
+
+WH_KEYBOARD_LL = 13; WH_MOUSE_LL = 14
+WM_QUIT = 0x0012; WM_KEYDOWN = 0x0100; WM_SYSKEYDOWN = 0x0104
+WM_MOUSEMOVE = 0x0200; WM_MOUSEWHEEL = 0x020A
+MOUSE_MESSAGES = {0x0201: 'left_down', 0x0202: 'left_up', 0x0204: 'right_down', 0x0205: 'right_up'}
+EVENT_SYSTEM_FOREGROUND = 0x0003; WINEVENT_OUTOFCONTEXT = 0x0000
+
+
+# --- INPUT / WINDOW BACKENDS ---
+
+WindowInfo = namedtuple('WindowInfo', 'hwnd title class_name pid process_name visible')
+
+class AutomationBackend:
+    """Every call that touches real windows, the mouse or the keyboard goes through here."""
+
+    def now(self):
+        return time.perf_counter()
+
+    def sleep(self, seconds):
+        time.sleep(seconds)
+
+    def get_foreground_window(self): raise NotImplementedError
+    def set_foreground_window(self, hwnd): raise NotImplementedError
+    def enumerate_windows(self): raise NotImplementedError
+    def get_window(self, hwnd): raise NotImplementedError
+    def is_window(self, hwnd): raise NotImplementedError
+    def window_title(self, hwnd): raise NotImplementedError
+    def window_class(self, hwnd): raise NotImplementedError
+    def window_pid(self, hwnd): raise NotImplementedError
+    def get_window_rect(self, hwnd): raise NotImplementedError
+    def is_valid_key(self, key): raise NotImplementedError
+    def mouse_position(self): raise NotImplementedError
+    def hook_input(self, callback): raise NotImplementedError # Returns a callable that removes the hook
+    def grab_region(self, left, top, width, height): raise NotImplementedError # PIL image of a screen rectangle
+    def idle_source(self): return None # IdleSource for operator activity, if the backend can see it
+
+    def grab_fingerprint(self, left, top, width, height):
+        return dhash(self.grab_region(left, top, width, height))
+    def send_batch(self, batch): raise NotImplementedError
+
+
+def _load_win32():
+    """Imports the Windows automation libraries; only the real backend needs them."""
+    global pyautogui, gw, win32gui, win32api, win32process
+    import pyautogui, pygetwindow as gw, win32gui, win32api, win32process
+    pyautogui.FAILSAFE = False
+
+
+def _recorded_key_names(char_of):
+    """virtual key -> the name a macro recording writes for it.
+
+    char_of(vk) is the character the keyboard layout types for vk unshifted (MapVirtualKey), or 0.
+    """
+    names = {}
+    for name, vk in NAMED_KEY_CODES.items(): names.setdefault(vk, name)
+    for vk, name in zip(range(0xA0, 0xA6), ('shift', 'shift', 'ctrl', 'ctrl', 'alt', 'alt')):
+        names[vk] = name # Hooks report which side; profiles and playback use the generic key
+    for vk in CHARACTER_VKS:
+        code = char_of(vk) & 0x7FFF # High bit marks a dead key
+        if code and chr(code).strip(): names[vk] = chr(code).lower()
+    return names
+
+
+class _InputHook:
+    """Low-level keyboard and mouse hooks, plus a foreground-change hook, on their own message-loop thread.
+
+    Windows calls the hooks for every input event as it happens, so nothing is polled.
+    callback(now, kind, a, b) gets 'move_to' (x, y), 'left_down' .. 'right_up',
+    'scroll' (wheel delta), 'key_down' / 'key_up' (key name) and 'focus' (hwnd).
+    """
+
+    def __init__(self, callback, key_names):
+        self.callback, self.key_names = callback, key_names
+        self._ready = threading.Event()
+        self._thread_id = None
+        self._error = None
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def start(self):
+        self._thread.start()
+        self._ready.wait()
+        if self._error is not None: raise self._error
+
+    def stop(self):
+        ctypes.windll.user32.PostThreadMessageW(self._thread_id, WM_QUIT, 0, 0)
+        self._thread.join()
+
+    def _run(self):
+        user32 = ctypes.WinDLL('user32', use_last_error=True) # Own instance: argtypes stay local
+        hook_proc = ctypes.WINFUNCTYPE(wintypes.LPARAM, ctypes.c_int, wintypes.WPARAM, wintypes.LPARAM)
+        event_proc = ctypes.WINFUNCTYPE(None, wintypes.HANDLE, wintypes.DWORD, wintypes.HWND, wintypes.LONG,
+                                        wintypes.LONG, wintypes.DWORD, wintypes.DWORD)
+        user32.SetWindowsHookExW.argtypes = (ctypes.c_int, hook_proc, wintypes.HINSTANCE, wintypes.DWORD)
+        user32.SetWindowsHookExW.restype = wintypes.HHOOK
+        user32.CallNextHookEx.argtypes = (wintypes.HHOOK, ctypes.c_int, wintypes.WPARAM, wintypes.LPARAM)
+        user32.CallNextHookEx.restype = wintypes.LPARAM
+        user32.SetWinEventHook.argtypes = (wintypes.DWORD, wintypes.DWORD, wintypes.HMODULE, event_proc,
+                                           wintypes.DWORD, wintypes.DWORD, wintypes.DWORD)
+        user32.SetWinEventHook.restype = wintypes.HANDLE
+        callback, key_names = self.callback, self.key_names
+
+        def on_key(code, wparam, lparam):
+            if code >= 0:
+                info = _KBDLLHOOKSTRUCT.from_address(lparam)
+                name = key_names.get(info.vkCode)
+                if name is not None:
+                    callback(time.perf_counter(), 'key_down' if wparam in (WM_KEYDOWN, WM_SYSKEYDOWN) else 'key_up',
+                             name, None)
+            return user32.CallNextHookEx(None, code, wparam, lparam)
+
+        def on_mouse(code, wparam, lparam):
+            if code >= 0:
+                info = _MSLLHOOKSTRUCT.from_address(lparam)
+                if wparam == WM_MOUSEMOVE: callback(time.perf_counter(), 'move_to', info.pt.x, info.pt.y)
+                elif wparam == WM_MOUSEWHEEL:
+                    callback(time.perf_counter(), 'scroll', ctypes.c_short(info.mouseData >> 16).value, None)
+                elif wparam in MOUSE_MESSAGES: callback(time.perf_counter(), MOUSE_MESSAGES[wparam], None, None)
+            return user32.CallNextHookEx(None, code, wparam, lparam)
+
+        procs = (hook_proc(on_key), hook_proc(on_mouse), # Referenced until the loop ends, or ctypes frees them
+                 event_proc(lambda hook, event, hwnd, *_: callback(time.perf_counter(), 'focus', hwnd or 0, None)))
+        self._thread_id = ctypes.windll.kernel32.GetCurrentThreadId()
+        module = ctypes.windll.kernel32.GetModuleHandleW(None)
+        hooks = [user32.SetWindowsHookExW(WH_KEYBOARD_LL, procs[0], module, 0),
+                 user32.SetWindowsHookExW(WH_MOUSE_LL, procs[1], module, 0)]
+        focus_hook = user32.SetWinEventHook(EVENT_SYSTEM_FOREGROUND, EVENT_SYSTEM_FOREGROUND, None, procs[2], 0, 0,
+                                            WINEVENT_OUTOFCONTEXT)
+        try:
+            if not all(hooks) or not focus_hook:
+                self._error = ctypes.WinError(ctypes.get_last_error())
+                return
+            self._ready.set()
+            msg = wintypes.MSG()
+            while user32.GetMessageW(ctypes.byref(msg), None, 0, 0) > 0: # Hooks are called from inside GetMessage
+                pass
+        finally:
+            for hook in hooks:
+                if hook: user32.UnhookWindowsHookEx(hook)
+            if focus_hook: user32.UnhookWinEvent(focus_hook)
+            self._ready.set()
+
+
+class Win32Backend(AutomationBackend):
+    """The real desktop: SendInput for input, pygetwindow/win32gui for windows."""
+
+    def __init__(self):
+        _load_win32()
+        self._key_codes = {} # key name -> virtual key, high byte holding the shift/ctrl/alt state; None if unknown
+        self._recorded_names = None
+
+    def _key_code(self, key):
+        if key not in self._key_codes:
+            code = NAMED_KEY_CODES.get(key)
+            if code is None and len(key) == 1:
+                code = win32api.VkKeyScan(key) & 0xFFFF
+                if code == 0xFFFF: code = None # No key on this layout types it
+            self._key_codes[key] = code
+        return self._key_codes[key]
+
+    def get_foreground_window(self):
+        return win32gui.GetForegroundWindow()
+
+    def set_foreground_window(self, hwnd):
+        win32gui.SetForegroundWindow(hwnd)
+
+    def enumerate_windows(self):
+        handles = []
+        win32gui.EnumWindows(lambda hwnd, _: handles.append(hwnd) or True, None)
+        names = {} # pid -> executable name, per call: the Refresh scan and the cycle thread may enumerate at once
+        infos = []
+        for hwnd in handles:
+            try:
+                pid = self.window_pid(hwnd)
+                infos.append(WindowInfo(hwnd, win32gui.GetWindowText(hwnd), win32gui.GetClassName(hwnd),
+                                        pid, self._process_name(pid, names), bool(win32gui.IsWindowVisible(hwnd))))
+            except win32gui.error:
+                continue # Window closed while enumerating
+        return infos
+
+    def _process_name(self, pid, names):
+        if pid not in names:
+            try:
+                handle = win32api.OpenProcess(PROCESS_QUERY_INFORMATION | PROCESS_VM_READ, False, pid)
+                try:
+                    names[pid] = os.path.basename(win32process.GetModuleFileNameEx(handle, 0))
+                finally:
+                    win32api.CloseHandle(handle)
+            except win32api.error:
+                names[pid] = "" # Elevated or protected process
+        return names[pid]
+
+    def get_window(self, hwnd):
+        return gw.Win32Window(hwnd)
+
+    def is_window(self, hwnd):
+        return bool(win32gui.IsWindow(hwnd))
+
+    def window_title(self, hwnd):
+        return win32gui.GetWindowText(hwnd)
+
+    def window_class(self, hwnd):
+        return win32gui.GetClassName(hwnd)
+
+    def window_pid(self, hwnd):
+        return win32process.GetWindowThreadProcessId(hwnd)[1]
+
+    def get_window_rect(self, hwnd):
+        return win32gui.GetWindowRect(hwnd)
+
+    def mouse_position(self):
+        return win32api.GetCursorPos()
+
+    def hook_input(self, callback):
+        if self._recorded_names is None:
+            self._recorded_names = _recorded_key_names(lambda vk: win32api.MapVirtualKey(vk, MAPVK_VK_TO_CHAR))
+        hook = _InputHook(callback, self._recorded_names)
+        hook.start()
+        return hook.stop
+
+    def idle_source(self):
+        return Win32IdleSource()
+
+    def grab_region(self, left, top, width, height):
+        """Copies just this rectangle of the virtual screen with one BitBlt, however many monitors there are."""
+        from PIL import Image # Only paid for by profiles with screen conditions
+        import win32ui
+        desktop = win32gui.GetDesktopWindow()
+        desktop_dc = win32gui.GetWindowDC(desktop)
+        source = win32ui.CreateDCFromHandle(desktop_dc)
+        memory = source.CreateCompatibleDC()
+        bitmap = win32ui.CreateBitmap()
+        try:
+            bitmap.CreateCompatibleBitmap(source, width, height)
+            memory.SelectObject(bitmap)
+            memory.BitBlt((0, 0), (width, height), source, (left, top), SRCCOPY)
+            pixels = bitmap.GetBitmapBits(True)
+        finally:
+            memory.DeleteDC()
+            source.DeleteDC()
+            win32gui.ReleaseDC(desktop, desktop_dc)
+            win32gui.DeleteObject(bitmap.GetHandle())
+        return Image.frombuffer('RGB', (width, height), pixels, 'raw', 'BGRX', 0, 1)
+
+    def is_valid_key(self, key):
+        return self._key_code(key) is not None
+
+    def send_batch(self, batch):
+        """Sends the batch with one SendInput call per run of events that has no wait inside it.
+
+        Waits are measured from the start of the batch, so they do not add up drift.
+        """
+        if not batch.events: return
+        left, top = win32api.GetSystemMetrics(SM_XVIRTUALSCREEN), win32api.GetSystemMetrics(SM_YVIRTUALSCREEN)
+        width, height = win32api.GetSystemMetrics(SM_CXVIRTUALSCREEN), win32api.GetSystemMetrics(SM_CYVIRTUALSCREEN)
+        x, y = self.mouse_position()
+        start = time.perf_counter()
+        offset = 0.0
+        pending = []
+        for event in batch:
+            kind = event.kind
+            if kind in ('move_to', 'move_rel'):
+                x, y = (event.a, event.b) if kind == 'move_to' else (x + event.a, y + event.b)
+                # Absolute moves bypass pointer acceleration, like pyautogui.moveTo
+                pending.append(self._mouse_input(MOUSEEVENTF_MOVE | MOUSEEVENTF_ABSOLUTE | MOUSEEVENTF_VIRTUALDESK,
+                                                 ((x - left) * 65535) // max(1, width - 1),
+                                                 ((y - top) * 65535) // max(1, height - 1)))
+            elif kind in MOUSE_BUTTON_FLAGS:
+                pending.append(self._mouse_input(MOUSE_BUTTON_FLAGS[kind]))
+            elif kind == 'scroll':
+                pending.append(self._mouse_input(MOUSEEVENTF_WHEEL, data=event.a & 0xFFFFFFFF))
+            else:
+                pending.extend(self._key_inputs(event.a, up=(kind == 'key_up')))
+
+            if event.delay > 0:
+                self._send_inputs(pending); pending = []
+                offset += event.delay
+                remaining = start + offset - time.perf_counter()
+                if remaining > 0: time.sleep(remaining)
+        self._send_inputs(pending)
+
+    @staticmethod
+    def _mouse_input(flags, dx=0, dy=0, data=0):
+        event = _INPUT(type=INPUT_MOUSE)
+        event.u.mi = _MOUSEINPUT(dx, dy, data, flags, 0, 0)
+        return event
+
+    def _key_inputs(self, key, up):
+        mods, vk = divmod(self._key_code(key), 0x100)
+        modifiers = [vk_mod for bit, vk_mod in ((4, VK_MENU), (2, VK_CONTROL), (1, VK_SHIFT)) if mods & bit]
+        order = [vk] + modifiers[::-1] if up else modifiers + [vk]
+        inputs = []
+        for code in order:
+            event = _INPUT(type=INPUT_KEYBOARD)
+            event.u.ki = _KEYBDINPUT(code, 0, KEYEVENTF_KEYUP if up else 0, 0, 0)
+            inputs.append(event)
+        return inputs
+
+    @staticmethod
+    def _send_inputs(inputs):
+        if not inputs: return
+        array = (_INPUT * len(inputs))(*inputs)
+        sent = ctypes.windll.user32.SendInput(len(inputs), array, ctypes.sizeof(_INPUT))
+        if sent != len(inputs):
+            raise ctypes.WinError()
+
+
+class FakeWindow:
+    """In-memory stand-in for a pygetwindow window."""
+
+    def __init__(self, hwnd, title, left=0, top=0, width=800, height=600, minimized=False,
+                 class_name="FakeWindowClass", pid=1, process_name="fake.exe", visible=True):
+        self._hWnd = hwnd
+        self.title = title
+        self.class_name, self.pid, self.process_name, self.visible = class_name, pid, process_name, visible
+        self.left, self.top, self.width, self.height = left, top, width, height
+        self.isMinimized = minimized
+
+    def restore(self):
+        self.isMinimized = False
+
+
+class FakeBackend(AutomationBackend):
+    """Deterministic desktop: fake windows, a fake foreground handle and recorded input.
+
+    Sleeps advance a virtual offset instead of blocking, so timings read from now()
+    are real code cost plus simulated waits. focus_latency delays every foreground
+    change the way a busy desktop does.
+    """
+
+    def __init__(self, track_real_time=True, focus_latency=0.0):
+        self.track_real_time = track_real_time
+        self.focus_latency = focus_latency
+        self.windows = {}
+        self.foreground_hwnd = 0
+        self.mouse = (0, 0)
+        self.input_hooks = [] # Callbacks installed by hook_input(), for macro recording
+        self.screen = {} # (left, top, width, height) -> dHash grab_fingerprint() reports; 0 if absent
+        self.grab_cost = 0.0 # Simulated seconds per grab
+        self.grabs = 0
+        self.events = []  # (timestamp, name, args)
+        self.enumerations = self.batches_sent = 0
+        self._virtual = 0.0
+        self._next_hwnd = 0x1000
+        self._pending_focus = None # (hwnd, due) while a foreground change is in flight
+
+    def add_window(self, title, **geometry):
+        window = FakeWindow(self._next_hwnd, title, **geometry)
+        self.windows[window._hWnd] = window
+        self._next_hwnd += 4
+        return window
+
+    def close_window(self, hwnd):
+        del self.windows[hwnd]
+
+    def now(self):
+        return (time.perf_counter() if self.track_real_time else 0.0) + self._virtual
+
+    def sleep(self, seconds):
+        self._virtual += seconds
+
+    def _record(self, name, *args):
+        self.events.append((self.now(), name, args))
+
+    def operator_input(self, kind, a=None, b=None):
+        """Feeds one operator input event (kinds as in hook_input) to the installed input hooks."""
+        for callback in list(self.input_hooks): callback(self.now(), kind, a, b)
+
+    def _apply_pending_focus(self, force=False):
+        if self._pending_focus is None: return
+        hwnd, due = self._pending_focus
+        if force: self._virtual += max(0.0, due - self.now())
+        if self.now() >= due:
+            self._pending_focus = None
+            self.foreground_hwnd = hwnd
+            self.events.append((due, 'focus', (hwnd,)))
+            self.operator_input('focus', hwnd)
+
+    def flush_pending_focus(self):
+        """Lets an in-flight foreground change land, advancing the clock if needed."""
+        self._apply_pending_focus(force=True)
+
+    def get_foreground_window(self):
+        self._apply_pending_focus()
+        return self.foreground_hwnd
+
+    def set_foreground_window(self, hwnd):
+        if hwnd not in self.windows:
+            raise OSError(f"Invalid window handle: {hwnd:#x}")
+        self._apply_pending_focus()
+        if self.focus_latency > 0:
+            self._pending_focus = (hwnd, self.now() + self.focus_latency)
+        else:
+            self.foreground_hwnd = hwnd
+            self._record('focus', hwnd)
+            self.operator_input('focus', hwnd)
+
+    def enumerate_windows(self):
+        self.enumerations += 1
+        return [WindowInfo(w._hWnd, w.title, w.class_name, w.pid, w.process_name, w.visible)
+                for w in self.windows.values()]
+
+    def get_window(self, hwnd):
+        return self.windows[hwnd]
+
+    def is_window(self, hwnd):
+        return hwnd in self.windows
+
+    def window_title(self, hwnd):
+        return self.windows[hwnd].title
+
+    def window_class(self, hwnd):
+        return self.windows[hwnd].class_name
+
+    def window_pid(self, hwnd):
+        return self.windows[hwnd].pid
+
+    def get_window_rect(self, hwnd):
+        w = self.windows[hwnd]
+        if w.isMinimized: return (MINIMIZED_COORD, MINIMIZED_COORD, MINIMIZED_COORD + 160, MINIMIZED_COORD + 28)
+        return (w.left, w.top, w.left + w.width, w.top + w.height)
+
+    def mouse_position(self):
+        return self.mouse
+
+    def hook_input(self, callback):
+        self.input_hooks.append(callback)
+        return lambda: self.input_hooks.remove(callback)
+
+    def idle_source(self):
+        return FakeIdleSource(self.now)
+
+    def grab_fingerprint(self, left, top, width, height):
+        self.grabs += 1
+        self.sleep(self.grab_cost)
+        return self.screen.get((left, top, width, height), 0)
+
+    def send_batch(self, batch):
+        """Records every event with its timestamp; explicit waits advance the fake clock."""
+        self.batches_sent += 1
+        for event in batch:
+            if event.kind == 'move_to': self.mouse = (event.a, event.b)
+            elif event.kind == 'move_rel': self.mouse = (self.mouse[0] + event.a, self.mouse[1] + event.b)
+            self._record(event.kind, event.a, event.b)
+            if event.delay > 0: self.sleep(event.delay)
+
+    def is_valid_key(self, key):
+        return len(key) == 1 or key in COMMON_KEY_NAMES
+
+
+# --- MACROS ---
+
+class MacroTimeline:
+    """A recorded macro, memory-mapped and read in place rather than loaded as Python objects.
+
+    Layout after MACRO_HEADER, as little-endian columns: int64 timestamps (monotonic
+    ns since the first event), int16 x and y (window-relative; key events keep a
+    key-table index in x, scroll events the amount), uint8 MACRO_KINDS codes, then
+    the newline-separated UTF-8 key-name table.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        with open(path, 'rb') as f:
+            if os.fstat(f.fileno()).st_size < MACRO_HEADER.size:
+                raise ValueError(f"{path} is not a macro file")
+            self._map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, version, key_count, count, self.width, self.height, _ = MACRO_HEADER.unpack_from(self._map)
+        if magic != MACRO_MAGIC or version != 1:
+            raise ValueError(f"{path} is not a version 1 macro file")
+        if sys.byteorder != 'little':
+            raise ValueError("macro files can only be played on little-endian machines")
+        self._view = view = memoryview(self._map)
+        offset = MACRO_HEADER.size
+        columns = []
+        for code, size in (('q', 8), ('h', 2), ('h', 2), ('B', 1)):
+            if offset + count * size > len(view): raise ValueError(f"{path} is truncated")
+            columns.append(view[offset:offset + count * size].cast(code))
+            offset += count * size
+        self.count = count
+        self.times, self.xs, self.ys, self.kinds = columns
+        self.keys = tuple(bytes(view[offset:]).decode('utf-8').split('\n')) if key_count else ()
+        if len(self.keys) != key_count:
+            raise ValueError(f"{path} has a damaged key table")
+
+    @property
+    def duration(self):
+        return self.times[-1] / 1e9 if self.count else 0.0
+
+    def close(self):
+        """Unmaps the file so it can be replaced (Windows refuses while mapped); plays as empty afterwards."""
+        self.count = 0
+        for view in (self.times, self.xs, self.ys, self.kinds, self._view): view.release()
+        self._map.close()
+
+    @staticmethod
+    def write(path, width, height, times, xs, ys, kinds, keys):
+        """Writes the columns (arrays of 'q', 'h', 'h', 'B') as a macro file, replacing path atomically."""
+        bad_keys = [key for key in keys if not key or '\n' in key]
+        if bad_keys: raise ValueError(f"key names cannot be empty or contain newlines: {bad_keys!r}")
+        with open(path + '.tmp', 'wb') as f:
+            f.write(MACRO_HEADER.pack(MACRO_MAGIC, 1, len(keys), len(times), width, height, 0))
+            for column in (times, xs, ys, kinds):
+                f.write(column.tobytes())
+            f.write('\n'.join(keys).encode('utf-8'))
+        close_macro(path)
+        try:
+            os.replace(path + '.tmp', path)
+        except OSError:
+            os.remove(path + '.tmp')
+            raise
+
+    def play(self, left, top, width, height, speed=1.0, jitter=0.0, rng=None):
+        """Yields the macro as InputEvents for a window at (left, top) of the given size.
+
+        Every send time comes from the event's absolute timestamp, scaled by speed and
+        moved by at most +/- jitter seconds. Each wait is the difference between two
+        absolute times, so rounding and jitter never add up over a long macro.
+        Coordinates scale with the window size, and anything still held at the end
+        is released.
+        """
+        rng = rng or random
+        sx = width / self.width if self.width else 1.0
+        sy = height / self.height if self.height else 1.0
+        held = {}
+        pending, pending_at = None, 0.0
+        for i in range(self.count):
+            at = self.times[i] / 1e9 / speed
+            if jitter: at += rng.uniform(-jitter, jitter)
+            at = max(at, pending_at) # Jitter may shift events, never reorder them
+            if pending is not None: yield pending._replace(delay=at - pending_at)
+
+            kind, x, y = MACRO_KINDS[self.kinds[i]], self.xs[i], self.ys[i]
+            if kind == 'move_to': a, b = left + round(x * sx), top + round(y * sy)
+            elif kind in ('key_down', 'key_up'): a, b = self.keys[x], None
+            elif kind == 'scroll': a, b = x, None
+            else: a, b = None, None
+            if kind.endswith('_down'): held[(kind, a)] = kind.replace('_down', '_up')
+            elif kind.endswith('_up'): held.pop((kind.replace('_up', '_down'), a), None)
+            pending, pending_at = InputEvent(kind, a, b, 0.0), at
+        if pending is not None: yield pending
+        for (_, a), up in held.items():
+            yield InputEvent(up, a, None, 0.0)
+
+
+class MacroRecorder:
+    """Records the pointer, mouse buttons, scroll wheel and keys from the backend's input hooks.
+
+    Only input while the target window has focus is kept. Time spent with another
+    window in front is cut out of the timeline, so switching to the target, playing,
+    and switching back to press Stop records only the input meant for the target.
+    """
+
+    def __init__(self, backend, hwnd):
+        self.backend = backend
+        self.hwnd = hwnd
+        self.times, self.xs, self.ys, self.kinds = array('q'), array('h'), array('h'), array('B')
+        self.keys = []
+        self._key_index = {}
+        self._held = set() # Keys down, so auto-repeat is not recorded as more presses
+        self._start = self._away = None # Start of the timeline; start of the current stretch out of focus
+        self._last_pos = None
+        self._unhook = None
+        left, top, right, bottom = backend.get_window_rect(hwnd)
+        self.origin, self.width, self.height = (left, top), right - left, bottom - top
+
+    def start(self):
+        self._unhook = self.backend.hook_input(self._on_input)
+        if self.backend.get_foreground_window() != self.hwnd: self._away = self.backend.now()
+
+    def stop(self):
+        if self._unhook is not None: self._unhook()
+        self._unhook = None
+        return len(self.times)
+
+    def save(self, path):
+        MacroTimeline.write(path, self.width, self.height, self.times, self.xs, self.ys, self.kinds, self.keys)
+
+    def _add(self, elapsed, kind, x=0, y=0):
+        self.times.append(int(elapsed * 1e9))
+        self.xs.append(max(-32768, min(32767, x))); self.ys.append(max(-32768, min(32767, y)))
+        self.kinds.append(MACRO_KINDS.index(kind))
+
+    def _key(self, name):
+        if name not in self._key_index:
+            self._key_index[name] = len(self.keys)
+            self.keys.append(name)
+        return self._key_index[name]
+
+    def _on_input(self, now, kind, a, b):
+        """Hook callback, on the backend's hook thread; must return quickly."""
+        if kind == 'focus':
+            if a != self.hwnd:
+                if self._away is None and self._start is not None:
+                    for name in sorted(self._held): # The target sees them released as it loses focus
+                        self._add(now - self._start, 'key_up', self._key(name))
+                self._held.clear()
+                if self._away is None: self._away = now
+            elif self._away is not None:
+                if self._start is not None: self._start += now - self._away
+                self._away = None
+            return
+        if self._away is not None: return # Meant for another window
+        if kind == 'move_to' and (a, b) == self._last_pos: return
+        if kind == 'key_down':
+            if a in self._held: return
+            self._held.add(a)
+        elif kind == 'key_up':
+            if a not in self._held: return # Pressed before recording started, or while away
+            self._held.discard(a)
+        if self._start is None: self._start = now
+        elapsed = now - self._start
+        if kind == 'move_to':
+            self._add(elapsed, kind, a - self.origin[0], b - self.origin[1])
+            self._last_pos = (a, b)
+        elif kind in ('key_down', 'key_up'): self._add(elapsed, kind, self._key(a))
+        elif kind == 'scroll': self._add(elapsed, kind, a)
+        else: self._add(elapsed, kind)
+
+
+_macro_cache = {} # absolute path -> (mtime_ns, MacroTimeline)
+
+def open_macro(path):
+    """Returns the MacroTimeline for path, reopening it only when the file has changed."""
+    mtime = os.stat(path).st_mtime_ns
+    key = os.path.abspath(path)
+    cached = _macro_cache.get(key)
+    if cached is None or cached[0] != mtime:
+        cached = _macro_cache[key] = (mtime, MacroTimeline(path))
+    return cached[1]
+
+
+def close_macro(path):
+    """Drops and unmaps the cached timeline for path, if any, before the file is rewritten."""
+    cached = _macro_cache.pop(os.path.abspath(path), None)
+    if cached is not None: cached[1].close()
+
+
+# --- SCREEN CONDITIONS ---
+
+ScreenCondition = namedtuple('ScreenCondition', 'scope mode region reference max_distance')
+
+
+def dhash(image):
+    """64-bit difference hash: a 9x8 grayscale thumbnail, one bit per left/right brightness step."""
+    from PIL import Image
+    pixels = image.convert('L').resize((9, 8), getattr(Image, 'Resampling', Image).BILINEAR).tobytes()
+    bits = 0
+    for i in range(72):
+        if i % 9 != 8: bits = bits << 1 | (pixels[i] > pixels[i + 1])
+    return bits
+
+
+def hash_distance(a, b):
+    return bin(a ^ b).count('1')
+
+
+def load_reference(reference):
+    """A condition's reference fingerprint: a literal 0x hash, or the dHash of an image file."""
+    if reference.lower().startswith('0x'): return int(reference, 16)
+    from PIL import Image
+    with Image.open(reference) as image:
+        return dhash(image)
+
+
+class ScreenConditions:
+    """Checks a plan's screen conditions against small grabs of the target window.
+
+    All grabs in one cycle share a time budget set by begin(). A region is grabbed
+    at most once per cycle unless a wait needs a fresh look. Once the budget is
+    spent a match counts as failed and 'unchanged' as changed, so the tool errs
+    towards not acting blind. wait() does the polling for wait_match before the
+    focus steal; check() only ever takes one look, so it is safe under the focus lock.
+    """
+
+    def __init__(self, backend):
+        self.backend = backend
+        self.grabs = self.cache_hits = self.over_budget = 0
+        self.previous = {} # (target, region) -> fingerprint at the last check, for skip_unchanged
+        self._cache = {}
+        self._deadline = 0.0
+
+    def stats(self):
+        return {'grabs': self.grabs, 'cache_hits': self.cache_hits, 'over_budget': self.over_budget}
+
+    def begin(self, budget):
+        self._cache.clear()
+        self._deadline = self.backend.now() + budget
+
+    def _fingerprint(self, window, region, fresh=False):
+        if region in self._cache and not fresh:
+            self.cache_hits += 1
+            return self._cache[region]
+        if self.backend.now() >= self._deadline:
+            self.over_budget += 1
+            return None
+        x, y, width, height = region
+        self.grabs += 1
+        fingerprint = self._cache[region] = self.backend.grab_fingerprint(window.left + x, window.top + y, width, height)
+        return fingerprint
+
+    def wait(self, plan, window):
+        """Polls every wait_match region until it matches or the budget is spent; True if all matched."""
+        for c in plan.conditions:
+            if c.mode != 'wait_match': continue
+            fingerprint = self._fingerprint(window, c.region)
+            while fingerprint is not None and hash_distance(fingerprint, c.reference) > c.max_distance:
+                self.backend.sleep(CONDITION_POLL_INTERVAL)
+                fingerprint = self._fingerprint(window, c.region, fresh=True)
+            if fingerprint is None: return False
+        return True
+
+    def check(self, plan, window, scope):
+        """Returns None if every condition for scope passes, else the reason to hold back."""
+        for c in plan.conditions:
+            if c.scope != scope: continue
+            if c.mode == 'skip_unchanged':
+                fingerprint = self._fingerprint(window, c.region)
+                if fingerprint is None: continue # Cannot tell, so act
+                key = (plan.target, c.region)
+                previous, self.previous[key] = self.previous.get(key), fingerprint
+                if previous is not None and hash_distance(fingerprint, previous) <= c.max_distance:
+                    return f"region {c.region} unchanged"
+                continue
+
+            fingerprint = self._fingerprint(window, c.region) # wait_match already waited in wait()
+            if fingerprint is None:
+                return f"region {c.region} not checked within the {plan.condition_budget:g} s budget"
+            distance = hash_distance(fingerprint, c.reference)
+            if distance > c.max_distance:
+                return f"region {c.region} does not match (distance {distance}, hash {fingerprint:#018x})"
+        return None
+
+
+# --- WINDOW RESOLUTION ---
+
+def parse_target(target):
+    """Splits an explicit 'hwnd:', 'process:' or 'class:' target into (mode, value), else None."""
+    prefix, sep, value = target.partition(':')
+    prefix = prefix.strip().lower()
+    if not sep or prefix not in ('hwnd', 'process', 'class'): return None
+    value = value.strip()
+    if prefix == 'hwnd': return 'handle', int(value, 0)
+    return prefix, value
+
+
+class WindowResolver:
+    """Keeps the resolved target handle across cycles and revalidates it cheaply.
+
+    A cached handle is reused while it still exists, belongs to the same process and
+    still matches its lock. Only a failed check pays for a full window enumeration.
+    With a handle, process or class lock the target is found by title once and then
+    followed by that identity, so a title change does not force a rescan.
+    """
+
+    def __init__(self, backend):
+        self.backend = backend
+        self.hits = self.misses = self.invalidations = 0
+        self._key = None
+        self._lock = None  # (mode, value) the cached window must keep matching
+        self._info = None  # WindowInfo of the cached window
+
+    def stats(self):
+        return {'hits': self.hits, 'misses': self.misses, 'invalidations': self.invalidations}
+
+    def resolve(self, target, lock_mode='title'):
+        """Returns a window object for target, or None if nothing matches."""
+        if not target: return None
+        if (target, lock_mode) != self._key:
+            self._key, self._info = (target, lock_mode), None
+            self._lock = parse_target(target) or (('title', target) if lock_mode == 'title' else None)
+
+        if self._info is not None:
+            if self._is_valid(self._info):
+                self.hits += 1
+                return self.backend.get_window(self._info.hwnd)
+            self.invalidations += 1
+            self._info = None
+
+        self.misses += 1
+        windows = self.backend.enumerate_windows()
+        info = self._first_match(windows, self._lock) if self._lock else None
+        if info is None and not parse_target(target):
+            # Identity lost (or never locked): find the window by title and lock onto it again
+            info = self._first_match(windows, ('title', target))
+            if info is not None and lock_mode != 'title':
+                self._lock = (lock_mode, {'handle': info.hwnd, 'process': info.process_name,
+                                          'class': info.class_name}[lock_mode])
+        self._info = info
+        return self.backend.get_window(info.hwnd) if info else None
+
+    def _is_valid(self, info):
+        b = self.backend
+        try:
+            if not b.is_window(info.hwnd) or b.window_pid(info.hwnd) != info.pid: return False
+            mode, value = self._lock
+            if mode == 'title': return value.upper() in b.window_title(info.hwnd).upper()
+            if mode == 'class': return b.window_class(info.hwnd) == value
+            return True # Same live handle in the same process
+        except Exception:
+            return False
+
+    def _first_match(self, windows, lock):
+        mode, value = lock
+        for info in windows:
+            if mode == 'handle':
+                if info.hwnd == value: return info
+                continue
+            if not info.visible or not info.title: continue
+            if mode == 'title' and value.upper() in info.title.upper(): return info
+            if mode == 'process' and info.process_name.lower() == value.lower(): return info
+            if mode == 'class' and info.class_name == value: return info
+        return None
+
+
+def _fuzzy_score(query, text):
+    """Scores query as an in-order subsequence of text (lower is closer), or None if it is not one."""
+    score, pos = 0, -1
+    for char in query:
+        found = text.find(char, pos + 1)
+        if found < 0: return None
+        score += found - pos - 1 if pos >= 0 else found
+        pos = found
+    return score
+
+
+class WindowIndex:
+    """Handle-keyed index of top-level windows for the target picker.
+
+    apply() diffs a fresh enumeration against the previous one, so only windows that
+    appeared, vanished or changed touch the sorted title list.
+    """
+
+    def __init__(self):
+        self.by_hwnd = {}
+        self.titles = [] # Sorted unique titles of visible, titled windows
+        self._title_counts = Counter()
+
+    @staticmethod
+    def _listed(info):
+        return info.visible and bool(info.title)
+
+    def _add(self, info):
+        if not self._listed(info): return
+        if not self._title_counts[info.title]: bisect.insort(self.titles, info.title)
+        self._title_counts[info.title] += 1
+
+    def _drop(self, info):
+        if not self._listed(info): return
+        self._title_counts[info.title] -= 1
+        if not self._title_counts[info.title]:
+            del self._title_counts[info.title]
+            del self.titles[bisect.bisect_left(self.titles, info.title)]
+
+    def apply(self, windows):
+        """Merges a full enumeration into the index and returns (added, removed, changed)."""
+        fresh = {info.hwnd: info for info in windows}
+        removed = self.by_hwnd.keys() - fresh.keys()
+        for hwnd in removed:
+            self._drop(self.by_hwnd.pop(hwnd))
+        added = changed = 0
+        for hwnd, info in fresh.items():
+            old = self.by_hwnd.get(hwnd)
+            if old == info: continue
+            if old is None: added += 1
+            else: changed += 1; self._drop(old)
+            self.by_hwnd[hwnd] = info
+            self._add(info)
+        return added, len(removed), changed
+
+    def search(self, query, mode='substring'):
+        """Titles whose window title, process or class matches query; raises re.error for a bad regex."""
+        query = query.strip()
+        if not query: return list(self.titles)
+        if mode == 'regex':
+            pattern = re.compile(query, re.IGNORECASE)
+            match = lambda text: 0 if pattern.search(text) else None
+        elif mode == 'fuzzy':
+            needle = query.lower()
+            match = lambda text: _fuzzy_score(needle, text.lower())
+        else:
+            needle = query.lower()
+            match = lambda text: 0 if needle in text.lower() else None
+
+        best = {}
+        for info in self.by_hwnd.values():
+            if not self._listed(info): continue
+            scores = [s for s in map(match, (info.title, info.process_name, info.class_name)) if s is not None]
+            if scores and min(scores) < best.get(info.title, float('inf')):
+                best[info.title] = min(scores)
+        return sorted(best, key=lambda title: (best[title], title))
+
+
+# --- FOCUS SETTLING ---
+
+def _percentile(sorted_values, pct):
+    """Nearest-rank percentile of an already sorted list."""
+    if not sorted_values: return 0.0
+    rank = max(0, min(len(sorted_values) - 1, int(round(pct / 100.0 * len(sorted_values))) - 1))
+    return sorted_values[rank]
+
+
+class FocusSettler:
+    """Confirms a foreground change by polling instead of sleeping a fixed time.
+
+    'adaptive' polls the foreground handle (and, when focusing the target, its
+    rectangle) until they are stable. The poll gives up at a deadline learned from
+    recent settle times and capped by the configured deadline, then tops up to the
+    legacy fixed wait. 'fixed' keeps the old behaviour.
+    """
+
+    def __init__(self, backend, mode='adaptive', deadline=0.25):
+        self.backend = backend
+        self.mode, self.max_deadline = mode, deadline
+        self.samples = {'focus': deque(maxlen=SETTLE_HISTORY), 'revert': deque(maxlen=SETTLE_HISTORY)}
+        self.timeouts = {'focus': 0, 'revert': 0}
+
+    def configure(self, mode, deadline):
+        self.mode, self.max_deadline = mode, deadline
+
+    def deadline_for(self, kind):
+        """Three times the recent p99 settle time, kept between SETTLE_MIN_DEADLINE and the configured cap."""
+        history = sorted(self.samples[kind])
+        if len(history) < 20: return self.max_deadline
+        return min(self.max_deadline, max(SETTLE_MIN_DEADLINE, 3 * _percentile(history, 99)))
+
+    def wait_foreground(self, hwnd, kind, fixed_wait=FOCUS_SETTLE_WAIT, check_rect=False):
+        """Waits until hwnd is the foreground window. Returns the settle time, or None if unconfirmed."""
+        b = self.backend
+        start = b.now()
+        if self.mode == 'fixed':
+            if fixed_wait: b.sleep(fixed_wait)
+            return b.now() - start if b.get_foreground_window() == hwnd else None
+
+        deadline = start + self.deadline_for(kind)
+        last_rect = None
+        while True:
+            if b.get_foreground_window() == hwnd:
+                rect = b.get_window_rect(hwnd) if check_rect else None
+                if not check_rect or (rect == last_rect and rect[0] > MINIMIZED_COORD):
+                    elapsed = b.now() - start
+                    self.samples[kind].append(elapsed)
+                    return elapsed
+                last_rect = rect
+            if b.now() >= deadline: break
+            b.sleep(SETTLE_POLL_INTERVAL)
+
+        self.timeouts[kind] += 1
+        remaining = fixed_wait - (b.now() - start)
+        if remaining > 0: b.sleep(remaining)
+        return b.now() - start if b.get_foreground_window() == hwnd else None
+
+    def stats(self):
+        result = {}
+        for kind, history in self.samples.items():
+            ordered = sorted(history)
+            result[kind] = {'p50_ms': _percentile(ordered, 50) * 1000, 'p95_ms': _percentile(ordered, 95) * 1000,
+                            'deadline_ms': self.deadline_for(kind) * 1000, 'timeouts': self.timeouts[kind]}
+        return result
+
+
+# --- PROFILES ---
+
+SQL_COLUMN_TYPES = {bool: 'INTEGER', int: 'INTEGER', float: 'REAL', str: 'TEXT'}
+
+
+def profile_from_section(section):
+    """Reads the keys present in a configparser profile section with DEFAULT_PROFILE's types."""
+    getters = {bool: section.getboolean, int: section.getint, float: section.getfloat}
+    return {key: getters.get(type(default), section.get)(key)
+            for key, default in DEFAULT_PROFILE.items() if key in section}
+
+
+class ProfileStore:
+    """Saved profiles in an indexed SQLite table, one typed column per DEFAULT_PROFILE key.
+
+    Loads are a primary-key lookup behind an in-memory cache that is dropped whenever
+    the database file's mtime moves, so saves from another instance show up on the
+    next load. Each save is its own transaction; an interrupted write leaves the
+    previous row intact. A missing key is stored as NULL and left out of the
+    loaded profile, like a key missing from an INI section.
+
+    A new database imports legacy_ini once. The import is marked done in the same
+    transaction that writes its profiles, so an INI that cannot be read is retried
+    on the next start; sections with bad values are skipped and listed in skipped.
+    """
+
+    def __init__(self, path=PROFILES_DB, legacy_ini=PROFILES_FILE):
+        self.path = path
+        self._conn = sqlite3.connect(path)
+        self._keys = tuple(DEFAULT_PROFILE)
+        columns = ', '.join(f"{key} {SQL_COLUMN_TYPES[type(DEFAULT_PROFILE[key])]}" for key in self._keys)
+        with self._conn:
+            fresh = self._conn.execute("SELECT 1 FROM sqlite_master WHERE name = 'profiles'").fetchone() is None
+            self._conn.execute(f"CREATE TABLE IF NOT EXISTS profiles (name TEXT PRIMARY KEY, {columns}, updated REAL)")
+            self._conn.execute("CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT)")
+            if fresh: self._conn.execute("INSERT INTO meta VALUES ('legacy_import', 'pending')")
+            existing = {row[1] for row in self._conn.execute("PRAGMA table_info(profiles)")}
+            for key in self._keys:
+                if key not in existing: # Database written before this key existed
+                    self._conn.execute(f"ALTER TABLE profiles ADD COLUMN {key} {SQL_COLUMN_TYPES[type(DEFAULT_PROFILE[key])]}")
+        self._cache = {}
+        self._stamp = self._file_stamp()
+        self.imported, self.skipped, self.import_error = 0, [], None # Outcome of the last import
+        pending = self._conn.execute("SELECT 1 FROM meta WHERE key = 'legacy_import' AND value = 'pending'").fetchone()
+        if pending: self._import_legacy(legacy_ini)
+
+    def _import_legacy(self, path):
+        items = []
+        if path and os.path.exists(path):
+            try:
+                items, self.skipped = self._read_ini(path)
+            except (configparser.Error, OSError, UnicodeDecodeError) as e:
+                self.import_error = f"{path}: {e}" # Left pending, so the next start tries again
+                return
+        self._upsert(items, done='legacy_import')
+        self.imported = len(items)
+
+    def _file_stamp(self):
+        try:
+            st = os.stat(self.path)
+            return st.st_mtime_ns, st.st_size
+        except OSError:
+            return None
+
+    def _check_cache(self):
+        stamp = self._file_stamp()
+        if stamp != self._stamp:
+            self._cache.clear()
+            self._stamp = stamp
+
+    def _row_to_profile(self, row):
+        return {key: type(DEFAULT_PROFILE[key])(value) for key, value in zip(self._keys, row) if value is not None}
+
+    def __contains__(self, name):
+        return self.load(name) is not None
+
+    def names(self):
+        return [row[0] for row in self._conn.execute("SELECT name FROM profiles ORDER BY name")]
+
+    def load(self, name):
+        """Returns the typed profile saved as name, or None."""
+        self._check_cache()
+        if name not in self._cache:
+            cols = ', '.join(self._keys)
+            row = self._conn.execute(f"SELECT {cols} FROM profiles WHERE name = ?", (name,)).fetchone()
+            if row is None: return None
+            self._cache[name] = self._row_to_profile(row)
+        return dict(self._cache[name])
+
+    def _upsert(self, items, done=None):
+        cols = ', '.join(('name',) + self._keys + ('updated',))
+        marks = ', '.join('?' * (len(self._keys) + 2))
+        now = time.time()
+        rows = [(name,) + tuple(profile.get(key) for key in self._keys) + (now,) for name, profile in items]
+        with self._conn:
+            self._conn.executemany(f"INSERT OR REPLACE INTO profiles ({cols}) VALUES ({marks})", rows)
+            if done: self._conn.execute("INSERT OR REPLACE INTO meta VALUES (?, 'done')", (done,))
+        self._check_cache()
+        for name, profile in items:
+            self._cache[name] = {key: profile[key] for key in self._keys if profile.get(key) is not None}
+
+    def save(self, name, profile):
+        """Replaces (or creates) one profile in a single transaction."""
+        self._upsert([(name, profile)])
+
+    def _read_ini(self, path):
+        """Returns ([(name, profile)], [(name, error)]) for a profile INI; a section with a bad value is skipped."""
+        config = configparser.ConfigParser()
+        config.read(path)
+        items, skipped = [], []
+        for name in config.sections():
+            try:
+                items.append((name, profile_from_section(config[name])))
+            except (ValueError, configparser.Error) as e:
+                skipped.append((name, str(e)))
+        return items, skipped
+
+    def import_ini(self, path):
+        """Copies every valid section of a profile INI into the store in one transaction; returns the count."""
+        items, self.skipped = self._read_ini(path)
+        if items: self._upsert(items)
+        return len(items)
+
+    def export_ini(self, path):
+        """Writes every profile to an INI file, replacing it only once the new copy is complete."""
+        config = configparser.ConfigParser()
+        cols = ', '.join(self._keys)
+        for row in self._conn.execute(f"SELECT name, {cols} FROM profiles ORDER BY name"):
+            config[row[0]] = {key: str(value) for key, value in self._row_to_profile(row[1:]).items()}
+        with open(path + '.tmp', 'w') as configfile:
+            config.write(configfile)
+        os.replace(path + '.tmp', path)
+        return len(config.sections())
+
+    def close(self):
+        self._conn.close()
+
+
+# --- ACTIVITY LOG ---
+
+LogRecord = namedtuple('LogRecord', 'timestamp level message')
+
+
+class JsonLineFormatter(logging.Formatter):
+    def format(self, record):
+        return json.dumps({'ts': round(getattr(record, 'ts', record.created), 3), 'level': record.levelname.lower(),
+                           'message': record.getMessage()}, ensure_ascii=False)
+
+
+class LogPipeline:
+    """Hands log records and status from any thread to a single consumer.
+
+    Producers only put() onto a SimpleQueue and never touch Tk. The consumer (the
+    GUI's after() timer, or the headless loop) drains in batches and forwards every
+    record to the optional rotating JSON-lines sink, so the full history lives on
+    disk rather than in memory.
+    """
+
+    def __init__(self, sink_path=None):
+        self._queue = queue.SimpleQueue()
+        self._status = None # Latest status only; older ones are never shown
+        self._sink = None
+        if sink_path: self.open_sink(sink_path)
+
+    def push(self, message, level='info'):
+        self._queue.put(LogRecord(time.time(), level, message))
+
+    def set_status(self, status):
+        self._status = status
+
+    def take_status(self):
+        status, self._status = self._status, None
+        return status
+
+    def drain(self, limit=LOG_DRAIN_BATCH):
+        """Returns up to limit pending records, oldest first."""
+        records = []
+        try:
+            while len(records) < limit:
+                records.append(self._queue.get_nowait())
+        except queue.Empty:
+            pass
+        if self._sink is not None:
+            for r in records:
+                self._sink.log(logging.WARNING if r.level == 'warning' else logging.INFO, r.message,
+                               extra={'ts': r.timestamp})
+        return records
+
+    def open_sink(self, path):
+        import logging.handlers # Pulls in socket; only needed once a sink is opened
+        self.close_sink()
+        handler = logging.handlers.RotatingFileHandler(path, maxBytes=LOG_FILE_MAX_BYTES,
+                                                       backupCount=LOG_FILE_BACKUPS, encoding='utf-8')
+        handler.setFormatter(JsonLineFormatter())
+        self._sink = logging.getLogger(f'focus_lock.{id(self)}')
+        self._sink.propagate = False
+        self._sink.setLevel(logging.INFO)
+        self._sink.addHandler(handler)
+
+    def close_sink(self):
+        if self._sink is None: return
+        for handler in list(self._sink.handlers):
+            self._sink.removeHandler(handler); handler.close()
+        self._sink = None
+
+
+# --- ACTION PLANS ---
+
+class PlanError(ValueError):
+    """Raised when a profile cannot be compiled into an ActionPlan."""
+
+
+def parse_keys(text):
+    """Splits a comma separated key list into lowercase key names."""
+    return tuple(key.strip().lower() for key in text.split(',') if key.strip())
+
+
+def parse_conditions(text):
+    """Parses '[scope:]mode x,y,w,h [reference] [max_distance]' items separated by ';'."""
+    conditions = []
+    for item in text.split(';'):
+        if not item.strip(): continue
+        head, _, rest = item.strip().partition(' ')
+        scope, _, mode = head.rpartition(':')
+        scope = scope.strip().lower() or 'cycle'
+        tokens = rest.split()
+        if mode not in CONDITION_MODES or scope not in CONDITION_SCOPES or not tokens:
+            raise PlanError(f"Bad screen condition '{item.strip()}': expected [scope:]mode x,y,w,h [reference] [max_distance].")
+        try:
+            region = tuple(int(v) for v in tokens.pop(0).split(','))
+            max_distance = int(tokens.pop()) if tokens and tokens[-1].isdigit() else CONDITION_MAX_DISTANCE
+            reference = load_reference(tokens.pop(0)) if tokens and mode != 'skip_unchanged' else None
+        except ImportError:
+            raise PlanError("Image references need Pillow; install it or give the reference as a 0x hash.") from None
+        except (ValueError, OSError) as e:
+            raise PlanError(f"Bad screen condition '{item.strip()}': {e}") from None
+        if len(region) != 4 or region[2] <= 0 or region[3] <= 0 or tokens:
+            raise PlanError(f"Bad screen condition '{item.strip()}': region must be x,y,width,height.")
+        if mode != 'skip_unchanged' and reference is None:
+            raise PlanError(f"Screen condition '{item.strip()}' needs a reference image or 0x hash.")
+        conditions.append(ScreenCondition(scope, mode, region, reference, max_distance))
+    return tuple(conditions)
+
+
+def _calculate_weights(long_keys, tap_keys, long_weight, right_click, scroll, macro_weight=0):
+    """Calculates the proportional weights for the Custom Mode."""
+    weights = {}
+    
+    if long_keys: weights['long_press'] = long_weight
+    if macro_weight: weights['macro'] = macro_weight
+    
+    remaining_weight = 100 - weights.get('long_press', 0) - weights.get('macro', 0)
+    
+    other_actions = []
+    if tap_keys: other_actions.append('tap_press')
+    if right_click: other_actions.append('right_click')
+    if scroll: other_actions.append('scroll')
+
+    num_other = len(other_actions)
+    if num_other > 0:
+        weight_per_other = remaining_weight / num_other
+        for action in other_actions:
+            weights[action] = weight_per_other
+    
+    return weights
+
+
+class ActionPlan:
+    """Immutable, precomputed form of a profile; the only thing the worker thread reads."""
+
+    __slots__ = ('target', 'lock_mode', 'settle_mode', 'settle_deadline', 'min_delay', 'max_delay',
+                 'mouse_action', 'long_keys', 'tap_keys', 'actions', 'cum_weights', 'total_weight',
+                 'jiggle_steps', 'macro', 'macro_speed', 'macro_jitter', 'conditions', 'condition_budget',
+                 'idle_threshold', 'idle_max_defer')
+
+    def __init__(self, **fields):
+        for name in self.__slots__:
+            object.__setattr__(self, name, fields[name])
+
+    def __setattr__(self, name, value):
+        raise AttributeError("ActionPlan is immutable; compile a new one")
+
+    def pick_action(self, rng):
+        """Weighted pick by binary search over the cumulative weights; None if no action is enabled."""
+        if not self.total_weight: return None
+        return self.actions[bisect.bisect(self.cum_weights, rng.random() * self.total_weight)]
+
+    def jiggle(self, rng):
+        return rng.choice(self.jiggle_steps), rng.choice(self.jiggle_steps)
+
+
+def compile_plan(profile, is_valid_key):
+    """Validates a profile dict (keyed like DEFAULT_PROFILE) and compiles it into an ActionPlan."""
+    p = dict(DEFAULT_PROFILE, **profile)
+    try:
+        min_delay, max_delay = float(p['min_delay']), float(p['max_delay'])
+        settle_deadline = float(p['settle_deadline'])
+        long_weight = int(p['long_press_weight'])
+        macro_weight, macro_speed, macro_jitter = int(p['macro_weight']), float(p['macro_speed']), float(p['macro_jitter'])
+        condition_budget = float(p['condition_budget'])
+        idle_threshold, idle_max_defer = float(p['idle_threshold']), float(p['idle_max_defer'])
+        if p['target_window']: parse_target(p['target_window'])
+    except (TypeError, ValueError) as e:
+        raise PlanError(f"Invalid setting: {e}") from None
+
+    if not 0 <= min_delay <= max_delay:
+        raise PlanError(f"Delays must satisfy 0 <= min ({min_delay}) <= max ({max_delay}).")
+    if not 0 <= long_weight <= 100:
+        raise PlanError(f"Long press priority must be 0-100, got {long_weight}.")
+    if p['lock_mode'] not in TARGET_LOCK_MODES:
+        raise PlanError(f"Unknown lock mode '{p['lock_mode']}'.")
+    if p['settle_mode'] not in SETTLE_MODES or settle_deadline <= 0:
+        raise PlanError("Focus settle needs a known mode and a positive deadline.")
+
+    if idle_threshold < 0 or idle_max_defer < 0:
+        raise PlanError("Idle threshold and maximum deferral cannot be negative.")
+
+    conditions = parse_conditions(p['screen_conditions'])
+    if conditions and condition_budget <= 0:
+        raise PlanError("Screen conditions need a positive time budget.")
+
+    macro = None
+    if p['macro_file'] and macro_weight:
+        if not 0 <= macro_weight <= 100 or macro_speed <= 0 or macro_jitter < 0:
+            raise PlanError("Macro needs a 0-100 priority, a positive speed and a non-negative jitter.")
+        try:
+            macro = open_macro(p['macro_file'])
+        except (OSError, ValueError) as e:
+            raise PlanError(f"Cannot use macro: {e}") from None
+        bad_keys = [key for key in macro.keys if not is_valid_key(key)]
+        if bad_keys:
+            raise PlanError(f"Macro uses unknown key name(s): {', '.join(bad_keys)}")
+    else:
+        macro_weight = 0
+
+    long_keys, tap_keys = parse_keys(p['long_press_keys']), parse_keys(p['tap_keys'])
+    bad_keys = [key for key in long_keys + tap_keys if not is_valid_key(key)]
+    if bad_keys:
+        raise PlanError(f"Unknown key name(s): {', '.join(bad_keys)}")
+    if macro_weight and (long_weight if long_keys else 0) + macro_weight > 100:
+        raise PlanError("Long press and macro priority add up to more than 100%.")
+
+    weights = _calculate_weights(long_keys, tap_keys, long_weight, p['right_click_enabled'], p['scroll_enabled'],
+                                 macro_weight)
+    actions = tuple(action for action, weight in weights.items() if weight > 0)
+    cum_weights = tuple(accumulate(weights[action] for action in actions))
+    return ActionPlan(
+        target=p['target_window'], lock_mode=p['lock_mode'],
+        settle_mode=p['settle_mode'], settle_deadline=settle_deadline,
+        min_delay=min_delay, max_delay=max_delay,
+        mouse_action=bool(p['mouse_action_enabled']),
+        long_keys=long_keys, tap_keys=tap_keys,
+        actions=actions, cum_weights=cum_weights, total_weight=cum_weights[-1] if cum_weights else 0,
+        jiggle_steps=JIGGLE_STEPS, macro=macro, macro_speed=macro_speed, macro_jitter=macro_jitter,
+        conditions=conditions, condition_budget=condition_budget,
+        idle_threshold=idle_threshold, idle_max_defer=idle_max_defer)
+
+
+# --- IDLE DETECTION ---
+
+class IdleSource:
+    """Seconds since the operator last touched the keyboard or mouse, not counting the tool's own input.
+
+    The runner brackets every focus steal with begin_injection()/end_injection(). A
+    last input stamp that falls inside the latest such window (open-ended while it
+    runs, then plus IDLE_INJECTION_SLACK) is taken to be injected, and the operator's
+    last input from before the window is used instead. Worker processes share() one
+    window, so input injected by any worker is not activity to the others.
+    """
+
+    def __init__(self):
+        self._window = [0.0, -1.0, 0.0] # start, end, operator's last input before it; on now()'s clock
+        self._window_lock = contextlib.nullcontext()
+
+    def now(self): raise NotImplementedError
+    def last_input(self): raise NotImplementedError # On now()'s clock; raises OSError if unavailable
+
+    def share(self, window):
+        """Keeps the injection window in a multiprocessing Array('d', 3) shared with other workers."""
+        self._window, self._window_lock = window, window.get_lock()
+
+    def begin_injection(self):
+        start = self.now()
+        try:
+            operator_last = self._operator_last()
+        except OSError:
+            operator_last = start
+        with self._window_lock:
+            self._window[:] = [start, float('inf'), operator_last]
+
+    def end_injection(self):
+        with self._window_lock:
+            self._window[1] = self.now() + IDLE_INJECTION_SLACK
+
+    def _operator_last(self):
+        last = self.last_input()
+        with self._window_lock:
+            start, end, operator_last = self._window[:]
+        return operator_last if start <= last <= end else last
+
+    def idle_seconds(self):
+        return max(0.0, self.now() - self._operator_last())
+
+
+class _LASTINPUTINFO(ctypes.Structure):
+    _fields_ = [('cbSize', wintypes.UINT), ('dwTime', wintypes.DWORD)]
+
+
+class Win32IdleSource(IdleSource):
+    """GetLastInputInfo, widened from its 32-bit tick count against GetTickCount64."""
+
+    def __init__(self):
+        super().__init__()
+        self._info = _LASTINPUTINFO(cbSize=ctypes.sizeof(_LASTINPUTINFO))
+        self._tick64 = ctypes.windll.kernel32.GetTickCount64
+        self._tick64.restype = ctypes.c_ulonglong
+
+    def now(self):
+        return self._tick64() / 1000.0
+
+    def last_input(self):
+        if not ctypes.windll.user32.GetLastInputInfo(ctypes.byref(self._info)):
+            raise ctypes.WinError()
+        now = self._tick64()
+        return (now - ((now - self._info.dwTime) & 0xFFFFFFFF)) / 1000.0
+
+
+class FakeIdleSource(IdleSource):
+    """Operator activity on a fake clock: busy (start, end) intervals of continuous input, plus touch()."""
+
+    def __init__(self, clock, busy=()):
+        super().__init__()
+        self.clock = clock
+        self.busy = sorted(busy) # Must not overlap
+        self._starts = [start for start, _ in self.busy]
+        self._touched = float('-inf') # No input yet
+
+    def now(self):
+        return self.clock()
+
+    def touch(self):
+        """One input event right now."""
+        self._touched = self.clock()
+
+    def last_input(self):
+        now = self.clock()
+        i = bisect.bisect_right(self._starts, now) - 1
+        return max(self._touched, min(now, self.busy[i][1])) if i >= 0 else self._touched
+
+
+# --- SCHEDULING ---
+
+class ScheduleSlot:
+    """One scheduled target: its plan, cycle mode, delay range and next deadline."""
+
+    __slots__ = ('name', 'plan', 'is_fast_mode', 'delay_range', 'anchor', 'deadline', 'fires', 'seq', 'deferred')
+
+    def __init__(self, name, plan, is_fast_mode):
+        self.name, self.plan, self.is_fast_mode = name, plan, is_fast_mode
+        self.delay_range = (plan.min_delay, plan.max_delay)
+        self.anchor = self.deadline = None
+        self.fires = self.seq = 0
+        self.deferred = False # Held past its deadline because the operator was active
+
+
+class CycleScheduler:
+    """Monotonic-deadline heap of targets whose waits wake immediately on stop, pause or reschedule.
+
+    Each slot's next fire time is anchored at the end of its previous cycle, so a
+    delay range change redraws it from that anchor instead of waiting out the old
+    delay. Slots due within batch_window of the earliest one are handed out together
+    so they can share one focus-steal episode. Pausing keeps the time remaining;
+    resuming continues from it. With an advance callable (e.g. FakeBackend.sleep)
+    waits move a virtual clock forward instead of blocking. With an IdleSource, a due
+    slot whose plan sets idle_threshold is held back while the operator is active, up
+    to the plan's idle_max_defer past its deadline.
+    """
+
+    def __init__(self, slots, rng=None, clock=time.monotonic, batch_window=0.0, advance=None, idle=None):
+        self.clock = clock
+        self.advance = advance
+        self.rng = rng or random.Random()
+        self.batch_window = batch_window
+        self.slots = list(slots)
+        self.running, self.paused = True, False
+        self.idle = idle
+        self.fires = self.episodes = self.batched = 0
+        self.deferrals = self.deferred_forced = 0
+        self.deferred_total = self.deferred_max = 0.0
+        self.jitter = deque(maxlen=SCHEDULER_HISTORY) # Seconds each undeferred fire was late
+        self.focus_stolen = 0.0
+        self._cond = threading.Condition()
+        self._started = now = clock()
+        self._paused_at = None
+        self._paused_total = 0.0
+        for seq, slot in enumerate(self.slots):
+            slot.seq = seq # Heap tie-breaker
+            slot.anchor = slot.deadline = now # First cycle fires immediately
+        self._heap = []
+        self._rebuild_heap()
+
+    def _rebuild_heap(self):
+        # Slots that are executing (deadline None) are pushed back by schedule_next()
+        self._heap = [(slot.deadline, slot.seq, slot) for slot in self.slots if slot.deadline is not None]
+        heapq.heapify(self._heap)
+
+    def wait_next(self):
+        """Blocks until the earliest slot is due and returns it plus every slot due within
+        batch_window of it. Returns an empty list once stopped."""
+        with self._cond:
+            while self.running:
+                if self.paused or not self._heap:
+                    self._cond.wait()
+                    continue
+                now = self.clock()
+                fire_at, _, top = self._heap[0]
+                if now < fire_at:
+                    if self.advance is not None: self.advance(fire_at - now)
+                    else: self._cond.wait(fire_at - now)
+                    continue
+                late = now - top.deadline
+                hold = self._idle_hold(top.plan, late)
+                if hold > 0: # Re-queued on its own; slots behind it still fire on time
+                    top.deferred = True
+                    heapq.heapreplace(self._heap, (now + hold, top.seq, top))
+                    continue
+                if not top.deferred: self.jitter.append(late)
+                due, held = [], []
+                horizon = fire_at + self.batch_window
+                while self._heap and self._heap[0][0] <= max(horizon, now):
+                    entry = heapq.heappop(self._heap)
+                    slot = entry[2]
+                    if slot is not top and self._idle_hold(slot.plan, now - slot.deadline) > 0:
+                        held.append(entry) # Not batched in while the operator is active; it gets its own turn
+                        continue
+                    if slot.deferred:
+                        self.deferrals += 1
+                        self.deferred_total += now - slot.deadline
+                        self.deferred_max = max(self.deferred_max, now - slot.deadline)
+                        slot.deferred = False
+                    slot.deadline = None
+                    slot.fires += 1
+                    due.append(slot)
+                for entry in held: heapq.heappush(self._heap, entry)
+                self.fires += len(due)
+                self.batched += len(due) - 1
+                return due
+            return []
+
+    def _idle_hold(self, plan, late):
+        """How much longer a due slot waits for the operator to go idle; 0 means fire now."""
+        if self.idle is None or plan.idle_threshold <= 0: return 0.0
+        try:
+            idle = self.idle.idle_seconds()
+        except OSError:
+            return 0.0 # Cannot tell; behave as without idle detection
+        if idle >= plan.idle_threshold: return 0.0
+        remaining = plan.idle_max_defer - late
+        if remaining <= 0:
+            self.deferred_forced += 1 # Out of postponement: act even though the operator is busy
+            return 0.0
+        return max(IDLE_MIN_HOLD, min(plan.idle_threshold - idle, remaining))
+
+    def schedule_next(self, slots):
+        """Anchors each slot's next fire at now plus a fresh random delay; returns the delays."""
+        with self._cond:
+            now = self.clock()
+            delays = []
+            for slot in slots:
+                delay = self.rng.uniform(*slot.delay_range)
+                slot.anchor, slot.deadline = now, now + delay
+                heapq.heappush(self._heap, (slot.deadline, slot.seq, slot))
+                delays.append(delay)
+            self._cond.notify_all()
+            return delays
+
+    def record_episode(self, focus_stolen):
+        with self._cond:
+            self.episodes += 1
+            self.focus_stolen += focus_stolen
+
+    def update_plan(self, slot, plan):
+        """Swaps in a recompiled plan and redraws the pending deadline if the delay range changed."""
+        with self._cond:
+            slot.plan = plan
+            if (plan.min_delay, plan.max_delay) == slot.delay_range: return
+            slot.delay_range = (plan.min_delay, plan.max_delay)
+            if slot.deadline is None or slot.fires == 0: return
+            now = self._paused_at if self.paused else self.clock()
+            slot.deadline = max(now, slot.anchor + self.rng.uniform(*slot.delay_range))
+            self._rebuild_heap()
+            self._cond.notify_all()
+
+    def time_until_next(self):
+        with self._cond:
+            if not self._heap: return 0.0
+            now = self._paused_at if self.paused else self.clock()
+            return max(0.0, self._heap[0][0] - now)
+
+    def pause(self):
+        with self._cond:
+            if self.paused: return
+            self.paused = True
+            self._paused_at = self.clock()
+            self._cond.notify_all()
+
+    def resume(self):
+        with self._cond:
+            if not self.paused: return
+            shift = self.clock() - self._paused_at
+            self._paused_total += shift
+            for slot in self.slots:
+                slot.anchor += shift
+                if slot.deadline is not None: slot.deadline += shift
+            self.paused, self._paused_at = False, None
+            self._rebuild_heap()
+            self._cond.notify_all()
+
+    def stop(self):
+        with self._cond:
+            self.running = False
+            self._cond.notify_all()
+
+    def focus_stolen_per_hour(self):
+        """Seconds of focus stolen per hour of (unpaused) running time, across all slots."""
+        now = self._paused_at if self.paused else self.clock()
+        active = now - self._started - self._paused_total
+        return self.focus_stolen * 3600.0 / active if active > 0 else 0.0
+
+    def summary(self):
+        stats = self.stats()
+        return (f"Scheduler: {stats['fires']} fires in {stats['episodes']} focus steals "
+                f"({stats['batched']} batched), {stats['focus_stolen_s_per_h']:.1f} s/h focus stolen, "
+                f"jitter p50 {stats['jitter_p50_ms']:.1f} ms, p99 {stats['jitter_p99_ms']:.1f} ms, "
+                f"max {stats['jitter_max_ms']:.1f} ms, {stats['deferrals']} deferred for operator input "
+                f"({stats['deferred_s_total']:.1f} s total, max {stats['deferred_max_s']:.1f} s, "
+                f"{stats['deferred_forced']} at the limit).")
+
+    def stats(self):
+        ordered = sorted(self.jitter)
+        return {'fires': self.fires, 'episodes': self.episodes, 'batched': self.batched,
+                'focus_stolen_s_per_h': self.focus_stolen_per_hour(),
+                'jitter_p50_ms': _percentile(ordered, 50) * 1000,
+                'jitter_p99_ms': _percentile(ordered, 99) * 1000, 'jitter_max_ms': (ordered[-1] if ordered else 0.0) * 1000,
+                'deferrals': self.deferrals, 'deferred_s_total': self.deferred_total,
+                'deferred_max_s': self.deferred_max, 'deferred_forced': self.deferred_forced}
+
+
+# --- INSTRUMENTATION ---
+
+class StreamingHistogram:
+    """Latency histogram over HISTOGRAM_BOUNDS: fixed memory however many samples it sees."""
+    __slots__ = ('counts', 'count', 'total', 'max')
+
+    def __init__(self):
+        self.counts = [0] * (len(HISTOGRAM_BOUNDS) + 1) # Last bucket is +Inf
+        self.count = 0; self.total = 0.0; self.max = 0.0
+
+    def observe(self, seconds):
+        self.counts[bisect.bisect_left(HISTOGRAM_BOUNDS, seconds)] += 1
+        self.count += 1; self.total += seconds
+        if seconds > self.max: self.max = seconds
+
+    def quantile(self, q):
+        """Estimates the q quantile by interpolating inside its bucket, capped at the largest sample."""
+        rank = max(1, q * self.count); running = 0; lower = 0.0
+        for bound, n in zip(HISTOGRAM_BOUNDS, self.counts):
+            if n and running + n >= rank:
+                return min(lower + (bound - lower) * (rank - running) / n, self.max)
+            running += n; lower = bound
+        return self.max
+
+    def summary(self):
+        return {'count': self.count, 'sum_s': self.total, 'mean_ms': self.total * 1000 / self.count if self.count else 0.0,
+                'p50_ms': self.quantile(0.5) * 1000, 'p95_ms': self.quantile(0.95) * 1000,
+                'p99_ms': self.quantile(0.99) * 1000, 'max_ms': self.max * 1000}
+
+
+class CycleMetrics:
+    """Times every cycle phase and weighted action, and counts failures by exception type.
+
+    Samples go into StreamingHistograms, so memory stays fixed over any run length.
+    Snapshots and exports may be taken from any thread.
+    """
+
+    def __init__(self, clock=time.perf_counter):
+        self.clock = clock
+        self.phases = {}  # phase -> StreamingHistogram
+        self.actions = {} # action type -> StreamingHistogram of its input send time
+        self.failures = Counter() # (phase, exception type name) -> count
+        self._lock = threading.Lock()
+
+    def observe(self, table, key, seconds):
+        with self._lock:
+            hist = table.get(key)
+            if hist is None: hist = table[key] = StreamingHistogram()
+            hist.observe(seconds)
+
+    def fail(self, phase, error):
+        with self._lock:
+            self.failures[(phase, type(error).__name__)] += 1
+
+    @contextlib.contextmanager
+    def phase(self, name):
+        """Times the block as phase name; an exception is counted against the phase and re-raised."""
+        start = self.clock()
+        try:
+            yield
+        except Exception as e:
+            self.fail(name, e)
+            raise
+        finally:
+            self.observe(self.phases, name, self.clock() - start)
+
+    def snapshot(self):
+        with self._lock:
+            return {'phases': {name: h.summary() for name, h in sorted(self.phases.items())},
+                    'actions': {name: h.summary() for name, h in sorted(self.actions.items())},
+                    'failures': {f"{phase}/{error}": n for (phase, error), n in sorted(self.failures.items())}}
+
+    def to_json_line(self):
+        return json.dumps(dict(ts=round(time.time(), 3), **self.snapshot()))
+
+    def to_prometheus(self, prefix='focus_lock'):
+        """Renders the histograms and failure counters in the Prometheus text exposition format."""
+        lines = []
+        with self._lock:
+            for metric, label, table, text in (('phase_seconds', 'phase', self.phases, "Time spent in each cycle phase."),
+                                               ('action_seconds', 'action', self.actions, "Input send time per action type.")):
+                name = f"{prefix}_{metric}"
+                lines += [f"# HELP {name} {text}", f"# TYPE {name} histogram"]
+                for key, h in sorted(table.items()):
+                    cumulative = 0
+                    for bound, n in zip(HISTOGRAM_BOUNDS + (None,), h.counts):
+                        cumulative += n
+                        le = '+Inf' if bound is None else f"{bound:.6g}"
+                        lines.append(f'{name}_bucket{{{label}="{key}",le="{le}"}} {cumulative}')
+                    lines.append(f'{name}_sum{{{label}="{key}"}} {h.total:.9g}')
+                    lines.append(f'{name}_count{{{label}="{key}"}} {h.count}')
+            name = f"{prefix}_failures_total"
+            lines += [f"# HELP {name} Cycle failures by phase and exception type.", f"# TYPE {name} counter"]
+            for (phase, error), n in sorted(self.failures.items()):
+                lines.append(f'{name}{{phase="{phase}",exception="{error}"}} {n}')
+        return '\n'.join(lines) + '\n'
+
+
+class MetricsExporter:
+    """Periodically appends a JSON-lines snapshot, or atomically rewrites a Prometheus text file."""
+
+    def __init__(self, metrics, interval=METRICS_EXPORT_INTERVAL):
+        self.metrics = metrics
+        self.interval = interval
+        self.format = 'off' # One of METRICS_FORMATS
+        self._last = None
+
+    def maybe_export(self, force=False):
+        """Writes a snapshot if the interval has passed (or force); raises OSError on write failure."""
+        if self.format == 'off': return
+        now = time.monotonic()
+        if not force and self._last is not None and now - self._last < self.interval: return
+        self._last = now
+        if self.format == 'jsonl':
+            with open(METRICS_FILE, 'a', encoding='utf-8') as f:
+                f.write(self.metrics.to_json_line() + '\n')
+        else:
+            with open(METRICS_PROM_FILE + '.tmp', 'w', encoding='utf-8') as f:
+                f.write(self.metrics.to_prometheus())
+            os.replace(METRICS_PROM_FILE + '.tmp', METRICS_PROM_FILE) # Scrapers never see a half-written file
+
+
+# --- ACTION CYCLES ---
+
+class CycleRunner:
+    """Runs fast or custom action cycles of ActionPlans against an AutomationBackend.
+
+    A cycle is one focus-steal episode: remember the foreground window and mouse,
+    act on one or more targets back to back, then put both back once. Targets are
+    resolved first; only the focus steal itself is serialized through focus_lock (a
+    threading.Lock, or a FairFocusLock shared with other worker processes) so
+    targets never fight over the foreground.
+    """
+
+    def __init__(self, backend, log, status, plan=None, rng=None, focus_lock=None):
+        self.backend = backend
+        self.log_message = log
+        self.update_status = status
+        self.plan = plan # Used by execute_fast_action / execute_custom_action
+        self.rng = rng or random.Random()
+        self.focus_lock = focus_lock or threading.Lock()
+        self.focus_settle_time = None
+        self.action_counts = Counter() # action type -> times performed
+        self.resolvers = {} # (target, lock_mode) -> WindowResolver, one cache per target
+        self.settler = FocusSettler(backend)
+        self.conditions = ScreenConditions(backend)
+        self.idle_source = backend.idle_source() # Told about every focus steal so its input is not 'operator activity'
+        self.metrics = CycleMetrics(clock=backend.now)
+        self._profiler = None
+        self._profile_left = 0
+        self._profile_path = None
+        self.cycle_started = 0.0 # Wall clock when the running episode began, 0 between episodes
+
+    def resolver_stats(self):
+        totals = {'hits': 0, 'misses': 0, 'invalidations': 0}
+        for resolver in self.resolvers.values():
+            for key, value in resolver.stats().items(): totals[key] += value
+        return totals
+
+    def find_target_window(self, plan):
+        """Finds the window object, reusing the cached handle while it is still valid."""
+        if not plan.target: return None
+        key = (plan.target, plan.lock_mode)
+        resolver = self.resolvers.get(key)
+        if resolver is None:
+            resolver = self.resolvers[key] = WindowResolver(self.backend)
+        try:
+            return resolver.resolve(plan.target, plan.lock_mode)
+        except Exception as e: # Backend errors (window gone mid-lookup, access denied) mean 'not found'
+            self.metrics.fail('resolve', e)
+            return None
+        
+    def focus_target_window(self, target_window, previous_hwnd, plan):
+        """CRITICAL FOCUS FUNCTION: Ensures the target window is active."""
+        self.settler.configure(plan.settle_mode, plan.settle_deadline)
+        fixed_wait = FOCUS_SETTLE_WAIT
+        if target_window.isMinimized:
+            target_window.restore()
+            if self.settler.mode == 'fixed': self.backend.sleep(FOCUS_SETTLE_WAIT) # Time to draw window, as before
+            else: fixed_wait += FOCUS_SETTLE_WAIT # The poll waits for the drawn rectangle; tops up to the same total
+
+        self.backend.set_foreground_window(target_window._hWnd)
+        self.focus_settle_time = self.settler.wait_foreground(target_window._hWnd, 'focus', fixed_wait, check_rect=True)
+        if self.focus_settle_time is None:
+            self.log_message("WARNING: Target did not take focus before the settle deadline.", is_warning=True)
+
+        # Setup mouse position for input
+        center_x = target_window.left + target_window.width // 2
+        center_y = target_window.top + target_window.height // 2
+        
+        return center_x, center_y
+
+    def revert_focus(self, previous_hwnd):
+        """Hands the foreground back and confirms it actually went back; None if it could not."""
+        try:
+            self.backend.set_foreground_window(previous_hwnd)
+        except Exception as e: # Previous window closed mid-cycle, or there was none (handle 0)
+            self.metrics.fail('revert', e)
+            self.log_message(f"WARNING: Could not hand focus back ({type(e).__name__}: {e}).", is_warning=True)
+            return None
+        settle_time = self.settler.wait_foreground(previous_hwnd, 'revert', fixed_wait=0.0)
+        if settle_time is None and self.settler.mode != 'fixed': # Fixed mode never waited on the revert, so cannot tell
+            self.log_message("WARNING: Focus revert to the previous window was not confirmed.", is_warning=True)
+        return settle_time
+
+    def _settle_note(self):
+        return f" (focus {self.focus_settle_time * 1000:.0f} ms)" if self.focus_settle_time is not None else ""
+
+    def _jiggle_click(self, plan, batch, center_x, center_y):
+        dx, dy = plan.jiggle(self.rng)
+        batch.move_to(center_x, center_y).move_rel(dx, dy).click()
+
+    def execute_fast_action(self):
+        """Optimized for extreme speed and minimal interruption."""
+        return self.run_episode([(self.plan, True, None)])
+
+    def execute_custom_action(self):
+        """The full, weighted, multi-input action sequence."""
+        return self.run_episode([(self.plan, False, None)])
+
+    def start_profile(self, cycles=PROFILE_CYCLES, path=PROFILE_DUMP_FILE):
+        """Runs the next `cycles` episodes under cProfile, then dumps the stats to path."""
+        import cProfile
+        self._profile_left, self._profile_path = cycles, path
+        self._profiler = cProfile.Profile()
+
+    def _finish_profile(self):
+        profiler, self._profiler = self._profiler, None
+        try:
+            profiler.dump_stats(self._profile_path)
+            self.log_message(f"Profile of the last cycles written to {os.path.abspath(self._profile_path)}.")
+        except OSError as e:
+            self.log_message(f"WARNING: Could not write profile: {e}", is_warning=True)
+
+    def run_episode(self, steps):
+        """Acts on every (plan, is_fast_mode, name) step inside one focus steal.
+
+        Returns how long focus was away from the previously active window (0 if no
+        target was found).
+        """
+        profiler = self._profiler
+        self.cycle_started = time.time() # Stays set if the cycle hangs, e.g. in SetForegroundWindow
+        if profiler is not None: profiler.enable() # Profiles the calling (worker) thread only
+        try:
+            return self._run_episode(steps)
+        finally:
+            self.cycle_started = 0.0
+            if profiler is not None:
+                profiler.disable()
+                self._profile_left -= 1
+                if self._profile_left <= 0: self._finish_profile()
+
+    def run_schedule(self, scheduler, episodes, max_cycles=None, after_episode=None):
+        """The cycle loop behind the GUI thread and headless runs: one episode per batch of due slots.
+
+        Runs until the scheduler stops (or max_cycles episodes), appending each episode's
+        focus-stolen seconds to episodes. after_episode(focus_stolen) runs once the
+        episode is recorded, before the slots are rescheduled.
+        """
+        while max_cycles is None or len(episodes) < max_cycles:
+            due = scheduler.wait_next()
+            if not due: break
+            self.update_status("Running")
+            try:
+                focus_stolen = self.run_episode([(slot.plan, slot.is_fast_mode, slot.name) for slot in due])
+            except Exception as e: # Counted by the episode phase; one bad cycle must not end the loop
+                self.log_message(f"CRITICAL ERROR: Cycle failed ({type(e).__name__}: {e}).", is_warning=True)
+                focus_stolen = 0.0
+            scheduler.record_episode(focus_stolen)
+            episodes.append(focus_stolen)
+            if after_episode is not None: after_episode(focus_stolen)
+            for slot, wait_time in zip(due, scheduler.schedule_next(due)):
+                prefix = f"[{slot.name}] " if slot.name else ""
+                self.log_message(f"{prefix}Next action in: {wait_time:.2f} seconds.")
+        return episodes
+
+    def _run_episode(self, steps):
+        m = self.metrics
+        with m.phase('episode'):
+            targets = [] # Resolved before queueing for focus: lookups can be slow and need no foreground
+            for plan, is_fast_mode, name in steps:
+                with m.phase('resolve'):
+                    target_window = self.find_target_window(plan)
+                if target_window is not None: targets.append((plan, is_fast_mode, name, target_window))
+                elif name: self.log_message(f"[{name}] Waiting for target '{plan.target}'.")
+                else: self.update_status("Waiting for Target...")
+            if not targets: return 0.0
+
+            for plan, _, _, target_window in targets: # Waiting on the screen needs no foreground, so never holds focus
+                if target_window.isMinimized or not any(c.mode == 'wait_match' for c in plan.conditions): continue
+                with m.phase('conditions'):
+                    self.conditions.begin(plan.condition_budget)
+                    self.conditions.wait(plan, target_window)
+
+            with m.phase('lock'):
+                self.focus_lock.acquire()
+            idle = self.idle_source
+            try:
+                if idle is not None: idle.begin_injection() # Inside the lock: no other worker injects meanwhile
+                return self._steal_focus(targets)
+            finally:
+                if idle is not None: idle.end_injection()
+                self.focus_lock.release()
+
+    def _steal_focus(self, targets):
+        """The serialized part of an episode: focus, check, plan and send per target, then revert once."""
+        m = self.metrics
+        previous_hwnd = self.backend.get_foreground_window()
+        original_mouse_x, original_mouse_y = self.backend.mouse_position()
+        stolen_at = self.backend.now()
+        mouse_restored = False
+
+        for index, (plan, is_fast_mode, name, target_window) in enumerate(targets):
+            prefix = f"[{name}] " if name else ""
+            try:
+                with m.phase('focus'):
+                    center_x, center_y = self.focus_target_window(target_window, previous_hwnd, plan)
+                if plan.conditions:
+                    with m.phase('conditions'):
+                        self.conditions.begin(plan.condition_budget)
+                        held_back = self.conditions.check(plan, target_window, 'cycle')
+                    if held_back:
+                        self.action_counts['held_back'] += 1
+                        self.log_message(f"{prefix}SKIPPED: {held_back}{self._settle_note()}")
+                        continue
+                batch = InputBatch()
+                with m.phase('plan'):
+                    if is_fast_mode:
+                        action, summary = self._fast_actions(plan, batch, center_x, center_y, target_window)
+                    else:
+                        action, summary = self._custom_actions(plan, batch, center_x, center_y, target_window)
+                restores_mouse = index == len(targets) - 1
+                if restores_mouse:
+                    batch.move_to(original_mouse_x, original_mouse_y) # Restore rides along with the last batch
+                with m.phase('send'):
+                    sent_at = m.clock()
+                    self.backend.send_batch(batch)
+                    m.observe(m.actions, action, m.clock() - sent_at)
+                mouse_restored = restores_mouse # Only once the send went through
+                self.log_message(f"{prefix}EXECUTED: {summary}{self._settle_note()}")
+            except Exception as e: # Already counted against its phase by m.phase
+                what = "WARNING: Fast action failed" if is_fast_mode else "CRITICAL ERROR: Action failed. Reverting focus"
+                self.log_message(f"{prefix}{what} ({type(e).__name__}: {e}).", is_warning=True)
+
+        # Revert focus
+        with m.phase('revert'):
+            if not mouse_restored:
+                try:
+                    self.backend.send_batch(InputBatch().move_to(original_mouse_x, original_mouse_y))
+                except Exception as e:
+                    m.fail('revert', e)
+                    self.log_message(f"WARNING: Could not restore the mouse ({type(e).__name__}: {e}).", is_warning=True)
+            self.revert_focus(previous_hwnd)
+        return self.backend.now() - stolen_at
+
+    def _allowed(self, plan, target_window, scope, action_log):
+        """Checks the screen conditions scoped to one action; notes in action_log why it was held back."""
+        if not plan.conditions: return True
+        reason = self.conditions.check(plan, target_window, scope)
+        if reason: action_log.append(f"{scope} held back ({reason})")
+        return reason is None
+
+    def _fast_actions(self, plan, batch, center_x, center_y, target_window):
+        # --- FAST ACTION: Minimal Jiggle & Click ---
+        action_log = []
+        if not self._allowed(plan, target_window, 'jiggle_click', action_log):
+            return 'none', action_log[0]
+        self._jiggle_click(plan, batch, center_x, center_y)
+        self.action_counts['jiggle_click'] += 1
+        return 'jiggle_click', "🚀 Fast Jiggle+Click."
+
+    def _custom_actions(self, plan, batch, center_x, center_y, target_window):
+        action_log = []
+
+        # --- MOUSE JIGGLE (If enabled) ---
+        if plan.mouse_action and self._allowed(plan, target_window, 'jiggle_click', action_log):
+            self._jiggle_click(plan, batch, center_x, center_y)
+            self.action_counts['jiggle_click'] += 1
+            action_log.append("Jiggle+LClick")
+        
+        # --- WEIGHTED ACTION ---
+        chosen_action_type = plan.pick_action(self.rng)
+        if chosen_action_type and not self._allowed(plan, target_window, chosen_action_type, action_log):
+            chosen_action_type = None
+        if chosen_action_type: self.action_counts[chosen_action_type] += 1
+            
+        if chosen_action_type == 'long_press':
+            action_key = self.rng.choice(plan.long_keys)
+            batch.hold(action_key, LONG_PRESS_DURATION)
+            action_log.append(f"Long Press: {action_key.upper()}")
+                
+        elif chosen_action_type == 'tap_press':
+            action_key = self.rng.choice(plan.tap_keys)
+            batch.press(action_key)
+            action_log.append(f"Tap: {action_key.upper()}")
+            
+        elif chosen_action_type == 'right_click':
+            batch.right_click(center_x, center_y)
+            action_log.append("Right Click")
+                
+        elif chosen_action_type == 'scroll':
+            scroll_amount = self.rng.choice(SCROLL_STEPS) 
+            batch.scroll(scroll_amount)
+            action_log.append(f"Scroll: {'Up' if scroll_amount > 0 else 'Down'}")
+
+        elif chosen_action_type == 'macro':
+            w = target_window
+            batch.stream(plan.macro.play(w.left, w.top, w.width, w.height, plan.macro_speed, plan.macro_jitter, self.rng))
+            action_log.append(f"Macro: {os.path.basename(plan.macro.path)} ({plan.macro.duration / plan.macro_speed:.1f} s)")
+
+        action = chosen_action_type or ('jiggle_click' if plan.mouse_action else 'none')
+        return action, ', '.join(action_log) if action_log else 'Mouse Jiggle Only'
+
+
+class AfkGuiApp:
+    def __init__(self, master, backend=None):
+        self.master = master
+        master.title("Focus-Lock Automator v6.0")
+        master.resizable(False, False)
+
+        # State & Config Variables
+        self.is_running = False
+        self.is_paused = False
+        self.afk_thread = None
+        self.scheduler = None
+        self.single_slot = None # The slot driven by the GUI settings; None in multi-target mode
+        self.profiles = ProfileStore()
+        
+        # Configuration Variables (Defaults are non-persistent)
+        d = DEFAULT_PROFILE
+        self.target_window_title = tk.StringVar(value=d['target_window'])
+        self.lock_mode_var = tk.StringVar(value=d['lock_mode'])
+        self.settle_mode_var = tk.StringVar(value=d['settle_mode'])
+        self.settle_deadline_var = tk.DoubleVar(value=d['settle_deadline'])
+        self.min_delay_var = tk.DoubleVar(value=d['min_delay'])
+        self.max_delay_var = tk.DoubleVar(value=d['max_delay'])
+        self.long_press_weight_var = tk.IntVar(value=d['long_press_weight'])
+        self.mouse_action_enabled = tk.BooleanVar(value=d['mouse_action_enabled']) # Jiggle & Left Click
+        self.right_click_enabled = tk.BooleanVar(value=d['right_click_enabled'])
+        self.scroll_enabled = tk.BooleanVar(value=d['scroll_enabled'])
+        self.long_press_keys = tk.StringVar(value=d['long_press_keys']) 
+        self.tap_keys = tk.StringVar(value=d['tap_keys']) 
+        self.macro_file_var = tk.StringVar(value=d['macro_file'])
+        self.macro_weight_var = tk.IntVar(value=d['macro_weight'])
+        self.macro_speed_var = tk.DoubleVar(value=d['macro_speed'])
+        self.macro_jitter_var = tk.DoubleVar(value=d['macro_jitter'])
+        self.macro_recorder = None
+        self.screen_conditions_var = tk.StringVar(value=d['screen_conditions'])
+        self.condition_budget_var = tk.DoubleVar(value=d['condition_budget'])
+        self.idle_threshold_var = tk.DoubleVar(value=d['idle_threshold'])
+        self.idle_max_defer_var = tk.DoubleVar(value=d['idle_max_defer'])
+        self.profile_name_var = tk.StringVar(value="New Profile")
+        self.log_to_file_var = tk.BooleanVar(value=False)
+        self.metrics_format_var = tk.StringVar(value='off')
+        self.multi_targets = [] # (profile name, cycle mode)
+        self.multi_profile_var = tk.StringVar(value="")
+        self.multi_mode_var = tk.StringVar(value='custom')
+        self.batch_window_var = tk.DoubleVar(value=MULTI_BATCH_WINDOW)
+        self.multi_processes_var = tk.BooleanVar(value=False)
+        self.worker_pool = None # Multi-target run in worker processes
+        self.log_pipeline = LogPipeline()
+        if self.profiles.imported: self.log_message(f"Imported {self.profiles.imported} profiles from {PROFILES_FILE}.")
+        for name, error in self.profiles.skipped:
+            self.log_message(f"WARNING: Profile '{name}' in {PROFILES_FILE} not imported: {error}", is_warning=True)
+        if self.profiles.import_error:
+            self.log_message(f"WARNING: Old profiles not imported, will retry next start: {self.profiles.import_error}",
+                             is_warning=True)
+        self.window_search_var = tk.StringVar(value="")
+        self.window_search_mode_var = tk.StringVar(value='substring')
+        self.window_index = WindowIndex()
+        self._window_scans = queue.SimpleQueue() # Enumerations finished off the main thread
+        self._scan_thread = None
+
+        # Profile key -> Tk variable, in DEFAULT_PROFILE order
+        self.profile_vars = {
+            'target_window': self.target_window_title, 'lock_mode': self.lock_mode_var,
+            'settle_mode': self.settle_mode_var, 'settle_deadline': self.settle_deadline_var,
+            'min_delay': self.min_delay_var, 'max_delay': self.max_delay_var,
+            'long_press_weight': self.long_press_weight_var, 'mouse_action_enabled': self.mouse_action_enabled,
+            'right_click_enabled': self.right_click_enabled, 'scroll_enabled': self.scroll_enabled,
+            'long_press_keys': self.long_press_keys, 'tap_keys': self.tap_keys,
+            'macro_file': self.macro_file_var, 'macro_weight': self.macro_weight_var,
+            'macro_speed': self.macro_speed_var, 'macro_jitter': self.macro_jitter_var,
+            'screen_conditions': self.screen_conditions_var, 'condition_budget': self.condition_budget_var,
+            'idle_threshold': self.idle_threshold_var, 'idle_max_defer': self.idle_max_defer_var,
+        }
+
+        self.backend = backend or Win32Backend()
+        self.runner = CycleRunner(self.backend, self.log_message, self.update_status)
+        self.metrics_exporter = MetricsExporter(self.runner.metrics)
+        self.plan_error = None
+        self._plan_rebuild_pending = False
+        
+        self._create_widgets()
+        for var in self.profile_vars.values():
+            var.trace_add('write', self._on_setting_changed)
+        self._rebuild_plan()
+        self._drain_log()
+        master.protocol("WM_DELETE_WINDOW", self.on_closing)
+
+    # --- PROFILE MANAGEMENT ---
+
+    def save_profile(self):
+        """Saves current GUI settings to a named profile in the profile store."""
+        profile_name = self.profile_name_var.get().strip()
+        if not profile_name:
+            messagebox.showerror("Error", "Please enter a valid profile name.")
+            return
+
+        try:
+            self.profiles.save(profile_name, {key: var.get() for key, var in self.profile_vars.items()})
+            self.log_message(f"Profile '{profile_name}' saved successfully.")
+        except (sqlite3.Error, tk.TclError) as e:
+            self.log_message(f"ERROR: Could not save profile: {e}", is_warning=True)
+
+    def load_profile(self):
+        """Loads settings from a named profile into the GUI."""
+        profile_name = self.profile_name_var.get().strip()
+        profile = self.profiles.load(profile_name)
+        
+        if profile is not None:
+            for key, var in self.profile_vars.items():
+                var.set(profile.get(key, var.get()))
+            
+            self.log_message(f"Profile '{profile_name}' loaded.")
+            self.refresh_windows() # Ensure window list is current
+        else:
+            messagebox.showerror("Error", f"Profile '{profile_name}' not found.")
+
+    # --- GUI CONSTRUCTION ---
+
+    def _create_widgets(self):
+        
+        main_frame = ttk.Frame(self.master, padding="10")
+        main_frame.grid(row=0, column=0, sticky=(tk.W, tk.E, tk.N, tk.S))
+
+        # --- Frame 1: Window Selection ---
+        window_frame = ttk.LabelFrame(main_frame, text="1. Target Application")
+        window_frame.grid(row=0, column=0, columnspan=2, pady=5, sticky="ew")
+
+        ttk.Label(window_frame, text="Select Window:").grid(row=0, column=0, padx=5, pady=5, sticky="w")
+        self.window_selector = ttk.Combobox(window_frame, textvariable=self.target_window_title, width=35, state='readonly')
+        self.window_selector.grid(row=0, column=1, padx=5, pady=5, sticky="ew")
+        
+        self.refresh_button = ttk.Button(window_frame, text="Refresh", command=self.refresh_windows)
+        self.refresh_button.grid(row=0, column=2, padx=5, pady=5)
+
+        ttk.Label(window_frame, text="Search:").grid(row=1, column=0, padx=5, pady=5, sticky="w")
+        ttk.Entry(window_frame, textvariable=self.window_search_var, width=35).grid(row=1, column=1, padx=5, pady=5, sticky="ew")
+        ttk.Combobox(window_frame, textvariable=self.window_search_mode_var, values=WINDOW_SEARCH_MODES, width=10,
+                     state='readonly').grid(row=1, column=2, padx=5, pady=5)
+        self.window_search_var.trace_add('write', self._apply_window_filter)
+        self.window_search_mode_var.trace_add('write', self._apply_window_filter)
+
+        ttk.Label(window_frame, text="Lock By:").grid(row=2, column=0, padx=5, pady=5, sticky="w")
+        ttk.Combobox(window_frame, textvariable=self.lock_mode_var, values=TARGET_LOCK_MODES, width=10,
+                     state='readonly').grid(row=2, column=1, padx=5, pady=5, sticky="w")
+
+        ttk.Label(window_frame, text="Focus Settle:").grid(row=3, column=0, padx=5, pady=5, sticky="w")
+        settle_frame = ttk.Frame(window_frame)
+        settle_frame.grid(row=3, column=1, columnspan=2, sticky="w")
+        ttk.Combobox(settle_frame, textvariable=self.settle_mode_var, values=SETTLE_MODES, width=10,
+                     state='readonly').grid(row=0, column=0, padx=5, pady=5)
+        ttk.Label(settle_frame, text="Deadline (s):").grid(row=0, column=1, padx=5, pady=5)
+        ttk.Entry(settle_frame, textvariable=self.settle_deadline_var, width=6).grid(row=0, column=2, padx=5, pady=5)
+
+        ttk.Label(window_frame, text="Wait for Idle (s):").grid(row=4, column=0, padx=5, pady=5, sticky="w")
+        idle_frame = ttk.Frame(window_frame)
+        idle_frame.grid(row=4, column=1, columnspan=2, sticky="w")
+        ttk.Entry(idle_frame, textvariable=self.idle_threshold_var, width=6).grid(row=0, column=0, padx=5, pady=5)
+        ttk.Label(idle_frame, text="Max Defer (s):").grid(row=0, column=1, padx=5, pady=5)
+        ttk.Entry(idle_frame, textvariable=self.idle_max_defer_var, width=6).grid(row=0, column=2, padx=5, pady=5)
+        self.refresh_windows()
+
+        # --- Notebook (Tabs) ---
+        self.notebook = ttk.Notebook(main_frame)
+        self.notebook.grid(row=1, column=0, columnspan=2, pady=5, sticky="ew")
+
+        # Create Tab Frames
+        self.fast_tab = ttk.Frame(self.notebook, padding="5")
+        self.custom_tab = ttk.Frame(self.notebook, padding="5")
+
+        self.notebook.add(self.fast_tab, text='🚀 Fast Mode')
+        self.multi_tab = ttk.Frame(self.notebook, padding="5")
+        self.notebook.add(self.custom_tab, text='⚙️ Custom Mode')
+        self.notebook.add(self.multi_tab, text='🎯 Multi-Target')
+
+        self._build_fast_tab()
+        self._build_custom_tab()
+        self._build_multi_tab()
+        self._build_control_widgets(main_frame)
+
+    def _build_fast_tab(self):
+        # A simple, quick click mode (Fastest Execution)
+        ttk.Label(self.fast_tab, text="Mode: Optimized for minimal interruption. Performs a single, fast Jiggle+Click every interval.", wraplength=400).grid(row=0, column=0, columnspan=3, pady=5, sticky="w")
+        
+        ttk.Label(self.fast_tab, text="Min Delay (s):").grid(row=1, column=0, padx=5, pady=5, sticky="w")
+        ttk.Entry(self.fast_tab, textvariable=self.min_delay_var, width=10).grid(row=1, column=1, padx=5, pady=5)
+
+        ttk.Label(self.fast_tab, text="Max Delay (s):").grid(row=2, column=0, padx=5, pady=5, sticky="w")
+        ttk.Entry(self.fast_tab, textvariable=self.max_delay_var, width=10).grid(row=2, column=1, padx=5, pady=5)
+
+    def _build_custom_tab(self):
+        # --- Custom Actions ---
+        action_frame = ttk.LabelFrame(self.custom_tab, text="Custom Actions (Comma separated list)")
+        action_frame.grid(row=0, column=0, columnspan=2, pady=5, sticky="ew")
+        
+        # Mouse Actions
+        ttk.Label(action_frame, text="Mouse Actions:").grid(row=0, column=0, padx=5, pady=5, sticky="w")
+        ttk.Checkbutton(action_frame, text="Jiggle & LClick", variable=self.mouse_action_enabled).grid(row=0, column=1, padx=5, pady=5, sticky="w")
+        ttk.Checkbutton(action_frame, text="Right Click", variable=self.right_click_enabled).grid(row=0, column=2, padx=5, pady=5, sticky="w")
+        ttk.Checkbutton(action_frame, text="Scroll", variable=self.scroll_enabled).grid(row=0, column=3, padx=5, pady=5, sticky="w")
+        
+        # Key Actions
+        ttk.Label(action_frame, text="Long Press:").grid(row=1, column=0, padx=5, pady=5, sticky="w")
+        ttk.Entry(action_frame, textvariable=self.long_press_keys, width=50).grid(row=1, column=1, columnspan=3, padx=5, pady=5, sticky="ew")
+
+        ttk.Label(action_frame, text="Tap Press:").grid(row=2, column=0, padx=5, pady=5, sticky="w")
+        ttk.Entry(action_frame, textvariable=self.tap_keys, width=50).grid(row=2, column=1, columnspan=3, padx=5, pady=5, sticky="ew")
+
+        ttk.Label(action_frame, text="Screen Conditions:").grid(row=3, column=0, padx=5, pady=5, sticky="w")
+        ttk.Entry(action_frame, textvariable=self.screen_conditions_var, width=36).grid(row=3, column=1, columnspan=2, padx=5, pady=5, sticky="ew")
+        budget_frame = ttk.Frame(action_frame)
+        budget_frame.grid(row=3, column=3, sticky="e")
+        ttk.Label(budget_frame, text="Budget (s):").grid(row=0, column=0, padx=5)
+        ttk.Entry(budget_frame, textvariable=self.condition_budget_var, width=5).grid(row=0, column=1, padx=5)
+        
+        # --- Timing & Priority ---
+        settings_frame = ttk.LabelFrame(self.custom_tab, text="Timing & Priority")
+        settings_frame.grid(row=1, column=0, pady=5, sticky="nw")
+
+        ttk.Label(settings_frame, text="Min Delay (s):").grid(row=0, column=0, padx=5, pady=5, sticky="w")
+        ttk.Entry(settings_frame, textvariable=self.min_delay_var, width=10).grid(row=0, column=1, padx=5, pady=5)
+
+        ttk.Label(settings_frame, text="Max Delay (s):").grid(row=1, column=0, padx=5, pady=5, sticky="w")
+        ttk.Entry(settings_frame, textvariable=self.max_delay_var, width=10).grid(row=1, column=1, padx=5, pady=5)
+        
+        ttk.Label(settings_frame, text="Long Press Priority (%):").grid(row=2, column=0, padx=5, pady=5, sticky="w")
+        ttk.Scale(settings_frame, from_=0, to=100, variable=self.long_press_weight_var, orient=tk.HORIZONTAL, length=100).grid(row=2, column=1, padx=5, pady=5)
+        ttk.Label(settings_frame, textvariable=self.long_press_weight_var).grid(row=2, column=2, padx=5, pady=5)
+
+        # --- Macro (Row 1, Column 1) ---
+        macro_frame = ttk.LabelFrame(self.custom_tab, text="Macro")
+        macro_frame.grid(row=1, column=1, pady=5, padx=5, sticky="nw")
+
+        ttk.Label(macro_frame, text="File:").grid(row=0, column=0, padx=5, pady=5, sticky="w")
+        ttk.Entry(macro_frame, textvariable=self.macro_file_var, width=16).grid(row=0, column=1, columnspan=2, padx=5, pady=5)
+        self.record_button = ttk.Button(macro_frame, text="Record", command=self.toggle_macro_recording)
+        self.record_button.grid(row=0, column=3, padx=5, pady=5)
+
+        ttk.Label(macro_frame, text="Priority (%):").grid(row=1, column=0, padx=5, pady=5, sticky="w")
+        ttk.Scale(macro_frame, from_=0, to=100, variable=self.macro_weight_var, orient=tk.HORIZONTAL, length=80).grid(row=1, column=1, columnspan=2, padx=5, pady=5)
+        ttk.Label(macro_frame, textvariable=self.macro_weight_var).grid(row=1, column=3, padx=5, pady=5)
+
+        ttk.Label(macro_frame, text="Speed (x):").grid(row=2, column=0, padx=5, pady=5, sticky="w")
+        ttk.Entry(macro_frame, textvariable=self.macro_speed_var, width=5).grid(row=2, column=1, padx=5, pady=5)
+        ttk.Label(macro_frame, text="Jitter (s):").grid(row=2, column=2, padx=5, pady=5, sticky="w")
+        ttk.Entry(macro_frame, textvariable=self.macro_jitter_var, width=5).grid(row=2, column=3, padx=5, pady=5)
+
+    def _build_multi_tab(self):
+        # Several saved profiles on one deadline heap, sharing focus steals
+        ttk.Label(self.multi_tab, text="Mode: Runs several saved profiles, each with its own delays. Targets that come due together share one focus steal.", wraplength=400).grid(row=0, column=0, columnspan=4, pady=5, sticky="w")
+
+        self.multi_listbox = tk.Listbox(self.multi_tab, height=5, width=36)
+        self.multi_listbox.grid(row=1, column=0, columnspan=2, rowspan=3, padx=5, pady=5, sticky="nsew")
+
+        ttk.Label(self.multi_tab, text="Profile:").grid(row=1, column=2, padx=5, pady=5, sticky="w")
+        ttk.Entry(self.multi_tab, textvariable=self.multi_profile_var, width=15).grid(row=1, column=3, padx=5, pady=5)
+        ttk.Combobox(self.multi_tab, textvariable=self.multi_mode_var, values=CYCLE_MODES, width=8,
+                     state='readonly').grid(row=2, column=2, padx=5, pady=5)
+        button_frame = ttk.Frame(self.multi_tab)
+        button_frame.grid(row=2, column=3, sticky="w")
+        ttk.Button(button_frame, text="Add", command=self.add_multi_target, width=7).grid(row=0, column=0, padx=2)
+        ttk.Button(button_frame, text="Remove", command=self.remove_multi_target, width=7).grid(row=0, column=1, padx=2)
+
+        ttk.Label(self.multi_tab, text="Batch Window (s):").grid(row=3, column=2, padx=5, pady=5, sticky="w")
+        ttk.Entry(self.multi_tab, textvariable=self.batch_window_var, width=10).grid(row=3, column=3, padx=5, pady=5, sticky="w")
+        ttk.Checkbutton(self.multi_tab, text="One process per profile (shared focus lock, no batching)",
+                        variable=self.multi_processes_var).grid(row=4, column=0, columnspan=4, padx=5, sticky="w")
+        self.worker_health_label = ttk.Label(self.multi_tab, text="", justify=tk.LEFT, font=('Consolas', 8))
+        self.worker_health_label.grid(row=5, column=0, columnspan=4, padx=5, sticky="w")
+
+    def add_multi_target(self):
+        name = self.multi_profile_var.get().strip() or self.profile_name_var.get().strip()
+        if not name: return
+        self.multi_targets.append((name, self.multi_mode_var.get()))
+        self.multi_listbox.insert(tk.END, f"{name}  ({self.multi_mode_var.get()})")
+
+    def remove_multi_target(self):
+        for index in reversed(self.multi_listbox.curselection()):
+            self.multi_listbox.delete(index)
+            del self.multi_targets[index]
+
+    def _build_multi_slots(self):
+        """Compiles every multi-target profile into a ScheduleSlot; raises PlanError on the first bad one."""
+        if not self.multi_targets:
+            raise PlanError("Add at least one saved profile to the Multi-Target list.")
+        slots = []
+        for name, mode in self.multi_targets:
+            profile = self.profiles.load(name)
+            if profile is None:
+                raise PlanError(f"Profile '{name}' not found.")
+            try:
+                plan = compile_plan(profile, self.backend.is_valid_key)
+            except PlanError as e:
+                raise PlanError(f"Profile '{name}': {e}") from None
+            slots.append(ScheduleSlot(name, plan, mode == 'fast'))
+        return slots
+
+    def _build_control_widgets(self, main_frame):
+        # --- Profile Management (Row 2, Column 0) ---
+        profile_frame = ttk.LabelFrame(main_frame, text="2. Profiles")
+        profile_frame.grid(row=2, column=0, pady=5, padx=5, sticky="ew")
+        
+        ttk.Label(profile_frame, text="Name:").grid(row=0, column=0, padx=5, pady=5, sticky="w")
+        ttk.Entry(profile_frame, textvariable=self.profile_name_var, width=15).grid(row=0, column=1, padx=5, pady=5)
+        ttk.Button(profile_frame, text="Save", command=self.save_profile).grid(row=0, column=2, padx=5, pady=5)
+        ttk.Button(profile_frame, text="Load", command=self.load_profile).grid(row=0, column=3, padx=5, pady=5)
+
+        # --- Control & Status (Row 2, Column 1) ---
+        control_frame = ttk.LabelFrame(main_frame, text="3. Control & Status")
+        control_frame.grid(row=2, column=1, pady=5, sticky="ne")
+        
+        self.status_label = ttk.Label(control_frame, text="Status: Stopped", font=('Arial', 10, 'bold'))
+        self.status_label.grid(row=0, column=0, columnspan=3, pady=5)
+
+        self.start_button = ttk.Button(control_frame, text="Start", command=self.start_afk, style='Accent.TButton')
+        self.start_button.grid(row=1, column=0, padx=5, pady=5)
+        
+        self.pause_button = ttk.Button(control_frame, text="Pause", command=self.pause_afk, state=tk.DISABLED)
+        self.pause_button.grid(row=1, column=1, padx=5, pady=5)
+        
+        self.stop_button = ttk.Button(control_frame, text="Stop", command=self.stop_afk, state=tk.DISABLED)
+        self.stop_button.grid(row=1, column=2, padx=5, pady=5)
+
+        # --- Logger (Row 3) ---
+        log_frame = ttk.LabelFrame(main_frame, text="Activity Log")
+        log_frame.grid(row=3, column=0, columnspan=2, pady=5, sticky="ew")
+
+        self.log_text = tk.Text(log_frame, height=5, state=tk.DISABLED, wrap='word', bg='#f0f0f0', borderwidth=1, relief="sunken")
+        self.log_text.grid(row=0, column=0, sticky="nsew")
+        self.log_text.tag_configure('warning', foreground='#B22222')
+        ttk.Checkbutton(log_frame, text=f"Save to {LOG_FILE}", variable=self.log_to_file_var,
+                        command=self.toggle_log_file).grid(row=1, column=0, padx=5, sticky="w")
+        metrics_frame = ttk.Frame(log_frame)
+        metrics_frame.grid(row=2, column=0, sticky="w")
+        ttk.Label(metrics_frame, text="Metrics:").grid(row=0, column=0, padx=5)
+        ttk.Combobox(metrics_frame, textvariable=self.metrics_format_var, values=METRICS_FORMATS, width=10,
+                     state='readonly').grid(row=0, column=1, padx=5)
+        self.metrics_format_var.trace_add('write', self.set_metrics_format)
+        ttk.Button(metrics_frame, text=f"Profile {PROFILE_CYCLES} Cycles", command=self.profile_cycles).grid(row=0, column=2, padx=5)
+
+        # Style
+        style = ttk.Style()
+        style.theme_use('clam')
+        style.configure('Accent.TButton', foreground='white', background='#32CD32', borderwidth=0, relief='flat')
+        style.map('Accent.TButton', background=[('active', '#228B22')])
+
+    # --- ACTION LOGIC ---
+
+    def log_message(self, message, is_warning=False):
+        """Queues a message for the GUI log; safe to call from any thread."""
+        self.log_pipeline.push(message, 'warning' if is_warning else 'info')
+
+    def update_status(self, status):
+        """Queues the current run state for the control frame; safe to call from any thread."""
+        self.log_pipeline.set_status(status)
+
+    def _poll_workers(self):
+        """Forwards worker log lines and refreshes the health table from the pool's shared stats."""
+        pool = self.worker_pool
+        for name, r in pool.drain_logs():
+            self.log_pipeline.push(f"[{name}] {r.message}", r.level)
+        for name in pool.reap():
+            self.log_message(f"[{name}] WARNING: Worker exited unexpectedly.", is_warning=True)
+        rows = pool.snapshot()
+        self.worker_health_label.config(text='\n'.join(format_worker_health(rows)))
+        if self.is_running and not pool.alive():
+            self.is_running = self.is_paused = False
+            self.log_message("All workers have stopped.")
+            self.update_status("Stopped")
+            self._set_control_states()
+
+    def _drain_log(self):
+        """Main-thread timer: moves queued records into the log widget in one insert."""
+        if self.worker_pool is not None: self._poll_workers()
+        records = self.log_pipeline.drain()
+        if records:
+            chunks = []
+            for r in records:
+                chunks += [f"{time.strftime('[%H:%M:%S]', time.localtime(r.timestamp))} {r.message}\n",
+                           ('warning',) if r.level == 'warning' else ()]
+            self.log_text.config(state=tk.NORMAL)
+            self.log_text.insert(tk.END, *chunks)
+            excess = int(self.log_text.index('end-1c').split('.')[0]) - 1 - LOG_MAX_LINES
+            if excess > 0: self.log_text.delete('1.0', f'{excess + 1}.0')
+            self.log_text.see(tk.END)
+            self.log_text.config(state=tk.DISABLED)
+
+        status = self.log_pipeline.take_status()
+        if status is not None:
+            self.status_label.config(text=f"Status: {status}")
+        self.master.after(LOG_DRAIN_INTERVAL_MS, self._drain_log)
+
+    def set_metrics_format(self, *_):
+        """Switches the periodic metrics export; the worker picks it up after its next cycle."""
+        fmt = self.metrics_format_var.get()
+        self.metrics_exporter.format = fmt
+        if fmt != 'off' and not self._workers_active("Metrics export"):
+            path = METRICS_FILE if fmt == 'jsonl' else METRICS_PROM_FILE
+            self.log_message(f"Exporting metrics every {METRICS_EXPORT_INTERVAL:.0f} s to {os.path.abspath(path)}.")
+
+    def _workers_active(self, what):
+        """Warns and returns True while worker processes run: what only covers this process's runner."""
+        if self.worker_pool is None or not self.worker_pool.alive(): return False
+        self.log_message(f"WARNING: {what} covers the in-process runner only, not the worker processes.", is_warning=True)
+        return True
+
+    def profile_cycles(self):
+        if self._workers_active("Profiling"): return
+        self.runner.start_profile(PROFILE_CYCLES, PROFILE_DUMP_FILE)
+        self.log_message(f"Profiling the next {PROFILE_CYCLES} cycles.")
+
+    def _export_metrics(self, force=False):
+        try:
+            self.metrics_exporter.maybe_export(force)
+        except OSError as e:
+            self.log_message(f"WARNING: Could not export metrics: {e}", is_warning=True)
+
+    def toggle_log_file(self):
+        if self.log_to_file_var.get():
+            self.log_pipeline.open_sink(LOG_FILE)
+            self.log_message(f"Logging full history to {os.path.abspath(LOG_FILE)}.")
+        else:
+            self.log_pipeline.close_sink()
+
+    def _profile_from_vars(self):
+        """Snapshots the Tk variables into a profile dict (main thread only)."""
+        try:
+            return {key: var.get() for key, var in self.profile_vars.items()}
+        except tk.TclError as e:
+            raise PlanError(f"Invalid setting: {e}") from None
+
+    def _on_setting_changed(self, *_):
+        # Coalesce bursts of variable writes (typing, profile loads) into one rebuild
+        if not self._plan_rebuild_pending:
+            self._plan_rebuild_pending = True
+            self.master.after_idle(self._rebuild_plan)
+
+    def _rebuild_plan(self):
+        """Recompiles the ActionPlan and hands it to the runner; keeps the old plan on errors."""
+        self._plan_rebuild_pending = False
+        try:
+            plan = compile_plan(self._profile_from_vars(), self.backend.is_valid_key)
+        except PlanError as e:
+            if self.is_running and str(e) != self.plan_error:
+                self.log_message(f"WARNING: Settings not applied: {e}", is_warning=True)
+            self.plan_error = str(e)
+            return False
+        self.runner.plan = plan
+        self.plan_error = None
+        if self.is_running and self.single_slot is not None:
+            self.scheduler.update_plan(self.single_slot, plan)
+        return True
+
+    def toggle_macro_recording(self):
+        """Starts recording input into the target window, or stops and saves the recording."""
+        if self.macro_recorder is not None:
+            recorder, self.macro_recorder = self.macro_recorder, None
+            count = recorder.stop()
+            path = self.macro_file_var.get().strip() or MACRO_DEFAULT_FILE
+            try:
+                recorder.save(path)
+            except (OSError, ValueError) as e:
+                self.log_message(f"ERROR: Could not save macro: {e}", is_warning=True)
+            else:
+                self.log_message(f"Macro saved: {count} events to {os.path.abspath(path)}.")
+                self.macro_file_var.set(path) # Also recompiles the plan against the new file
+            self.record_button.config(text="Record")
+            return
+
+        if self.is_running:
+            messagebox.showerror("Error", "Stop the tool before recording a macro.")
+            return
+        try:
+            target = self.runner.find_target_window(compile_plan(dict(self._profile_from_vars(), macro_file=""),
+                                                                 self.backend.is_valid_key))
+        except PlanError as e:
+            messagebox.showerror("Error", f"Invalid settings: {e}")
+            return
+        if target is None:
+            messagebox.showerror("Error", "Target window not found.")
+            return
+        self.macro_recorder = MacroRecorder(self.backend, target._hWnd)
+        self.macro_recorder.start()
+        self.record_button.config(text="Stop")
+        self.log_message("Recording macro: switch to the target and play; only input while it has focus is kept.")
+
+    # --- CONTROL FLOW ---
+
+    def afk_loop(self, scheduler):
+        """The main threaded loop: one focus-steal episode per batch of due targets until stopped."""
+        self.runner.run_schedule(scheduler, [], after_episode=lambda focus_stolen: self._after_episode(scheduler))
+        self.log_message(scheduler.summary())
+        self._export_metrics(force=True)
+        self.update_status("Stopped")
+
+    def _after_episode(self, scheduler):
+        self._export_metrics()
+        if self.single_slot is None:
+            self.update_status(f"Running ({scheduler.focus_stolen_per_hour():.1f} s/h focus)")
+
+    def _set_control_states(self):
+        self.pause_button.config(state=tk.NORMAL if self.is_running and not self.is_paused else tk.DISABLED)
+        self.stop_button.config(state=tk.NORMAL if self.is_running else tk.DISABLED)
+
+    def start_afk(self):
+        """Starts the AFK process."""
+        if self.is_running:
+            if self.is_paused and self.worker_pool is not None:
+                self.is_paused = False
+                self.worker_pool.resume()
+                self.log_message("Tool RESUMED.")
+                self.update_status("Running")
+                self._set_control_states()
+            elif self.is_paused:
+                self.is_paused = False
+                self.scheduler.resume()
+                self.log_message(f"Tool RESUMED. Next action in: {self.scheduler.time_until_next():.2f} seconds.")
+                self.update_status("Running")
+                self._set_control_states()
+            return
+
+        tab_index = self.notebook.index(self.notebook.select())
+        if tab_index == 2:
+            try:
+                slots = self._build_multi_slots()
+                batch_window = self.batch_window_var.get()
+            except (PlanError, tk.TclError) as e:
+                messagebox.showerror("Error", str(e))
+                return
+            self.single_slot = None
+            if self.multi_processes_var.get():
+                self._start_workers()
+                return
+        else:
+            if not self.target_window_title.get():
+                messagebox.showerror("Error", "Please select a target application window.")
+                return
+            if not self._rebuild_plan():
+                messagebox.showerror("Error", f"Invalid settings: {self.plan_error}")
+                return
+            self.single_slot = ScheduleSlot(None, self.runner.plan, tab_index == 0)
+            slots, batch_window = [self.single_slot], 0.0
+
+        self._retire_workers()
+        if self.afk_thread is not None:
+            self.afk_thread.join(SHUTDOWN_JOIN_TIMEOUT) # Let a just-stopped cycle finish first
+        self.is_running = True
+        self.is_paused = False
+        self.scheduler = CycleScheduler(slots, rng=self.runner.rng, batch_window=batch_window, idle=self.runner.idle_source)
+        self.afk_thread = threading.Thread(target=self.afk_loop, args=(self.scheduler,), daemon=True)
+        self.afk_thread.start()
+        self.log_message("Tool STARTED. Active Mode: " + self.notebook.tab(self.notebook.select(), "text"))
+        self.update_status("Running")
+        self._set_control_states()
+
+    def _retire_workers(self):
+        """Stops a previous worker pool (waiting up to SHUTDOWN_JOIN_TIMEOUT) and keeps its last log lines."""
+        if self.worker_pool is None: return
+        for name, r in self.worker_pool.stop(): self.log_pipeline.push(f"[{name}] {r.message}", r.level)
+        self.worker_pool = None
+
+    def _start_workers(self):
+        """Multi-target mode with each profile in its own process; the profiles were already validated."""
+        self._retire_workers()
+        self.worker_pool = WorkerPool([(name, mode == 'fast') for name, mode in self.multi_targets])
+        self.worker_pool.start()
+        if self.metrics_exporter.format != 'off': self._workers_active("Metrics export")
+        self.is_running = True
+        self.is_paused = False
+        self.log_message(f"Tool STARTED. Active Mode: Multi-Target, {len(self.multi_targets)} worker processes")
+        self.update_status("Running")
+        self._set_control_states()
+
+    def pause_afk(self):
+        if not self.is_running or self.is_paused: return
+        self.is_paused = True
+        if self.worker_pool is not None: self.worker_pool.pause()
+        else: self.scheduler.pause()
+        self.log_message("Tool PAUSED.")
+        self.update_status("Paused")
+        self._set_control_states()
+
+    def stop_afk(self):
+        if self.is_running:
+            self.is_running = False
+            self.is_paused = False
+            if self.worker_pool is not None: self.worker_pool.request_stop() # Workers finish their cycle; _poll_workers reports it
+            else: self.scheduler.stop()
+            self.log_message("Tool STOPPED.")
+            self._set_control_states()
+            
+    def on_closing(self):
+        """Handles the window being closed."""
+        if self.is_running:
+            self.stop_afk()
+        if self.afk_thread is not None:
+            self.afk_thread.join(SHUTDOWN_JOIN_TIMEOUT)
+        self._retire_workers()
+        self.log_pipeline.drain() # Flush what is left to the file sink
+        self.log_pipeline.close_sink()
+        self.master.destroy()
+
+    def refresh_windows(self):
+        """Starts a background window scan; the picker updates when it lands, without blocking Tk."""
+        if self._scan_thread is not None and self._scan_thread.is_alive(): return
+        self.refresh_button.config(state=tk.DISABLED)
+        self._scan_thread = threading.Thread(target=self._scan_windows, daemon=True)
+        self._scan_thread.start()
+        self.master.after(WINDOW_SCAN_POLL_MS, self._poll_window_scan)
+
+    def _scan_windows(self):
+        """Worker thread: enumerates windows and hands the result (or the error) to the main thread."""
+        try:
+            self._window_scans.put(self.backend.enumerate_windows())
+        except Exception as e:
+            self._window_scans.put(e)
+
+    def _poll_window_scan(self):
+        """Main-thread timer: applies a finished scan to the index as a diff."""
+        try:
+            result = self._window_scans.get_nowait()
+        except queue.Empty:
+            self.master.after(WINDOW_SCAN_POLL_MS, self._poll_window_scan)
+            return
+        self.refresh_button.config(state=tk.NORMAL)
+        if isinstance(result, Exception):
+            self.log_message(f"WARNING: Window scan failed: {result}", is_warning=True)
+            return
+
+        if any(self.window_index.apply(result)):
+            self._apply_window_filter()
+        valid_titles = self.window_index.titles
+        current_title = self.target_window_title.get()
+        if current_title not in valid_titles and valid_titles and not parse_target(current_title):
+             self.target_window_title.set(valid_titles[0])
+
+    def _apply_window_filter(self, *_):
+        """Narrows the window picker to titles matching the search box."""
+        try:
+            titles = self.window_index.search(self.window_search_var.get(), self.window_search_mode_var.get())
+        except re.error:
+            return # Keep the last list while a regex is half typed
+        self.window_selector['values'] = titles
+
+
+def run_gui():
+    global tk, ttk, messagebox
+    import tkinter as tk
+    from tkinter import ttk, messagebox
+    root = tk.Tk()
+    app = AfkGuiApp(root)
+    root.mainloop()
+
+
+# --- HEADLESS MODE ---
+
+class HeadlessDaemon:
+    """Runs one saved profile's fast or custom cycles without Tk, controlled by signals.
+
+    SIGINT and SIGTERM stop after the current cycle. SIGUSR1 (Ctrl+Break on Windows)
+    toggles pause, and SIGHUP reloads the profile. Saving the profile from any
+    instance also reloads it on the next log drain. Log lines go to stdout and,
+    if log_file is given, to the rotating JSON-lines file.
+    """
+
+    SIGNAL_ACTIONS = {'SIGINT': 'stop', 'SIGTERM': 'stop', 'SIGBREAK': 'pause', 'SIGUSR1': 'pause', 'SIGHUP': 'reload'}
+
+    def __init__(self, profile_name, is_fast_mode=False, backend=None, store=None, log_file=None, out=None,
+                 clock=time.monotonic, advance=None, focus_lock=None):
+        self.profile_name = profile_name
+        self.store = store or ProfileStore()
+        self.profile = self.store.load(profile_name)
+        if self.profile is None:
+            raise PlanError(f"Profile '{profile_name}' not found in {self.store.path}.")
+        self.backend = backend or Win32Backend()
+        self.out = out or sys.stdout
+        self.pipeline = LogPipeline(log_file)
+        self.runner = CycleRunner(self.backend, self.log_message, self.pipeline.set_status, focus_lock=focus_lock)
+        self.metrics_exporter = MetricsExporter(self.runner.metrics)
+        self.slot = ScheduleSlot(None, compile_plan(self.profile, self.backend.is_valid_key), is_fast_mode)
+        self.scheduler = CycleScheduler([self.slot], rng=self.runner.rng, clock=clock, advance=advance,
+                                        idle=self.runner.idle_source)
+        self.first_action_at = None # perf_counter() when the first cycle reached its target
+        self._requests = [] # Appended by signal handlers, applied by the main loop
+        self._previous_handlers = {}
+        self._last_status = None
+
+    def log_message(self, message, is_warning=False):
+        self.pipeline.push(message, 'warning' if is_warning else 'info')
+
+    def run(self, max_cycles=None):
+        """Runs until a stop signal (or max_cycles episodes); returns the number of episodes."""
+        self._install_signals()
+        episodes = []
+        worker = threading.Thread(target=self.runner.run_schedule, args=(self.scheduler, episodes, max_cycles,
+                                                                         self._after_episode), daemon=True)
+        mode = 'fast' if self.slot.is_fast_mode else 'custom'
+        self.log_message(f"Headless run of profile '{self.profile_name}' started ({mode} mode).")
+        worker.start()
+        try:
+            while worker.is_alive():
+                worker.join(LOG_DRAIN_INTERVAL_MS / 1000)
+                self._apply_requests()
+                self._flush_log()
+        finally:
+            self.scheduler.stop()
+            worker.join(SHUTDOWN_JOIN_TIMEOUT)
+            self._restore_signals()
+            self.log_message(self.scheduler.summary())
+            self._flush_log()
+            self.pipeline.close_sink()
+        return len(episodes)
+
+    def _after_episode(self, focus_stolen):
+        if focus_stolen and self.first_action_at is None: self.first_action_at = time.perf_counter()
+        try:
+            self.metrics_exporter.maybe_export()
+        except OSError as e:
+            self.log_message(f"WARNING: Could not export metrics: {e}", is_warning=True)
+
+    def _install_signals(self):
+        if threading.current_thread() is not threading.main_thread(): return # signal.signal() would raise
+        for name, action in self.SIGNAL_ACTIONS.items():
+            signum = getattr(signal, name, None)
+            if signum is None: continue # Not on this platform
+            self._previous_handlers[signum] = signal.signal(signum, lambda *_, action=action: self._requests.append(action))
+
+    def _restore_signals(self):
+        for signum, handler in self._previous_handlers.items():
+            signal.signal(signum, handler)
+        self._previous_handlers.clear()
+
+    def _apply_requests(self):
+        while self._requests:
+            action = self._requests.pop(0)
+            if action == 'stop':
+                self.log_message("Stop requested.")
+                self.scheduler.stop()
+            elif action == 'pause' and self.scheduler.paused:
+                self.scheduler.resume()
+                self.log_message(f"RESUMED. Next action in: {self.scheduler.time_until_next():.2f} seconds.")
+            elif action == 'pause':
+                self.scheduler.pause()
+                self.log_message("PAUSED.")
+            else:
+                self._reload(force=True)
+        self._reload()
+
+    def _reload(self, force=False):
+        """Recompiles the profile if the store changed (or force); keeps the running plan on errors."""
+        profile = self.store.load(self.profile_name)
+        if profile is None or (profile == self.profile and not force): return
+        self.profile = profile
+        try:
+            plan = compile_plan(profile, self.backend.is_valid_key)
+        except PlanError as e:
+            self.log_message(f"WARNING: Profile not reloaded: {e}", is_warning=True)
+            return
+        self.scheduler.update_plan(self.slot, plan)
+        self.log_message(f"Profile '{self.profile_name}' reloaded.")
+
+    def _flush_log(self):
+        for r in self.pipeline.drain():
+            print(f"{time.strftime('[%H:%M:%S]', time.localtime(r.timestamp))} {r.message}", file=self.out)
+        status = self.pipeline.take_status()
+        if status is not None and status != self._last_status:
+            self._last_status = status
+            print(f"Status: {status}", file=self.out)
+        self.out.flush()
+
+
+class _ProbeBackend(Win32Backend):
+    """The real backend with input sending switched off, so the startup probe leaves the desktop alone."""
+
+    def send_batch(self, batch):
+        for _ in batch: pass # Still builds (and streams) every event
+
+
+def startup_probe():
+    """One cold start of the headless path to its first action; prints JSON.
+
+    Where the win32 libraries load, the cycle runs on the real backend against the
+    window that already has focus, with input sending switched off, so their import
+    and the real window lookups count. Elsewhere it runs on the fake backend.
+    """
+    imported = time.perf_counter()
+    backend = None
+    try:
+        start = time.perf_counter()
+        _load_win32()
+        win32_ms = (time.perf_counter() - start) * 1000
+        backend = _ProbeBackend()
+        target = f"hwnd:{backend.get_foreground_window():#x}" # Already in front: focusing it changes nothing
+        if target == "hwnd:0x0": backend = None # No desktop (service session); fall back to the fake one
+    except ImportError:
+        win32_ms = None # Not on Windows
+    timing = {}
+    if backend is None:
+        backend = FakeBackend()
+        home = backend.add_window("Desktop", width=1920, height=1080)
+        backend.add_window("Startup Target", left=200, top=150)
+        backend.set_foreground_window(home._hWnd)
+        target = "Startup Target"
+        timing = {'clock': backend.now, 'advance': backend.sleep}
+    store = ProfileStore(':memory:', legacy_ini=None)
+    store.save('startup', {'target_window': target})
+    daemon = HeadlessDaemon('startup', backend=backend, store=store, out=open(os.devnull, 'w'), **timing)
+    daemon.run(max_cycles=1)
+    print(json.dumps({'backend': 'fake' if isinstance(backend, FakeBackend) else 'win32',
+                      'import_ms': (imported - _MODULE_STARTED) * 1000, 'win32_import_ms': win32_ms,
+                      'first_action_ms': (daemon.first_action_at - _MODULE_STARTED) * 1000}))
+
+
+def run_startup_benchmark(runs=STARTUP_BENCH_RUNS):
+    """Starts fresh interpreters on the headless path and tracks import time and time to first action.
+
+    Each run is appended to STARTUP_BENCH_FILE and compared with the previous one.
+    """
+    import subprocess
+    samples = {'process_ms': [], 'import_ms': [], 'first_action_ms': [], 'win32_import_ms': []}
+    for _ in range(runs):
+        start = time.perf_counter()
+        out = subprocess.run([sys.executable, os.path.abspath(__file__), '--startup-probe'],
+                             capture_output=True, text=True, check=True).stdout
+        samples['process_ms'].append((time.perf_counter() - start) * 1000)
+        probe = json.loads(out.strip().splitlines()[-1])
+        backend = probe.pop('backend')
+        for key, value in probe.items():
+            if value is not None: samples[key].append(value)
+    result = {key: _percentile(sorted(values), 50) for key, values in samples.items() if values}
+    result['backend'] = backend
+
+    previous = None
+    if os.path.exists(STARTUP_BENCH_FILE):
+        with open(STARTUP_BENCH_FILE, encoding='utf-8') as f:
+            lines = f.read().splitlines()
+        previous = json.loads(lines[-1]) if lines else None
+        if previous and previous.get('backend', 'fake') != backend: previous = None # Not comparable
+    with open(STARTUP_BENCH_FILE, 'a', encoding='utf-8') as f:
+        f.write(json.dumps(dict(ts=round(time.time(), 3), runs=runs, **result)) + '\n')
+
+    print(f"Startup over {runs} runs on the {backend} backend (p50):")
+    for key, label in (('import_ms', "module import"), ('win32_import_ms', "win32 libraries"),
+                       ('first_action_ms', "module start -> first action"), ('process_ms', "whole process")):
+        if key not in result: continue
+        change = f" ({result[key] - previous[key]:+.1f} ms vs last run)" if previous and key in previous else ""
+        print(f"  {label:<30}{result[key]:8.1f} ms{change}")
+    return result
+
+
+# --- WORKER PROCESSES ---
+
+class FairFocusLock:
+    """Cross-process ticket lock: workers get the foreground strictly in the order they asked.
+
+    The ticket counters and the pid behind each outstanding ticket live in shared
+    memory under one multiprocessing Condition, so the lock can be handed to spawned
+    workers. Each worker holds at most one ticket, so capacity is the worker count.
+    release_dead() skips the tickets of a worker that died queued or holding focus.
+    """
+
+    def __init__(self, ctx, capacity):
+        self._cond = ctx.Condition()
+        self._counters = ctx.RawArray('q', 2) # Next ticket to hand out, ticket being served
+        self._owners = ctx.RawArray('q', capacity) # Pid per outstanding ticket (ticket % capacity); 0 once abandoned
+
+    def acquire(self):
+        with self._cond:
+            ticket = self._counters[0]
+            self._counters[0] += 1
+            self._owners[ticket % len(self._owners)] = os.getpid()
+            while self._counters[1] != ticket: self._cond.wait()
+
+    def release(self):
+        with self._cond:
+            self._advance()
+
+    def __enter__(self):
+        self.acquire()
+        return self
+
+    def __exit__(self, *exc):
+        self.release()
+
+    def _advance(self):
+        counters, owners = self._counters, self._owners
+        owners[counters[1] % len(owners)] = 0
+        counters[1] += 1
+        while counters[1] < counters[0] and owners[counters[1] % len(owners)] == 0: counters[1] += 1
+        self._cond.notify_all()
+
+    def holder(self):
+        """Pid of the worker in the critical section, or 0."""
+        with self._cond:
+            serving = self._counters[1]
+            return self._owners[serving % len(self._owners)] if serving < self._counters[0] else 0
+
+    def release_dead(self, pid):
+        """Drops every ticket of a worker that has exited; returns True if it was holding focus."""
+        with self._cond:
+            counters, owners = self._counters, self._owners
+            held = counters[1] < counters[0] and owners[counters[1] % len(owners)] == pid
+            for ticket in range(counters[1] + 1, counters[0]):
+                if owners[ticket % len(owners)] == pid: owners[ticket % len(owners)] = 0
+            if held: self._advance()
+            return held
+
+
+def _publish_worker_row(stats, index, row):
+    width = len(WORKER_STAT_FIELDS)
+    with stats.get_lock(): # Readers copy the whole array under the same lock, so rows are never torn
+        stats[index * width:(index + 1) * width] = row
+
+
+class ProfileWorker(HeadlessDaemon):
+    """A HeadlessDaemon inside a worker process, controlled and watched through shared objects.
+
+    Log records go to the parent's queue and health to this worker's row of the
+    shared stats array, both on the daemon's regular drain tick. The pool's stop
+    and pause events stand in for signals.
+    """
+
+    def __init__(self, index, profile_name, is_fast_mode, focus_lock, injections, stats, log_queue, stop, pause,
+                 backend=None):
+        self.index, self.stats, self.log_queue = index, stats, log_queue
+        self._stop_event, self._pause_event = stop, pause
+        self._stopping = False
+        self._warnings = 0
+        super().__init__(profile_name, is_fast_mode, backend=backend, focus_lock=focus_lock)
+        if self.runner.idle_source is not None: self.runner.idle_source.share(injections)
+
+    def _apply_requests(self):
+        if self._stop_event.is_set() and not self._stopping:
+            self._stopping = True
+            self._requests.append('stop')
+        if self._pause_event.is_set() != self.scheduler.paused: self._requests.append('pause')
+        super()._apply_requests()
+
+    def _flush_log(self):
+        for r in self.pipeline.drain():
+            if r.level == 'warning': self._warnings += 1
+            self.log_queue.put((self.index, r.timestamp, r.level, r.message))
+        self.pipeline.take_status() # The parent shows worker state from the stats row instead
+        self.publish()
+
+    def publish(self, state=None):
+        """Writes this worker's row. The cycle thread's progress (cycle_started) comes along, so a
+        cycle that hangs shows as stuck even though this drain loop keeps the heartbeat fresh."""
+        stats = self.scheduler.stats()
+        lock = self.runner.metrics.snapshot()['phases'].get('lock', {})
+        plan = self.slot.plan
+        cycle_limit = WORKER_STUCK_AFTER + (plan.macro.duration / plan.macro_speed if plan.macro else 0.0)
+        state = state or ('paused' if self.scheduler.paused else 'running')
+        _publish_worker_row(self.stats, self.index, (
+            os.getpid(), WORKER_STATES.index(state), time.time(), self.runner.cycle_started, cycle_limit,
+            stats['episodes'], stats['focus_stolen_s_per_h'], lock.get('p50_ms', 0.0), lock.get('max_ms', 0.0),
+            stats['deferrals'], self._warnings))
+
+
+def _worker_main(index, profile_name, is_fast_mode, focus_lock, injections, stats, log_queue, stop, pause,
+                 backend_factory=None):
+    """Worker process entry point; module level so spawned processes can find it."""
+    try:
+        worker = ProfileWorker(index, profile_name, is_fast_mode, focus_lock, injections, stats, log_queue, stop, pause,
+                               backend=backend_factory() if backend_factory else None)
+    except (PlanError, ImportError, sqlite3.Error) as e:
+        log_queue.put((index, time.time(), 'warning', f"WARNING: Worker not started: {e}"))
+        _publish_worker_row(stats, index, (os.getpid(), WORKER_STATES.index('failed'), time.time())
+                            + (0,) * (len(WORKER_STAT_FIELDS) - 3))
+        return
+    worker.run()
+    worker.publish('stopped')
+
+
+class WorkerPool:
+    """Runs each (profile name, is_fast_mode) in its own process, one scheduler per worker.
+
+    Window resolution, screen checks and planning in one worker never hold up
+    another; only focus steals queue, in order, on a shared FairFocusLock. Workers
+    send log lines back over a queue and health through one shared array, so the
+    parent sees every worker with a single locked copy instead of asking each one.
+    """
+
+    def __init__(self, profiles, backend_factory=None):
+        import multiprocessing
+        ctx = multiprocessing.get_context('spawn') # What Windows always does; the same everywhere else
+        self.names = [name for name, _ in profiles]
+        self.focus_lock = FairFocusLock(ctx, len(profiles))
+        self.injections = ctx.Array('d', [0.0, -1.0, 0.0]) # The IdleSource window of the latest focus steal, any worker
+        self.stats = ctx.Array('d', len(profiles) * len(WORKER_STAT_FIELDS))
+        self.logs = ctx.Queue()
+        self._stop, self._pause = ctx.Event(), ctx.Event()
+        self.processes = [ctx.Process(target=_worker_main, name=f"focus-lock-{name}", daemon=True,
+                                      args=(index, name, is_fast_mode, self.focus_lock, self.injections, self.stats,
+                                            self.logs, self._stop, self._pause, backend_factory))
+                          for index, (name, is_fast_mode) in enumerate(profiles)]
+        self._reaped = set()
+
+    def start(self):
+        for process in self.processes: process.start()
+
+    def pause(self): self._pause.set()
+    def resume(self): self._pause.clear()
+    def request_stop(self): self._stop.set() # Workers stop after their current cycle
+
+    def alive(self):
+        return any(process.is_alive() for process in self.processes)
+
+    def stop(self, timeout=SHUTDOWN_JOIN_TIMEOUT):
+        """Stops every worker, terminating any still busy after timeout; returns the log lines drained meanwhile."""
+        self.request_stop()
+        records, deadline = [], time.monotonic() + timeout
+        while self.alive() and time.monotonic() < deadline:
+            records += self.drain_logs() # A worker cannot exit while its queue feeder still holds lines
+            time.sleep(LOG_DRAIN_INTERVAL_MS / 1000)
+        for process in self.processes:
+            if process.is_alive(): process.terminate()
+            process.join(SHUTDOWN_JOIN_TIMEOUT)
+        self.reap()
+        return records + self.drain_logs()
+
+    def drain_logs(self):
+        """(worker name, LogRecord) for every line the workers have sent so far."""
+        records = []
+        while True:
+            try:
+                index, timestamp, level, message = self.logs.get_nowait()
+            except queue.Empty:
+                return records
+            records.append((self.names[index], LogRecord(timestamp, level, message)))
+
+    def reap(self):
+        """Frees focus held or queued for by exited workers; returns the names of workers that crashed."""
+        crashed = []
+        for index, process in enumerate(self.processes):
+            if process.pid is None or process.is_alive() or index in self._reaped: continue
+            self._reaped.add(index)
+            self.focus_lock.release_dead(process.pid)
+            if process.exitcode != 0:
+                crashed.append(self.names[index])
+                with self.stats.get_lock():
+                    self.stats[index * len(WORKER_STAT_FIELDS) + WORKER_STAT_FIELDS.index('state')] = WORKER_STATES.index('failed')
+        return crashed
+
+    def snapshot(self):
+        """One dict per worker (WORKER_STAT_FIELDS plus name and has_focus), from a single copy of the shared array.
+
+        A live worker is 'unresponsive' when its heartbeat is older than WORKER_STALE_AFTER,
+        and 'stuck' when its current cycle has run longer than its cycle_limit.
+        """
+        width = len(WORKER_STAT_FIELDS)
+        with self.stats.get_lock():
+            values = self.stats[:]
+        now, holder, rows = time.time(), self.focus_lock.holder(), []
+        for index, name in enumerate(self.names):
+            row = dict(zip(WORKER_STAT_FIELDS, values[index * width:(index + 1) * width]), name=name)
+            row['pid'], row['state'] = int(row['pid']), WORKER_STATES[int(row['state'])]
+            row['has_focus'] = bool(holder) and row['pid'] == holder
+            if row['state'] in ('running', 'paused'):
+                if now - row['heartbeat'] > WORKER_STALE_AFTER: row['state'] = 'unresponsive'
+                elif row['cycle_started'] and now - row['cycle_started'] > row['cycle_limit']: row['state'] = 'stuck'
+            rows.append(row)
+        return rows
+
+
+def format_worker_health(rows, now=None):
+    now = now or time.time()
+    lines = []
+    for r in rows:
+        state = r['state'] + (" (has focus)" if r['has_focus'] else "")
+        if r['state'] == 'stuck': state += f" for {now - r['cycle_started']:.0f} s"
+        lines.append(f"{r['name']}: {state}, {r['episodes']:.0f} cycles, {r['focus_stolen_s_per_h']:.1f} s/h focus, "
+                     f"lock wait p50 {r['lock_wait_p50_ms']:.1f} ms (max {r['lock_wait_max_ms']:.0f}), "
+                     f"{r['deferrals']:.0f} deferred, {r['warnings']:.0f} warnings")
+    return lines
+
+
+def run_workers(profiles, log_file=None, out=None, backend_factory=None, duration=None):
+    """Headless multi-profile run: one WorkerPool until SIGINT/SIGTERM (or duration seconds)."""
+    out = out or sys.stdout
+    pipeline = LogPipeline(log_file)
+    pool = WorkerPool(profiles, backend_factory)
+    requests = []
+    previous = {}
+    if threading.current_thread() is threading.main_thread():
+        for name in ('SIGINT', 'SIGTERM'):
+            signum = getattr(signal, name, None)
+            if signum is not None: previous[signum] = signal.signal(signum, lambda *_: requests.append('stop'))
+
+    def flush(records):
+        for name, r in records: pipeline.push(f"[{name}] {r.message}", r.level)
+        while True:
+            drained = pipeline.drain()
+            if not drained: break
+            for r in drained: print(f"{time.strftime('[%H:%M:%S]', time.localtime(r.timestamp))} {r.message}", file=out)
+        out.flush()
+
+    pool.start()
+    started = last_health = time.monotonic()
+    try:
+        while pool.alive() and not requests and (duration is None or time.monotonic() - started < duration):
+            time.sleep(LOG_DRAIN_INTERVAL_MS / 1000)
+            for name in pool.reap(): pipeline.push(f"[{name}] WARNING: Worker exited unexpectedly.", 'warning')
+            flush(pool.drain_logs())
+            if time.monotonic() - last_health >= WORKER_HEALTH_INTERVAL:
+                last_health = time.monotonic()
+                for line in format_worker_health(pool.snapshot()): pipeline.push(line)
+    finally:
+        flush(pool.stop())
+        for line in format_worker_health(pool.snapshot()): pipeline.push(line)
+        flush([])
+        pipeline.close_sink()
+        for signum, handler in previous.items(): signal.signal(signum, handler)
+    return pool.snapshot()
+
+
+# --- BENCHMARKS ---
+
+def focus_stolen_time(events, home_hwnd):
+    """Sums how long the recorded foreground was away from home_hwnd."""
+    total = 0.0; since = None
+    for stamp, name, args in events:
+        if name != 'focus': continue
+        if args[0] != home_hwnd and since is None: since = stamp
+        elif args[0] == home_hwnd and since is not None: total += stamp - since; since = None
+    return total
+
+
+def run_benchmarks(cycles=BENCH_CYCLES, seed=0, focus_latency=0.004):
+    """Runs fast and custom cycles on a FakeBackend and reports per-cycle latency percentiles.
+
+    Focus-stolen time includes the simulated sleeps a cycle asks for; wall time is
+    the real Python cost of the cycle with those sleeps removed.
+    """
+    results = {}
+    for mode in ('fast', 'custom'):
+        backend = FakeBackend(focus_latency=focus_latency)
+        home = backend.add_window("Desktop", width=1920, height=1080)
+        for i in range(BENCH_BACKGROUND_WINDOWS):
+            backend.add_window(f"Background Window {i}", pid=100 + i, process_name=f"app{i}.exe")
+        target = backend.add_window("Bench Target", left=200, top=150, pid=42, process_name="target.exe")
+        backend.set_foreground_window(home._hWnd)
+        backend.flush_pending_focus()
+        plan = compile_plan({'target_window': target.title, 'right_click_enabled': True, 'scroll_enabled': True},
+                            backend.is_valid_key)
+        failures = []
+        runner = CycleRunner(backend,
+                             log=lambda msg, is_warning=False: is_warning and failures.append(msg),
+                             status=lambda status: None, plan=plan, rng=random.Random(seed))
+        cycle = runner.execute_fast_action if mode == 'fast' else runner.execute_custom_action
+
+        stolen, wall = [], []
+        for _ in range(cycles):
+            del backend.events[:]
+            start = time.perf_counter()
+            cycle()
+            backend.flush_pending_focus()
+            wall.append(time.perf_counter() - start)
+            stolen.append(focus_stolen_time(backend.events, home._hWnd))
+        stolen.sort(); wall.sort()
+        results[mode] = {
+            'cycles': cycles,
+            'failures': len(failures),
+            'stolen_ms': {p: _percentile(stolen, p) * 1000 for p in (50, 95, 99)},
+            'wall_ms': {p: _percentile(wall, p) * 1000 for p in (50, 95, 99)},
+            'resolver': runner.resolver_stats(),
+            'settle': runner.settler.stats(),
+            'input_calls_per_cycle': backend.batches_sent / cycles,
+            'phases': runner.metrics.snapshot()['phases'],
+        }
+
+    print(f"{'mode':<8}{'cycles':>8}{'failed':>8}   focus stolen p50/p95/p99 (ms)   wall p50/p95/p99 (ms)")
+    for mode, r in results.items():
+        s, w = r['stolen_ms'], r['wall_ms']
+        print(f"{mode:<8}{r['cycles']:>8}{r['failures']:>8}   "
+              f"{s[50]:9.3f} {s[95]:9.3f} {s[99]:9.3f}      {w[50]:7.3f} {w[95]:7.3f} {w[99]:7.3f}")
+    for mode, r in results.items():
+        print(f"{mode:<8}window cache: {r['resolver']['hits']} hits, {r['resolver']['misses']} misses, "
+              f"{r['resolver']['invalidations']} invalidations, {r['input_calls_per_cycle']:.2f} input batches/cycle")
+        for kind, st in r['settle'].items():
+            print(f"{mode:<8}{kind} settle: p50 {st['p50_ms']:.1f} ms, p95 {st['p95_ms']:.1f} ms, "
+                  f"deadline {st['deadline_ms']:.1f} ms, {st['timeouts']} timeouts")
+        print(f"{mode:<8}phases p50/p99 (ms): " + ', '.join(f"{name} {h['p50_ms']:.3f}/{h['p99_ms']:.3f}"
+                                                            for name, h in r['phases'].items()))
+    return results
+
+
+# --- SIMULATION ---
+
+def _operator_spells(rng, start, end, active):
+    """Busy (start, end) intervals covering about `active` of [start, end), in spells of SIM_OPERATOR_SPELL on average."""
+    spells, t = [], start + rng.expovariate(active / (SIM_OPERATOR_SPELL * (1.0 - active)))
+    while t < end:
+        busy_end = t + rng.expovariate(1.0 / SIM_OPERATOR_SPELL)
+        spells.append((t, busy_end))
+        t = busy_end + rng.expovariate(active / (SIM_OPERATOR_SPELL * (1.0 - active)))
+    return spells
+
+
+def simulate_profile(profile, hours=SIM_HOURS, seed=0, is_fast_mode=False, operator_active=0.0):
+    """Runs a profile's real scheduling and action selection against a virtual clock.
+
+    Everything random draws from one seeded RNG and every wait advances the fake
+    clock, so the same profile and seed always give the same schedule, and a 12 h
+    shift takes well under a second. operator_active (0 to <1) adds an operator who
+    is typing that fraction of the time, from a second RNG on the same seed, for the
+    profile's idle_threshold to defer around.
+    """
+    import hashlib
+    rng = random.Random(seed)
+    backend = FakeBackend(track_real_time=False, focus_latency=SIM_FOCUS_LATENCY)
+    home = backend.add_window("Desktop", width=1920, height=1080)
+    backend.set_foreground_window(home._hWnd); backend.flush_pending_focus()
+    plan = compile_plan(dict(profile, target_window="Simulated Target"), backend.is_valid_key)
+    backend.add_window(plan.target, left=200, top=150, pid=42, process_name="target.exe")
+
+    warnings = []
+    runner = CycleRunner(backend, log=lambda msg, is_warning=False: is_warning and warnings.append(msg),
+                         status=lambda status: None, rng=rng)
+    slot = ScheduleSlot(None, plan, is_fast_mode)
+    horizon = backend.now() + hours * 3600.0
+    start = backend.now()
+    if operator_active > 0:
+        spells = _operator_spells(random.Random(f"operator-{seed}"), start, horizon, operator_active)
+        runner.idle_source = FakeIdleSource(backend.now, spells)
+    scheduler = CycleScheduler([slot], rng=rng, clock=backend.now, advance=backend.sleep, idle=runner.idle_source)
+
+    input_times, stolen = [], []
+    while True:
+        due = scheduler.wait_next()
+        if backend.now() >= horizon: break
+        del backend.events[:]
+        stolen.append(runner.run_episode([(s.plan, s.is_fast_mode, s.name) for s in due]))
+        backend.flush_pending_focus()
+        scheduler.record_episode(stolen[-1])
+        first_input = next((stamp for stamp, name, _ in backend.events if name != 'focus'), None)
+        if first_input is not None: input_times.append(first_input)
+        scheduler.schedule_next(due)
+
+    gaps = sorted(b - a for a, b in zip(input_times, input_times[1:]))
+    edges = [input_times[0] - start, horizon - input_times[-1]] if input_times else [horizon - start]
+    fingerprint = hashlib.sha1(','.join(f"{t - start:.6f}" for t in input_times).encode()).hexdigest()[:12]
+    cycles = len(stolen)
+    return {
+        'hours': hours, 'seed': seed, 'cycles': cycles, 'fingerprint': fingerprint,
+        'action_mix': dict(runner.action_counts.most_common()),
+        'gap_s': {'p50': _percentile(gaps, 50), 'p95': _percentile(gaps, 95), 'max': gaps[-1] if gaps else 0.0},
+        'longest_idle_s': max(gaps + edges),
+        'focus_stolen_s': sum(stolen),
+        'focus_stolen_s_per_h': sum(stolen) / hours if hours else 0.0,
+        'operator_active': operator_active,
+        'deferrals': scheduler.deferrals, 'deferred_s_total': scheduler.deferred_total,
+        'deferred_max_s': scheduler.deferred_max, 'deferred_forced': scheduler.deferred_forced,
+        'warnings': len(warnings),
+    }
+
+
+def print_simulation(report):
+    r = report
+    print(f"Simulated {r['hours']:.1f} h (seed {r['seed']}): {r['cycles']} cycles, schedule fingerprint {r['fingerprint']}")
+    mix = ', '.join(f"{action} {count} ({100.0 * count / max(1, r['cycles']):.1f}%)" for action, count in r['action_mix'].items())
+    print(f"Action mix: {mix or 'none'}")
+    g = r['gap_s']
+    print(f"Input gaps (s): p50 {g['p50']:.1f}, p95 {g['p95']:.1f}, max {g['max']:.1f}; "
+          f"longest idle gap {r['longest_idle_s']:.1f} s")
+    print(f"Focus stolen: {r['focus_stolen_s']:.1f} s total, {r['focus_stolen_s_per_h']:.1f} s/h; {r['warnings']} warnings")
+    if r['operator_active'] > 0:
+        print(f"Operator active {100.0 * r['operator_active']:.0f}% of the time: {r['deferrals']} cycles deferred, "
+              f"{r['deferred_s_total']:.1f} s total, max {r['deferred_max_s']:.1f} s, {r['deferred_forced']} at the limit")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Focus-Lock Automator")
+    parser.add_argument('--bench', nargs='?', type=int, const=BENCH_CYCLES, metavar='CYCLES',
+                        help="run the per-cycle latency benchmark against the fake backend and exit")
+    parser.add_argument('--simulate', nargs='?', const='', metavar='PROFILE',
+                        help="simulate a saved profile (default settings if omitted) on a virtual clock and exit")
+    parser.add_argument('--hours', type=float, default=SIM_HOURS, help="simulated shift length (default: %(default)s)")
+    parser.add_argument('--seed', type=int, default=0, help="RNG seed for --simulate (default: %(default)s)")
+    parser.add_argument('--operator-active', type=float, default=0.0, metavar='FRACTION',
+                        help="with --simulate, fraction of the time a simulated operator is typing (default: %(default)s)")
+    parser.add_argument('--mode', choices=CYCLE_MODES, default='custom', help="cycle mode for --simulate and --run")
+    parser.add_argument('--run', metavar='PROFILE', nargs='+',
+                        help="run saved profiles headless until SIGINT/SIGTERM; several run as worker processes")
+    parser.add_argument('--log-file', nargs='?', const=LOG_FILE, metavar='PATH',
+                        help=f"with --run, also write the log as JSON lines (default: {LOG_FILE})")
+    parser.add_argument('--metrics', choices=METRICS_FORMATS, default='off', help="with --run, periodic metrics export")
+    parser.add_argument('--bench-startup', nargs='?', type=int, const=STARTUP_BENCH_RUNS, metavar='RUNS',
+                        help="measure import time and time to first action over fresh processes and exit")
+    parser.add_argument('--startup-probe', action='store_true', help=argparse.SUPPRESS)
+    parser.add_argument('--json', action='store_true', help="print the --simulate report as JSON")
+    parser.add_argument('--import-profiles', metavar='INI', help=f"merge an INI profile library into {PROFILES_DB} and exit")
+    parser.add_argument('--export-profiles', metavar='INI', help=f"write every profile in {PROFILES_DB} to an INI file and exit")
+    args = parser.parse_args()
+
+    if args.startup_probe:
+        startup_probe()
+    elif args.bench_startup:
+        run_startup_benchmark(args.bench_startup)
+    elif args.bench:
+        run_benchmarks(args.bench)
+    elif args.import_profiles or args.export_profiles:
+        store = ProfileStore()
+        if args.import_profiles:
+            if not os.path.exists(args.import_profiles): parser.error(f"{args.import_profiles} does not exist")
+            print(f"Imported {store.import_ini(args.import_profiles)} profiles into {PROFILES_DB}")
+            for name, error in store.skipped: print(f"Skipped profile '{name}': {error}")
+        if args.export_profiles:
+            print(f"Exported {store.export_ini(args.export_profiles)} profiles to {args.export_profiles}")
+    elif args.simulate is not None:
+        profile = {}
+        if args.simulate:
+            profile = ProfileStore().load(args.simulate)
+            if profile is None: parser.error(f"profile '{args.simulate}' not found in {PROFILES_DB}")
+        if not 0 <= args.operator_active < 1: parser.error("--operator-active must be in [0, 1)")
+        try:
+            report = simulate_profile(profile, args.hours, args.seed, args.mode == 'fast', args.operator_active)
+        except PlanError as e:
+            parser.error(str(e))
+        if args.json: print(json.dumps(report, indent=2))
+        else: print_simulation(report)
+    elif args.run and len(args.run) > 1:
+        if args.metrics != 'off': parser.error("--metrics needs a single --run profile")
+        store = ProfileStore()
+        missing = [name for name in args.run if name not in store]
+        if missing: parser.error(f"profile(s) not found in {PROFILES_DB}: {', '.join(missing)}")
+        store.close()
+        run_workers([(name, args.mode == 'fast') for name in args.run], log_file=args.log_file)
+    elif args.run:
+        try:
+            daemon = HeadlessDaemon(args.run[0], args.mode == 'fast', log_file=args.log_file)
+        except PlanError as e:
+            parser.error(str(e))
+        daemon.metrics_exporter.format = args.metrics
+        daemon.run()
+    else:
+        run_gui()
\ No newline at end of file
@@ -0,0 +1,941 @@
+import configparser
+import importlib.util
+import io
+import json
+import multiprocessing
+import os
+import random
+import signal
+import threading
+import time
+import types
+from array import array
+
+import pytest
+
+SCRIPT = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "Focus Lock Automator.py")
+_spec = importlib.util.spec_from_file_location("focus_lock_automator", SCRIPT)
+fla = importlib.util.module_from_spec(_spec)
+_spec.loader.exec_module(fla)
+
+
+@pytest.fixture
+def backend():
+    b = fla.FakeBackend(track_real_time=False)
+    home = b.add_window("Desktop", width=1920, height=1080)
+    b.set_foreground_window(home._hWnd)
+    del b.events[:]
+    return b
+
+
+def make_plan(backend, **profile):
+    return fla.compile_plan(dict(profile), backend.is_valid_key)
+
+
+# --- INPUT BATCHING ---
+
+def test_batch_sends_events_in_order_with_explicit_waits(backend):
+    batch = fla.InputBatch().move_to(10, 20).move_rel(2, -3).click().hold('w', 0.5).press('e')
+    backend.send_batch(batch)
+    assert [(name, args) for _, name, args in backend.events] == [
+        ('move_to', (10, 20)), ('move_rel', (2, -3)), ('left_down', (None, None)), ('left_up', (None, None)),
+        ('key_down', ('w', None)), ('key_up', ('w', None)), ('key_down', ('e', None)), ('key_up', ('e', None))]
+    times = [stamp for stamp, _, _ in backend.events]
+    assert times[5] - times[4] == pytest.approx(0.5) # Only the long press waits
+    assert times[4] == times[0] and times[7] == times[5]
+    assert backend.mouse == (12, 17) and backend.batches_sent == 1
+
+
+def test_streamed_events_are_consumed_while_sending(backend):
+    consumed = []
+
+    def events():
+        for key in 'ab':
+            consumed.append(key)
+            yield fla.InputEvent('key_down', key, None, 0.0)
+
+    batch = fla.InputBatch().move_to(1, 1).stream(events())
+    assert consumed == [] and len(batch) == 2
+    backend.send_batch(batch)
+    assert consumed == ['a', 'b']
+    assert [args[0] for _, name, args in backend.events if name == 'key_down'] == ['a', 'b']
+
+
+def test_custom_episode_focuses_acts_and_restores(backend):
+    home = backend.foreground_hwnd
+    target = backend.add_window("Target", left=100, top=100, width=400, height=300)
+    backend.mouse = (5, 5)
+    plan = make_plan(backend, target_window="Target", tap_keys="e", long_press_keys="", right_click_enabled=False,
+                     scroll_enabled=False, min_delay=1, max_delay=2)
+    runner = fla.CycleRunner(backend, log=lambda *a, **k: None, status=lambda s: None, rng=random.Random(0))
+    stolen = runner.run_episode([(plan, False, None)])
+    names = [name for _, name, _ in backend.events]
+    assert names[0] == 'focus' and names[-1] == 'focus'
+    assert backend.events[0][2] == (target._hWnd,) and backend.foreground_hwnd == home
+    assert names[1:-1] == ['move_to', 'move_rel', 'left_down', 'left_up', 'key_down', 'key_up', 'move_to']
+    assert backend.mouse == (5, 5) and stolen >= 0
+
+
+
+def test_failed_revert_is_logged_not_raised():
+    backend = fla.FakeBackend(track_real_time=False) # Nothing in the foreground: handle 0
+    backend.add_window("Target", left=100, top=100)
+    plan = make_plan(backend, target_window="Target")
+    warnings = []
+    runner = fla.CycleRunner(backend, log=lambda msg, is_warning=False: is_warning and warnings.append(msg),
+                             status=lambda s: None, rng=random.Random(0))
+    assert runner.run_episode([(plan, True, None)]) >= 0
+    assert len(warnings) == 1 and "hand focus back" in warnings[0]
+    assert runner.metrics.snapshot()['failures'] == {'revert/OSError': 1}
+    assert runner.run_episode([(plan, True, None)]) >= 0 # The runner is still usable
+
+
+def test_mouse_is_restored_when_the_send_fails(backend):
+    backend.add_window("Target", left=100, top=100)
+    backend.mouse = (5, 5)
+    runner = fla.CycleRunner(backend, log=lambda *a, **k: None, status=lambda s: None, rng=random.Random(0))
+    send = backend.send_batch
+    calls = []
+
+    def send_once_then_fail(batch):
+        calls.append(list(batch))
+        if len(calls) == 1:
+            send(fla.InputBatch().move_to(150, 150)) # Part of the batch landed, then SendInput refused the rest
+            raise OSError("SendInput blocked")
+        send(batch)
+
+    backend.send_batch = send_once_then_fail
+    runner.run_episode([(make_plan(backend, target_window="Target"), True, None)])
+    assert len(calls) == 2 and backend.mouse == (5, 5)
+
+# --- SCHEDULING ---
+
+def test_scheduler_pause_shifts_pending_deadlines(backend):
+    plan = make_plan(backend, min_delay=10, max_delay=10)
+    slot = fla.ScheduleSlot(None, plan, True)
+    scheduler = fla.CycleScheduler([slot], rng=random.Random(0), clock=backend.now, advance=backend.sleep)
+    assert scheduler.wait_next() == [slot]
+    scheduler.schedule_next([slot])
+    backend.sleep(4)
+    scheduler.pause()
+    backend.sleep(100)
+    assert scheduler.time_until_next() == pytest.approx(6)
+    scheduler.resume()
+    assert scheduler.wait_next() == [slot]
+    assert backend.now() == pytest.approx(110)
+
+
+def test_deadlines_inside_the_batch_window_share_one_focus_steal(backend):
+    home = backend.foreground_hwnd
+    for title in "ABC": backend.add_window(title, left=100, top=100)
+    slots = [fla.ScheduleSlot(title, make_plan(backend, target_window=title, min_delay=delay, max_delay=delay), True)
+             for title, delay in (("A", 10), ("B", 11), ("C", 15))]
+    scheduler = fla.CycleScheduler(slots, rng=random.Random(0), clock=backend.now, advance=backend.sleep,
+                                   batch_window=2)
+    runner = fla.CycleRunner(backend, log=lambda *a, **k: None, status=lambda s: None, rng=random.Random(0))
+    episodes, stolen = [], []
+    while len(episodes) < 3:
+        due = scheduler.wait_next()
+        episodes.append([slot.name for slot in due])
+        stolen.append(runner.run_episode([(slot.plan, slot.is_fast_mode, slot.name) for slot in due]))
+        scheduler.record_episode(stolen[-1])
+        scheduler.schedule_next(due)
+    assert episodes == [['A', 'B', 'C'], ['A', 'B'], ['C']] # B is due 1 s after A, C 5 s after
+    assert (scheduler.fires, scheduler.episodes, scheduler.batched) == (6, 3, 3)
+    assert [args for _, name, args in backend.events if name == 'focus'].count((home,)) == 3 # One revert per steal
+    assert scheduler.focus_stolen == pytest.approx(sum(stolen))
+    assert scheduler.focus_stolen_per_hour() == pytest.approx(sum(stolen) * 3600 / backend.now())
+
+
+def test_idle_gated_slot_waits_for_operator_then_fires(backend):
+    plan = make_plan(backend, min_delay=10, max_delay=10, idle_threshold=3, idle_max_defer=20)
+    idle = fla.FakeIdleSource(backend.now, [(5, 18)])
+    slot = fla.ScheduleSlot(None, plan, True)
+    scheduler = fla.CycleScheduler([slot], rng=random.Random(0), clock=backend.now, advance=backend.sleep, idle=idle)
+    scheduler.wait_next(); scheduler.schedule_next([slot])
+    scheduler.wait_next()
+    assert backend.now() == pytest.approx(21) # Busy until 18, then 3 s idle
+    assert scheduler.deferrals == 1 and scheduler.deferred_forced == 0
+
+
+def test_idle_deferral_is_capped(backend):
+    plan = make_plan(backend, min_delay=10, max_delay=10, idle_threshold=3, idle_max_defer=20)
+    idle = fla.FakeIdleSource(backend.now, [(5, 100)])
+    slot = fla.ScheduleSlot(None, plan, True)
+    scheduler = fla.CycleScheduler([slot], rng=random.Random(0), clock=backend.now, advance=backend.sleep, idle=idle)
+    scheduler.wait_next(); scheduler.schedule_next([slot])
+    scheduler.wait_next()
+    assert backend.now() == pytest.approx(30)
+    assert scheduler.deferred_forced == 1
+
+
+
+def test_deferred_slot_does_not_hold_back_others(backend):
+    gated = fla.ScheduleSlot('gated', make_plan(backend, min_delay=10, max_delay=10, idle_threshold=5,
+                                                idle_max_defer=100), True)
+    plain = fla.ScheduleSlot('plain', make_plan(backend, min_delay=12, max_delay=12), True)
+    idle = fla.FakeIdleSource(backend.now, [(1, 1000)])
+    scheduler = fla.CycleScheduler([gated, plain], rng=random.Random(0), clock=backend.now, advance=backend.sleep,
+                                   idle=idle)
+    scheduler.schedule_next(scheduler.wait_next())
+    fired = []
+    while len(fired) < 4:
+        due = scheduler.wait_next()
+        fired += [(slot.name, round(backend.now(), 2)) for slot in due]
+        scheduler.schedule_next(due)
+    assert fired[:4] == [('plain', 12), ('plain', 24), ('plain', 36), ('plain', 48)]
+    while ('gated', 110) not in fired:
+        due = scheduler.wait_next()
+        fired += [(slot.name, round(backend.now(), 2)) for slot in due]
+        scheduler.schedule_next(due)
+    assert scheduler.deferred_forced == 1 and scheduler.deferred_max == pytest.approx(100)
+
+def test_idle_source_ignores_own_injected_input(backend):
+    idle = fla.FakeIdleSource(backend.now)
+    backend.sleep(10)
+    idle.begin_injection(); backend.sleep(0.5); idle.touch(); idle.end_injection()
+    backend.sleep(1)
+    assert idle.idle_seconds() == float('inf')
+    idle.touch(); backend.sleep(2)
+    assert idle.idle_seconds() == pytest.approx(2)
+
+
+def test_idle_deferral_terminates_on_virtual_clock():
+    # Holds of a few 1e-13 s used to vanish when added to the clock, so the scheduler spun forever
+    for threshold, active in ((5, 0.5), (60, 0.3)):
+        report = fla.simulate_profile({'idle_threshold': threshold, 'idle_max_defer': 60}, hours=2, seed=1,
+                                      operator_active=active)
+        assert report['cycles'] > 0 and report['deferrals'] > 0
+
+
+
+def test_workers_share_the_injection_window(backend):
+    window = multiprocessing.get_context('spawn').Array('d', [0.0, -1.0, 0.0])
+    worker_a, worker_b = fla.FakeIdleSource(backend.now), fla.FakeIdleSource(backend.now)
+    worker_a.share(window); worker_b.share(window)
+    backend.sleep(10)
+    worker_a.begin_injection()
+    backend.sleep(0.2); worker_b.touch() # B's view of the desktop sees A's injected input
+    assert worker_b.idle_seconds() == float('inf')
+    worker_a.end_injection(); backend.sleep(1)
+    assert worker_b.idle_seconds() == float('inf')
+    worker_b.touch(); backend.sleep(2)
+    assert worker_b.idle_seconds() == pytest.approx(2)
+
+# --- ACTIVITY LOG ---
+
+def test_log_pipeline_drains_in_batches_to_the_json_lines_file(tmp_path):
+    path = tmp_path / "log.jsonl"
+    pipeline = fla.LogPipeline(str(path))
+    for n in range(5): pipeline.push(f"line {n}")
+    pipeline.push("careful", 'warning')
+    assert [r.message for r in pipeline.drain(limit=4)] == ["line 0", "line 1", "line 2", "line 3"]
+    assert [r.message for r in pipeline.drain()] == ["line 4", "careful"] and pipeline.drain() == []
+    pipeline.close_sink()
+    lines = [json.loads(line) for line in path.read_text(encoding='utf-8').splitlines()]
+    assert [(line['level'], line['message']) for line in lines] == [('info', f"line {n}") for n in range(5)] + [
+        ('warning', "careful")]
+
+
+def test_log_pipeline_keeps_only_the_latest_status():
+    pipeline = fla.LogPipeline()
+    pipeline.set_status("Running"); pipeline.set_status("Paused")
+    assert pipeline.take_status() == "Paused" and pipeline.take_status() is None
+
+
+class FakeText:
+    """Just enough of tk.Text for AfkGuiApp._drain_log; every insert ends in a newline."""
+
+    def __init__(self):
+        self.lines = []
+
+    def config(self, **options): pass
+    def see(self, index): pass
+
+    def insert(self, index, *chunks):
+        for text in chunks[::2]: self.lines += text.splitlines() # Odd chunks are tag tuples
+
+    def index(self, index):
+        return f"{len(self.lines) + 1}.0" # 'end-1c' sits on the empty line after the last newline
+
+    def delete(self, start, end):
+        del self.lines[:int(end.split('.')[0]) - 1]
+
+
+def test_gui_log_is_trimmed_to_a_ring_of_lines(monkeypatch):
+    monkeypatch.setattr(fla, 'tk', types.SimpleNamespace(NORMAL='normal', DISABLED='disabled', END='end'))
+    shown = []
+    app = object.__new__(fla.AfkGuiApp) # Skips building the Tk widgets
+    app.worker_pool, app.log_pipeline, app.log_text = None, fla.LogPipeline(), FakeText()
+    app.status_label = types.SimpleNamespace(config=lambda text: shown.append(text))
+    app.master = types.SimpleNamespace(after=lambda ms, callback: None)
+    for n in range(fla.LOG_MAX_LINES + 20): app.log_pipeline.push(f"line {n}")
+    app.log_pipeline.set_status("Running")
+    app._drain_log()
+    app._drain_log() # Past LOG_DRAIN_BATCH the rest waits for the next tick
+    assert len(app.log_text.lines) == fla.LOG_MAX_LINES
+    assert app.log_text.lines[0].endswith(" line 20") and app.log_text.lines[-1].endswith(f" line {fla.LOG_MAX_LINES + 19}")
+    assert shown == ["Status: Running"]
+
+
+def test_headless_shutdown_flushes_the_log(tmp_path, backend):
+    backend.add_window("Target")
+    store = fla.ProfileStore(':memory:', legacy_ini=None)
+    store.save('p', {'target_window': "Target", 'min_delay': 1, 'max_delay': 1})
+    out = io.StringIO()
+    path = tmp_path / "log.jsonl"
+    daemon = fla.HeadlessDaemon('p', backend=backend, store=store, log_file=str(path), out=out,
+                                clock=backend.now, advance=backend.sleep)
+    assert daemon.run(max_cycles=2) == 2
+    logged = [json.loads(line)['message'] for line in path.read_text(encoding='utf-8').splitlines()]
+    assert logged[-1] == daemon.scheduler.summary() # Written after the loop stopped
+    assert any(line.endswith(logged[-1]) for line in out.getvalue().splitlines())
+    assert daemon.pipeline.drain() == [] and daemon.pipeline._sink is None
+
+# --- INSTRUMENTATION ---
+
+@pytest.mark.parametrize('draw', [lambda rng: rng.lognormvariate(-5, 1), lambda rng: rng.uniform(0.01, 0.5)])
+def test_histogram_quantiles_track_the_sorted_sample(draw):
+    rng = random.Random(0)
+    samples = [draw(rng) for _ in range(10000)]
+    histogram = fla.StreamingHistogram()
+    for seconds in samples: histogram.observe(seconds)
+    samples.sort()
+    for q in (0.5, 0.9, 0.95, 0.99):
+        exact = fla._percentile(samples, q * 100)
+        assert histogram.quantile(q) == pytest.approx(exact, rel=0.08)
+    assert histogram.quantile(1.0) == samples[-1] and histogram.count == len(samples)
+
+
+def test_histogram_quantile_stays_inside_the_sample_bucket():
+    histogram = fla.StreamingHistogram()
+    for seconds in (0.0012, 0.0013, 0.0031):
+        histogram.observe(seconds)
+    assert 0.0013 / 2 ** 0.5 <= histogram.quantile(0.5) <= 0.0013 * 2 ** 0.5 # Buckets are sqrt(2) apart
+    assert histogram.quantile(0.99) == 0.0031 # Capped at the largest sample
+    assert fla.StreamingHistogram().quantile(0.5) == 0.0
+
+
+def test_prometheus_export_format():
+    metrics = fla.CycleMetrics()
+    metrics.observe(metrics.phases, 'focus', 0.001)
+    metrics.observe(metrics.phases, 'focus', 0.003)
+    metrics.fail('revert', OSError())
+    text = metrics.to_prometheus()
+    lines = text.splitlines()
+    buckets = len(fla.HISTOGRAM_BOUNDS) + 1
+    assert text.endswith('\n') and len(lines) == 2 + buckets + 2 + 2 + 3
+    assert lines[:4] == [
+        '# HELP focus_lock_phase_seconds Time spent in each cycle phase.',
+        '# TYPE focus_lock_phase_seconds histogram',
+        'focus_lock_phase_seconds_bucket{phase="focus",le="1e-05"} 0',
+        'focus_lock_phase_seconds_bucket{phase="focus",le="1.41421e-05"} 0']
+    assert lines[16:20] == [
+        'focus_lock_phase_seconds_bucket{phase="focus",le="0.00128"} 1',
+        'focus_lock_phase_seconds_bucket{phase="focus",le="0.00181019"} 1',
+        'focus_lock_phase_seconds_bucket{phase="focus",le="0.00256"} 1',
+        'focus_lock_phase_seconds_bucket{phase="focus",le="0.00362039"} 2']
+    assert lines[1 + buckets:] == [
+        'focus_lock_phase_seconds_bucket{phase="focus",le="+Inf"} 2',
+        'focus_lock_phase_seconds_sum{phase="focus"} 0.004',
+        'focus_lock_phase_seconds_count{phase="focus"} 2',
+        '# HELP focus_lock_action_seconds Input send time per action type.',
+        '# TYPE focus_lock_action_seconds histogram',
+        '# HELP focus_lock_failures_total Cycle failures by phase and exception type.',
+        '# TYPE focus_lock_failures_total counter',
+        'focus_lock_failures_total{phase="revert",exception="OSError"} 1']
+
+
+def test_metrics_exporter_writes_on_its_interval(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    metrics = fla.CycleMetrics()
+    metrics.observe(metrics.phases, 'send', 0.002)
+    exporter = fla.MetricsExporter(metrics, interval=3600)
+    exporter.maybe_export()
+    assert os.listdir(tmp_path) == [] # Off by default
+    exporter.format = 'jsonl'
+    exporter.maybe_export(); exporter.maybe_export()
+    exporter.maybe_export(force=True)
+    lines = (tmp_path / fla.METRICS_FILE).read_text(encoding='utf-8').splitlines()
+    assert len(lines) == 2 and json.loads(lines[0])['phases']['send']['count'] == 1
+    exporter.format = 'prometheus'
+    exporter.maybe_export(force=True)
+    assert sorted(os.listdir(tmp_path)) == sorted([fla.METRICS_FILE, fla.METRICS_PROM_FILE]) # No .tmp left behind
+    assert (tmp_path / fla.METRICS_PROM_FILE).read_text(encoding='utf-8') == metrics.to_prometheus()
+
+# --- ACTION PLANS ---
+
+@pytest.mark.parametrize('profile, message', [
+    ({'min_delay': 5, 'max_delay': 1}, "Delays"),
+    ({'long_press_weight': 101}, "Long press priority"),
+    ({'lock_mode': 'nope'}, "lock mode"),
+    ({'tap_keys': 'e, notakey'}, "notakey"),
+    ({'idle_threshold': -1}, "negative"),
+    ({'min_delay': 'abc'}, "Invalid setting"),
+    ({'screen_conditions': 'wait_match 1,2,3'}, "Bad screen condition"),
+])
+def test_compile_plan_rejects_bad_profiles(backend, profile, message):
+    with pytest.raises(fla.PlanError, match=message):
+        make_plan(backend, **profile)
+
+
+def test_compile_plan_weights(backend):
+    plan = make_plan(backend, long_press_keys="w", tap_keys="e", long_press_weight=40,
+                     right_click_enabled=True, scroll_enabled=False)
+    assert plan.actions == ('long_press', 'tap_press', 'right_click')
+    assert plan.cum_weights == (40, 70, 100)
+
+
+# --- MACROS ---
+
+def test_macro_round_trip(tmp_path, backend):
+    path = str(tmp_path / "m.flm")
+    kinds = [fla.MACRO_KINDS.index(k) for k in ('move_to', 'key_down', 'key_up', 'left_down', 'left_up', 'key_down')]
+    fla.MacroTimeline.write(path, 200, 100, array('q', [0, 10**8, 2 * 10**8, 3 * 10**8, 4 * 10**8, 5 * 10**8]),
+                            array('h', [50, 0, 0, 0, 0, 1]), array('h', [25, 0, 0, 0, 0, 0]), array('B', kinds),
+                            ['w', 'space'])
+    timeline = fla.MacroTimeline(path)
+    assert timeline.keys == ('w', 'space') and timeline.duration == pytest.approx(0.5)
+    events = list(timeline.play(100, 100, 400, 200))
+    assert events[0] == fla.InputEvent('move_to', 200, 150, pytest.approx(0.1))
+    assert [e.kind for e in events] == ['move_to', 'key_down', 'key_up', 'left_down', 'left_up', 'key_down', 'key_up']
+    assert events[-1].a == 'space' # Still held at the end, so released
+    assert sum(e.delay for e in events) == pytest.approx(0.5)
+    assert make_plan(backend, macro_file=path, macro_weight=30).macro.keys == ('w', 'space')
+
+
+
+def test_rewriting_a_cached_macro_unmaps_it_first(tmp_path):
+    path = str(tmp_path / "m.flm")
+    columns = (array('q', [0]), array('h', [1]), array('h', [2]), array('B', [0]))
+    fla.MacroTimeline.write(path, 10, 10, *columns, [])
+    old = fla.open_macro(path)
+    fla.MacroTimeline.write(path, 20, 20, *columns, ['enter'])
+    assert old._map.closed and list(old.play(0, 0, 10, 10)) == [] # Windows cannot replace a mapped file
+    assert fla.open_macro(path).keys == ('enter',)
+    assert os.listdir(tmp_path) == ["m.flm"]
+
+
+def test_recording_names_keys_like_profiles_do():
+    layout = {vk: vk for vk in list(range(0x30, 0x3A)) + list(range(0x41, 0x5B))} # What MapVirtualKey gives
+    layout.update({0xBA: ord(';'), 0xDE: ord("'"), 0xC0: 0x8060}) # ` as a dead key; 0xBB types nothing here
+    names = fla._recorded_key_names(lambda vk: layout.get(vk, 0))
+    assert [names[vk] for vk in (0x0D, 0x09, 0x20, 0x1B, 0x2C, 0x5B)] == ['enter', 'tab', 'space', 'esc', 'printscreen',
+                                                                          'win']
+    assert [names[vk] for vk in (0xA0, 0xA1, 0xA3, 0xA4)] == ['shift', 'shift', 'ctrl', 'alt']
+    assert [names[vk] for vk in (0x41, 0x5A, 0x35, 0xBA, 0xDE, 0xC0)] == ['a', 'z', '5', ';', "'", '`']
+    assert 0xBB not in names and all(len(name) == 1 or name in fla.NAMED_KEY_CODES for name in names.values())
+
+
+def test_recorder_keeps_only_input_for_the_focused_target(backend):
+    home = backend.foreground_hwnd
+    target = backend.add_window("Target", left=100, top=50, width=400, height=300)
+    recorder = fla.MacroRecorder(backend, target._hWnd)
+    recorder.start()
+    backend.operator_input('key_down', 'w') # Still on the desktop: not recorded
+    backend.set_foreground_window(target._hWnd)
+    backend.sleep(1)
+    backend.operator_input('move_to', 150, 80); backend.operator_input('move_to', 150, 80)
+    backend.operator_input('key_down', 'w'); backend.sleep(0.1); backend.operator_input('key_down', 'w') # Auto-repeat
+    backend.operator_input('scroll', -120); backend.operator_input('left_down'); backend.operator_input('left_up')
+    backend.sleep(0.4)
+    backend.set_foreground_window(home) # Alt-tab away with W still down
+    backend.operator_input('key_up', 'w'); backend.operator_input('move_to', 5, 5)
+    backend.sleep(30)
+    backend.set_foreground_window(target._hWnd)
+    backend.sleep(0.5)
+    backend.operator_input('key_down', 'e')
+    assert recorder.stop() == 7 and backend.input_hooks == []
+    backend.operator_input('key_up', 'e') # After stop: not recorded
+    assert [fla.MACRO_KINDS[k] for k in recorder.kinds] == [
+        'move_to', 'key_down', 'scroll', 'left_down', 'left_up', 'key_up', 'key_down']
+    assert [t / 1e9 for t in recorder.times] == pytest.approx([0, 0, 0.1, 0.1, 0.1, 0.5, 1.0]) # 30 s away cut out
+    assert (recorder.xs[0], recorder.ys[0], recorder.xs[2]) == (50, 30, -120)
+    assert recorder.keys == ['w', 'e'] and list(recorder.xs[5:]) == [0, 1]
+    assert (recorder.width, recorder.height) == (400, 300)
+
+
+def test_macro_write_rejects_keys_that_break_the_key_table(tmp_path):
+    with pytest.raises(ValueError):
+        fla.MacroTimeline.write(str(tmp_path / "m.flm"), 10, 10, array('q'), array('h'), array('h'), array('B'), ['\n'])
+    assert not (tmp_path / "m.flm").exists()
+
+# --- SCREEN CONDITIONS ---
+
+def test_skip_unchanged_acts_only_when_the_region_changed(backend):
+    window = backend.add_window("Target", left=100, top=50)
+    plan = make_plan(backend, target_window="Target", screen_conditions="skip_unchanged 0,0,10,10 2")
+    conditions = fla.ScreenConditions(backend)
+    results = []
+    for fingerprint in (0x1234, 0x1235, 0xffff0000):
+        backend.screen[(100, 50, 10, 10)] = fingerprint
+        conditions.begin(plan.condition_budget)
+        results.append(conditions.check(plan, window, 'cycle'))
+    assert results[0] is None # Nothing to compare with yet
+    assert "unchanged" in results[1] and results[2] is None
+
+
+def test_act_if_match_compares_with_the_reference(backend):
+    window = backend.add_window("Target", left=100, top=50)
+    plan = make_plan(backend, target_window="Target", screen_conditions="long_press:act_if_match 5,5,20,10 0xff 2")
+    conditions = fla.ScreenConditions(backend)
+    backend.screen[(105, 55, 20, 10)] = 0xfe
+    conditions.begin(plan.condition_budget)
+    assert conditions.check(plan, window, 'cycle') is None and backend.grabs == 0 # Scoped to long presses only
+    assert conditions.check(plan, window, 'long_press') is None
+    backend.screen[(105, 55, 20, 10)] = 0xf0f0
+    conditions.begin(plan.condition_budget)
+    assert "does not match (distance 8" in conditions.check(plan, window, 'long_press')
+
+
+def test_wait_match_polls_until_the_picture_appears(backend):
+    window = backend.add_window("Target")
+    plan = make_plan(backend, target_window="Target", screen_conditions="wait_match 0,0,10,10 0xff", condition_budget=1)
+    conditions = fla.ScreenConditions(backend)
+    sleep = backend.sleep
+
+    def sleep_then_draw(seconds):
+        sleep(seconds)
+        if backend.now() >= 0.1: backend.screen[(0, 0, 10, 10)] = 0xff
+
+    backend.sleep = sleep_then_draw
+    conditions.begin(plan.condition_budget)
+    assert conditions.wait(plan, window)
+    assert backend.now() == pytest.approx(0.1) and conditions.grabs == 6
+    assert conditions.check(plan, window, 'cycle') is None and conditions.grabs == 6 # The last look is reused
+
+
+def test_wait_match_waits_outside_the_focus_lock(backend):
+    home = backend.foreground_hwnd
+    backend.add_window("Target")
+    plan = make_plan(backend, target_window="Target", screen_conditions="wait_match 0,0,10,10 0xff", condition_budget=1)
+
+    class WatchedLock:
+        held = False
+        def acquire(self): WatchedLock.held = True
+        def release(self): WatchedLock.held = False
+
+    runner = fla.CycleRunner(backend, log=lambda *a, **k: None, status=lambda s: None, rng=random.Random(0),
+                             focus_lock=WatchedLock())
+    grab, sleep, grabbed = backend.grab_fingerprint, backend.sleep, []
+    backend.grab_fingerprint = lambda *region: grabbed.append(WatchedLock.held) or grab(*region)
+
+    def sleep_then_draw(seconds):
+        sleep(seconds)
+        if backend.now() >= 0.1: backend.screen[(0, 0, 10, 10)] = 0xff
+
+    backend.sleep = sleep_then_draw
+    runner.run_episode([(plan, True, None)])
+    assert grabbed == [False] * 6 + [True] # Polled before queueing; one fresh look once the target is in front
+    assert runner.action_counts['jiggle_click'] == 1 and backend.foreground_hwnd == home
+
+
+def test_condition_grabs_stay_within_the_budget(backend):
+    window = backend.add_window("Target")
+    plan = make_plan(backend, target_window="Target", condition_budget=0.1, screen_conditions=(
+        "wait_match 0,0,10,10 0xff; long_press:skip_unchanged 0,0,10,10; tap_press:act_if_match 20,0,10,10 0xff"))
+    backend.grab_cost = 0.04
+    conditions = fla.ScreenConditions(backend)
+    conditions.begin(plan.condition_budget)
+    assert not conditions.wait(plan, window)
+    assert backend.now() <= plan.condition_budget + backend.grab_cost + fla.CONDITION_POLL_INTERVAL
+    assert "does not match (distance 8" in conditions.check(plan, window, 'cycle') # The last look before the budget ran out
+    assert conditions.check(plan, window, 'long_press') is None # Cached grab, nothing to compare with: act
+    assert "not checked within the 0.1 s budget" in conditions.check(plan, window, 'tap_press') # Past the budget a match fails
+    assert conditions.stats() == {'grabs': 2, 'cache_hits': 2, 'over_budget': 2}
+
+# --- WINDOWS ---
+
+def test_resolver_reuses_the_cached_handle_until_the_window_closes(backend):
+    game = backend.add_window("My Game - v1.2", pid=7)
+    resolver = fla.WindowResolver(backend)
+    assert resolver.resolve("my game") is game
+    assert resolver.resolve("my game") is game and backend.enumerations == 1
+    backend.close_window(game._hWnd)
+    again = backend.add_window("My Game - v1.2", pid=8)
+    assert resolver.resolve("my game") is again and backend.enumerations == 2
+    assert resolver.stats() == {'hits': 1, 'misses': 2, 'invalidations': 1}
+    backend.close_window(again._hWnd)
+    assert resolver.resolve("my game") is None and resolver.resolve("") is None
+
+
+def test_resolver_drops_a_handle_reused_by_another_process(backend):
+    game = backend.add_window("Game", pid=7)
+    resolver = fla.WindowResolver(backend)
+    resolver.resolve("Game")
+    game.pid = 9 # Handle recycled for a new window
+    resolver.resolve("Game")
+    assert resolver.invalidations == 1 and backend.enumerations == 2
+
+
+def test_title_lock_rescans_when_the_title_changes(backend):
+    game = backend.add_window("Game - Lobby")
+    resolver = fla.WindowResolver(backend)
+    resolver.resolve("Game", 'title')
+    game.title = "Loading..."
+    assert resolver.resolve("Game", 'title') is None and resolver.invalidations == 1
+
+
+@pytest.mark.parametrize('lock_mode', ['handle', 'process', 'class'])
+def test_identity_locks_follow_the_window_through_title_changes(backend, lock_mode):
+    game = backend.add_window("Game - Lobby", class_name="GameWnd", process_name="game.exe")
+    resolver = fla.WindowResolver(backend)
+    assert resolver.resolve("Game", lock_mode) is game
+    game.title = "Loading..."
+    assert resolver.resolve("Game", lock_mode) is game
+    assert resolver.stats() == {'hits': 1, 'misses': 1, 'invalidations': 0}
+
+
+@pytest.mark.parametrize('lock_mode, expected', [('handle', None), ('process', "Match found"), ('class', "Match found")])
+def test_identity_locks_after_the_window_closes(backend, lock_mode, expected):
+    game = backend.add_window("Game - Lobby", class_name="GameWnd", process_name="game.exe")
+    resolver = fla.WindowResolver(backend)
+    resolver.resolve("Game", lock_mode)
+    backend.close_window(game._hWnd)
+    backend.add_window("Match found", class_name="GameWnd", process_name="game.exe") # Reopened under a new title
+    found = resolver.resolve("Game", lock_mode)
+    assert (found.title if found else None) == expected # A dead handle cannot come back
+
+
+def test_explicit_targets_skip_the_title_search(backend):
+    backend.add_window("Notes", class_name="Notepad", process_name="notepad.exe")
+    editor = backend.add_window("Other", class_name="Editor", process_name="code.exe")
+    resolver = fla.WindowResolver(backend)
+    assert resolver.resolve(f"hwnd:{editor._hWnd:#x}") is editor
+    assert resolver.resolve("process: CODE.EXE") is editor
+    assert resolver.resolve("class:Editor") is editor
+    assert resolver.resolve("class:Missing") is None
+
+def test_concurrent_window_enumerations_do_not_share_process_names(monkeypatch):
+    class Error(Exception): pass
+    windows = [list(range(1, 8)), []] # The second scan finds every window already closed
+
+    def close_handle(handle):
+        if handle == 1 and windows:
+            backend.enumerate_windows() # Another thread's scan lands between caching a name and returning it
+
+    win32gui = types.SimpleNamespace(
+        error=Error, EnumWindows=lambda callback, _: [callback(hwnd, None) for hwnd in windows.pop(0)],
+        GetWindowText=str, GetClassName=lambda hwnd: "Class", IsWindowVisible=lambda hwnd: True)
+    win32api = types.SimpleNamespace(error=Error, OpenProcess=lambda *a: a[-1], CloseHandle=close_handle)
+    win32process = types.SimpleNamespace(GetModuleFileNameEx=lambda handle, _: os.path.join("apps", f"app{handle}.exe"),
+                                         GetWindowThreadProcessId=lambda hwnd: (hwnd, hwnd))
+    monkeypatch.setattr(fla, 'win32gui', win32gui)
+    monkeypatch.setattr(fla, 'win32api', win32api)
+    monkeypatch.setattr(fla, 'win32process', win32process)
+    backend = object.__new__(fla.Win32Backend) # Skips loading the real win32 modules
+    assert [info.process_name for info in backend.enumerate_windows()] == [f"app{pid}.exe" for pid in range(1, 8)]
+
+
+def test_window_index_applies_only_the_difference():
+    index = fla.WindowIndex()
+    info = lambda hwnd, title, visible=True: fla.WindowInfo(hwnd, title, "Cls", 1, "app.exe", visible)
+    assert index.apply([info(1, "Editor"), info(2, "Browser"), info(3, "Browser"), info(4, "Hidden", False)]) == (4, 0, 0)
+    assert index.titles == ["Browser", "Editor"]
+    assert index.apply([info(1, "Editor"), info(2, "Browser"), info(3, "Browser"), info(4, "Hidden", False)]) == (0, 0, 0)
+    assert index.apply([info(1, "Editor - main.py"), info(3, "Browser"), info(5, "Terminal")]) == (1, 2, 1)
+    assert index.titles == ["Browser", "Editor - main.py", "Terminal"] # The other Browser window keeps its title
+    assert sorted(index.by_hwnd) == [1, 3, 5]
+
+
+def test_window_index_search_modes():
+    index = fla.WindowIndex()
+    index.apply([fla.WindowInfo(1, "Notepad++ notes.txt", "Notepad++", 1, "notepad++.exe", True),
+                 fla.WindowInfo(2, "Minecraft 1.20", "GLFW30", 2, "javaw.exe", True),
+                 fla.WindowInfo(3, "Task Manager", "TaskManagerWindow", 3, "Taskmgr.exe", True)])
+    assert index.search("") == ["Minecraft 1.20", "Notepad++ notes.txt", "Task Manager"]
+    assert index.search("JAVAW") == ["Minecraft 1.20"] # Process names count too
+    assert index.search(r"^(task|mine)", 'regex') == ["Minecraft 1.20", "Task Manager"]
+    assert index.search("tskmgr", 'fuzzy') == ["Task Manager"]
+    assert index.search("nt", 'fuzzy') == ["Notepad++ notes.txt", "Minecraft 1.20"] # Closer together ranks first
+    with pytest.raises(fla.re.error):
+        index.search("(", 'regex')
+
+# --- FOCUS SETTLING ---
+
+def test_adaptive_settle_polls_until_the_window_is_in_front():
+    backend = fla.FakeBackend(track_real_time=False, focus_latency=0.03)
+    target = backend.add_window("Target")
+    settler = fla.FocusSettler(backend)
+    backend.set_foreground_window(target._hWnd)
+    elapsed = settler.wait_foreground(target._hWnd, 'focus')
+    assert 0.03 <= elapsed < 0.03 + 2 * fla.SETTLE_POLL_INTERVAL # Well short of the legacy 100 ms
+    assert list(settler.samples['focus']) == [elapsed] and settler.timeouts['focus'] == 0
+
+
+def test_adaptive_settle_waits_for_a_stable_rectangle(backend):
+    target = backend.add_window("Target", left=fla.MINIMIZED_COORD, top=fla.MINIMIZED_COORD)
+    backend.set_foreground_window(target._hWnd)
+    sleep = backend.sleep
+
+    def sleep_while_drawing(seconds):
+        sleep(seconds)
+        if backend.now() >= 0.01: target.left = target.top = 10 # Restored and drawn
+
+    backend.sleep = sleep_while_drawing
+    elapsed = fla.FocusSettler(backend).wait_foreground(target._hWnd, 'focus', check_rect=True)
+    assert elapsed == pytest.approx(0.01 + fla.SETTLE_POLL_INTERVAL) # One more poll to see the rectangle hold still
+
+
+def test_adaptive_settle_gives_up_at_the_deadline_and_tops_up_to_the_fixed_wait():
+    backend = fla.FakeBackend(track_real_time=False, focus_latency=0.08)
+    target = backend.add_window("Target")
+    settler = fla.FocusSettler(backend, deadline=0.05)
+    backend.set_foreground_window(target._hWnd)
+    assert settler.wait_foreground(target._hWnd, 'focus') == pytest.approx(fla.FOCUS_SETTLE_WAIT) # Landed in the top-up
+    assert settler.timeouts['focus'] == 1 and not settler.samples['focus']
+    other = backend.add_window("Never focused")
+    start = backend.now()
+    assert settler.wait_foreground(other._hWnd, 'revert', fixed_wait=0.0) is None
+    assert backend.now() - start == pytest.approx(0.05, abs=fla.SETTLE_POLL_INTERVAL)
+
+
+def test_settle_deadline_follows_recent_settle_times(backend):
+    settler = fla.FocusSettler(backend, deadline=0.25)
+    assert settler.deadline_for('focus') == 0.25 # Too few samples to learn from
+    settler.samples['focus'].extend([0.004] * 19 + [0.03])
+    assert settler.deadline_for('focus') == pytest.approx(0.09)
+    settler.samples['focus'].extend([0.001] * 200)
+    assert settler.deadline_for('focus') == fla.SETTLE_MIN_DEADLINE
+
+
+def test_fixed_settle_keeps_the_legacy_focus_sequence():
+    backend = fla.FakeBackend(track_real_time=False, focus_latency=0.01)
+    home = backend.add_window("Desktop")
+    backend.set_foreground_window(home._hWnd); backend.flush_pending_focus()
+    target = backend.add_window("Target", minimized=True)
+    plan = make_plan(backend, target_window="Target", settle_mode='fixed')
+    warnings = []
+    runner = fla.CycleRunner(backend, log=lambda msg, is_warning=False: is_warning and warnings.append(msg),
+                             status=lambda s: None, rng=random.Random(0))
+    start = backend.now()
+    set_foreground = backend.set_foreground_window
+    focused_at = []
+    backend.set_foreground_window = lambda hwnd: focused_at.append(backend.now() - start) or set_foreground(hwnd)
+    send = backend.send_batch
+    backend.send_batch = lambda batch: focused_at.append(backend.now() - start) or send(batch)
+    runner.run_episode([(plan, True, None)])
+    # restore, 100 ms, SetForegroundWindow, 100 ms, input; the revert is not waited on or confirmed
+    assert focused_at == [pytest.approx(0.1), pytest.approx(0.2), pytest.approx(0.2)]
+    assert warnings == []
+
+# --- PROFILES ---
+
+def test_profile_store_imports_legacy_ini_on_first_run(tmp_path):
+    ini = tmp_path / "legacy.ini"
+    config = configparser.ConfigParser()
+    config['game'] = {'target_window': 'Game', 'min_delay': '3.5', 'scroll_enabled': 'True'}
+    with open(ini, 'w') as f: config.write(f)
+    store = fla.ProfileStore(str(tmp_path / "p.db"), legacy_ini=str(ini))
+    assert store.imported == 1
+    assert store.load('game') == {'target_window': 'Game', 'min_delay': 3.5, 'scroll_enabled': True}
+    store.save('other', dict(fla.DEFAULT_PROFILE))
+    assert store.names() == ['game', 'other'] and 'other' in store
+    store.close()
+    again = fla.ProfileStore(str(tmp_path / "p.db"), legacy_ini=str(ini))
+    assert again.imported == 0 and again.load('game')['min_delay'] == 3.5
+    again.close()
+
+
+
+def test_profile_store_skips_bad_legacy_sections(tmp_path):
+    ini = tmp_path / "legacy.ini"
+    ini.write_text("[good]\nmin_delay = 2\n\n[bad]\nmin_delay = abc\n")
+    store = fla.ProfileStore(str(tmp_path / "p.db"), legacy_ini=str(ini))
+    assert store.imported == 1 and [name for name, _ in store.skipped] == ['bad']
+    assert store.names() == ['good']
+    store.close()
+
+
+def test_profile_store_retries_unreadable_legacy_ini(tmp_path):
+    ini = tmp_path / "legacy.ini"
+    ini.write_text("min_delay = 2\n") # No section header
+    store = fla.ProfileStore(str(tmp_path / "p.db"), legacy_ini=str(ini))
+    assert store.import_error and store.names() == []
+    store.close()
+    ini.write_text("[good]\nmin_delay = 2\n")
+    store = fla.ProfileStore(str(tmp_path / "p.db"), legacy_ini=str(ini))
+    assert store.imported == 1 and store.names() == ['good']
+    store.close()
+
+
+# --- HEADLESS MODE ---
+
+@pytest.fixture
+def store():
+    store = fla.ProfileStore(':memory:', legacy_ini=None)
+    store.save('p', {'target_window': "Target", 'min_delay': 10, 'max_delay': 10})
+    yield store
+    store.close()
+
+
+@pytest.fixture
+def daemon(backend, store):
+    backend.add_window("Target")
+    return fla.HeadlessDaemon('p', backend=backend, store=store, out=io.StringIO(), clock=backend.now,
+                              advance=backend.sleep)
+
+
+def test_pause_request_toggles_the_scheduler(daemon):
+    daemon._requests.append('pause'); daemon._apply_requests()
+    assert daemon.scheduler.paused
+    daemon._requests.append('pause'); daemon._apply_requests()
+    assert not daemon.scheduler.paused
+    daemon._flush_log()
+    assert [line.split('] ', 1)[1] for line in daemon.out.getvalue().splitlines()] == [
+        "PAUSED.", "RESUMED. Next action in: 0.00 seconds."]
+
+
+def test_saved_profile_is_reloaded_and_a_bad_one_is_refused(daemon, store):
+    store.save('p', {'target_window': "Target", 'min_delay': 1, 'max_delay': 2})
+    daemon._apply_requests() # No request needed: the store changed
+    assert daemon.slot.plan.min_delay == 1
+    store.save('p', {'target_window': "Target", 'min_delay': 5, 'max_delay': 1})
+    daemon._apply_requests()
+    assert daemon.slot.plan.max_delay == 2 # The running plan is kept
+    daemon._requests.append('reload'); daemon._apply_requests()
+    daemon._flush_log()
+    messages = [line.split('] ', 1)[1] for line in daemon.out.getvalue().splitlines()]
+    assert messages[0] == "Profile 'p' reloaded." and messages[1].startswith("WARNING: Profile not reloaded: Delays")
+    assert messages[2].startswith("WARNING: Profile not reloaded") # A forced reload still validates
+
+
+def test_stop_request_ends_the_loop(daemon):
+    daemon._requests.append('stop'); daemon._apply_requests()
+    assert daemon.run() == 0 and not daemon.scheduler.running
+
+
+@pytest.mark.skipif(not hasattr(signal, 'SIGUSR1'), reason="POSIX signals")
+def test_signals_queue_requests_until_the_loop_applies_them(daemon):
+    previous = signal.getsignal(signal.SIGHUP)
+    daemon._install_signals()
+    try:
+        os.kill(os.getpid(), signal.SIGUSR1)
+        os.kill(os.getpid(), signal.SIGHUP)
+        assert daemon._requests == ['pause', 'reload'] and not daemon.scheduler.paused
+    finally:
+        daemon._restore_signals()
+    assert signal.getsignal(signal.SIGHUP) is previous
+
+
+@pytest.mark.skipif(not hasattr(signal, 'SIGUSR1'), reason="os.kill(SIGTERM) terminates outright on Windows")
+def test_sigterm_stops_a_running_daemon(backend, store):
+    backend.add_window("Target")
+    store.save('p', {'target_window': "Target", 'min_delay': 0.05, 'max_delay': 0.05})
+    daemon = fla.HeadlessDaemon('p', backend=backend, store=store, out=io.StringIO()) # Real clock
+    timer = threading.Timer(0.3, os.kill, (os.getpid(), signal.SIGTERM))
+    timer.start()
+    try:
+        episodes = daemon.run()
+    finally:
+        timer.cancel()
+    assert episodes >= 2 and "Stop requested." in daemon.out.getvalue()
+
+
+def test_startup_probe_reaches_a_first_action(capsys):
+    fla.startup_probe()
+    probe = json.loads(capsys.readouterr().out.splitlines()[-1])
+    expected = 'fake' if probe['win32_import_ms'] is None else 'win32'
+    assert probe['backend'] == expected and probe['first_action_ms'] >= probe['import_ms'] > 0
+
+# --- WORKER PROCESSES ---
+
+def _shared_lock(lock):
+    """FairFocusLock's shared parts; the script is not importable by name, so children rebuild the lock."""
+    return lock._cond, lock._counters, lock._owners
+
+
+def _attach_lock(parts):
+    lock = object.__new__(fla.FairFocusLock)
+    lock._cond, lock._counters, lock._owners = parts
+    return lock
+
+
+def _hold_focus(parts, ready):
+    _attach_lock(parts).acquire()
+    ready.set()
+    time.sleep(60)
+
+
+def _queue_for_focus(parts, queued):
+    queued.set()
+    _attach_lock(parts).acquire()
+
+
+def _wait_queued(lock, tickets):
+    deadline = time.monotonic() + 10
+    while lock._counters[0] < tickets:
+        assert time.monotonic() < deadline
+        time.sleep(0.005)
+
+
+def test_fair_focus_lock_serves_tickets_in_order():
+    lock = fla.FairFocusLock(multiprocessing.get_context('spawn'), 4)
+    order, threads = [], []
+    lock.acquire()
+    for index in range(3):
+        def worker(index=index):
+            with lock: order.append(index)
+        threads.append(threading.Thread(target=worker))
+        threads[-1].start()
+        _wait_queued(lock, index + 2) # Each thread has its ticket before the next one asks
+    lock.release()
+    for thread in threads: thread.join(5)
+    assert order == [0, 1, 2] and lock.holder() == 0
+
+
+def test_release_dead_frees_focus_held_or_queued_by_a_killed_worker():
+    ctx = multiprocessing.get_context('spawn')
+    lock = fla.FairFocusLock(ctx, 3)
+    ready, queued = ctx.Event(), ctx.Event()
+    holder = ctx.Process(target=_hold_focus, args=(_shared_lock(lock), ready), daemon=True)
+    holder.start()
+    assert ready.wait(30) and lock.holder() == holder.pid
+    waiter = ctx.Process(target=_queue_for_focus, args=(_shared_lock(lock), queued), daemon=True)
+    waiter.start()
+    assert queued.wait(30)
+    _wait_queued(lock, 2)
+    for process in (holder, waiter):
+        process.kill()
+        process.join(5)
+    assert lock.release_dead(waiter.pid) is False # Only queued: its ticket is skipped later
+    assert lock.release_dead(holder.pid) is True
+    assert lock.holder() == 0
+    acquired = threading.Event()
+    threading.Thread(target=lambda: lock.acquire() or acquired.set(), daemon=True).start()
+    assert acquired.wait(5) and lock.holder() == os.getpid()
+    lock.release()
+
+
+def test_cycle_progress_is_visible_while_the_cycle_runs(backend):
+    backend.add_window("Target", left=100, top=100)
+    runner = fla.CycleRunner(backend, log=lambda *a, **k: None, status=lambda s: None, rng=random.Random(0))
+    seen = []
+    focus = backend.set_foreground_window
+    backend.set_foreground_window = lambda hwnd: seen.append(runner.cycle_started) or focus(hwnd)
+    runner.run_episode([(make_plan(backend, target_window="Target"), True, None)])
+    assert seen and all(started > 0 for started in seen) and runner.cycle_started == 0.0
+
+
+def test_worker_health_flags_a_hung_cycle():
+    pool = fla.WorkerPool([('hung', True), ('idle', True)])
+    now = time.time()
+    row = dict.fromkeys(fla.WORKER_STAT_FIELDS, 0.0)
+    row.update(pid=1, state=fla.WORKER_STATES.index('running'), heartbeat=now, cycle_started=now - 100, cycle_limit=30)
+    fla._publish_worker_row(pool.stats, 0, [row[field] for field in fla.WORKER_STAT_FIELDS])
+    row.update(pid=2, cycle_started=0.0)
+    fla._publish_worker_row(pool.stats, 1, [row[field] for field in fla.WORKER_STAT_FIELDS])
+    rows = pool.snapshot()
+    assert [r['state'] for r in rows] == ['stuck', 'running']
+    assert fla.format_worker_health(rows, now)[0].startswith("hung: stuck for 100 s")
+
+# --- SIMULATION ---
+
+@pytest.mark.parametrize('operator_active', [0.0, 0.3])
+def test_simulation_is_reproducible_per_seed(operator_active):
+    profile = {'min_delay': 5, 'max_delay': 30, 'idle_threshold': 5, 'scroll_enabled': True}
+    first = fla.simulate_profile(profile, hours=1, seed=7, operator_active=operator_active)
+    again = fla.simulate_profile(profile, hours=1, seed=7, operator_active=operator_active)
+    other = fla.simulate_profile(profile, hours=1, seed=8, operator_active=operator_active)
+    assert first == again and first['cycles'] > 100
+    assert other['fingerprint'] != first['fingerprint']